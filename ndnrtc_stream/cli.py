@@ -2,23 +2,58 @@
 ndnrtc-stream
 
 Usage:
-  ndnrtc-stream publish [<prefix> -i <identity> -s <video_size> -b <bitrate> -c <config_file> --instance_name <instance> --stream_name <stream_name> --thread_name <thread_name> -v <verbose>]
-  ndnrtc-stream fetch <stream_prefix> [-t <trust_schema> -s <video_size> -c <config_file> -a <cert_file> --instance_name <instance> --stream_name <stream_name> --thread_name <thread_name> -v <verbose>]
+  ndnrtc-stream publish [<prefix> -i <identity> -s <video_size> -b <bitrate> -c <config_file> --instance_name <instance> --stream_name <stream_name> --thread_name <thread_name> --threads <ladder> --adapt <ladder> --capture <backend> --device <device> --pixel_format <format> --key_type <type> --metrics_port <port> --metrics_socket <path> --stats_dir <dir> --latency --run_root <dir> --history_dir <dir> --keep_runs <n> --keep_size <mb> --keep_days <days> --profile_startup -v <verbose>]
+  ndnrtc-stream publish --stress <ladder> [<prefix> -i <identity> --step_time <sec> --key_type <types> --capture <backend> --device <device> --pixel_format <format> -o <report_file> --stub --run_root <dir> --history_dir <dir> --keep_runs <n> --keep_size <mb> --keep_days <days> --profile_startup -v <verbose>]
+  ndnrtc-stream fetch (<stream_prefix>... | -f <prefix_file>) [-t <trust_schema> -s <video_size> -c <config_file> -a <cert_file> --instance_name <instance> --stream_name <stream_name> --thread_name <thread_name> --pixel_format <format> --key_type <type> --metrics_port <port> --metrics_socket <path> --stats_dir <dir> --latency --frame_info --headless --record <dir> --record_codec <codec> --segment_size <mb> --segment_time <sec> --run_root <dir> --history_dir <dir> --keep_runs <n> --keep_size <mb> --keep_days <days> --profile_startup -v <verbose>]
+  ndnrtc-stream bench [<prefix> -s <video_size> -d <duration> --pixel_format <format> --key_type <types> -o <report_file> --stats_dir <dir> --latency --frame_info --stub --run_root <dir> --history_dir <dir> --keep_runs <n> --keep_size <mb> --keep_days <days> --profile_startup -v <verbose>]
+  ndnrtc-stream load [<stream_prefix>] [-n <consumers> --stagger <sec> -d <duration> -s <video_size> -t <trust_schema> -a <cert_file> --thread_name <thread_name> --pixel_format <format> --key_type <type> -o <report_file> --stub --run_root <dir> --history_dir <dir> --keep_runs <n> --keep_size <mb> --keep_days <days> --profile_startup -v <verbose>]
+  ndnrtc-stream stats <stats_file>... [-o <report_file> --events <types> --profile_startup -v <verbose>]
   ndnrtc-stream -h | --help
   ndnrtc-stream --version
 
 Options:
   -h --help                         Show this screen.
   --version                         Show version.
+  --adapt=<ladder>                  Step encoder settings along this ladder (<width>x<height>@<kbps>,...) when the publisher drops frames.
   -a, --cert_file                   Certificate which will be used as a trust anchor for data verification.
   -b,--bitrate=<bitrate>            Video stream target encoding bitrate in Kbps.
   -c,--config_file=<config_file>    ndnrtc-client config file.
+  --capture=<backend>               Capture backend: avfoundation (macOS default), v4l2 (Linux default), file or lavfi.
+  --device=<device>                 Capture device: camera index/path, video file (file) or source/filter graph (lavfi).
+  -d,--duration=<duration>          Benchmark duration in seconds (30 by default; for load - after all consumers started, 60 by default).
+  --events=<types>                  List events of these types (comma-separated: timeout, nack, rebuffer, state, keySkip; or all) with their log lines.
+  -f,--prefix_file=<prefix_file>    File with stream prefixes to fetch, one per line.
   -i,--identity=<ndn_identity>      NDN identity used to sign data (default identitiy is used if ommited).
+  -n,--consumers=<consumers>        Number of concurrent consumers for load (10 by default).
+  -o,--report=<report_file>         Save JSON report to a file (printed to stdout if ommited).
   -s,--video_size=<video_size>      Video stream resolution in the form <width>x<height>.
   -t,--trust_schema=<trust_schema>  Trust schema verification policy.
+  --key_type=<type>                 Signing key type: rsa (default) or ecdsa; bench and --stress take a comma-separated list to compare.
+  --keep_days=<days>                Remove finished runs older than this (7 by default).
+  --keep_runs=<n>                   Number of finished runs to keep (20 by default).
+  --keep_size=<mb>                  Total size of finished runs to keep, MB (1024 by default).
+  --latency                         Watermark published frames and measure glass-to-glass latency of fetched ones (same clock).
+  --frame_info                      Have ndnrtc-client write frame info into sinks, so gaps in playback numbers are detected.
+  --headless                        Fetch without viewers; frames are consumed and only their timing is tracked.
+  --record=<dir>                    Record fetched frames into segment files (with a seek index) in this directory, without viewers.
+  --record_codec=<codec>            Re-encode recorded frames with this ffmpeg codec (e.g. libx264) instead of keeping them raw.
+  --run_root=<dir>                  Directory run directories (FIFOs, logs, stats) are created in, e.g. /dev/shm (system temp directory by default).
+  --segment_size=<mb>               Start a new raw recording segment after this many MB (1024 by default).
+  --segment_time=<sec>              Start a new recording segment after this many seconds (60 by default).
+  --pixel_format=<format>           Raw frame pixel format: 0rgb (default), i420 or nv12.
+  --profile_startup                 Print time spent on imports and setup steps before the command gets going (to stderr).
+  --metrics_port=<port>             Serve statistics for Prometheus/OpenMetrics scrapes on this TCP port.
+  --metrics_socket=<path>           Serve statistics for Prometheus/OpenMetrics scrapes on this Unix socket.
+  --history_dir=<dir>               Directory finished runs are moved to, compressed (the run root by default).
   --instance_name=<instance>        Customized instance name (see NDN-RTC namespace >= v3)
   --stream_name=<stream_name>       Customized stream name (see NDN-RTC namespace >= v3)
+  --stagger=<sec>                   Seconds between consumer starts for load (1 by default).
+  --stats_dir=<dir>                 Record parsed statistics into binary files in this directory.
+  --step_time=<sec>                 Seconds every --stress step is held (20 by default).
+  --stress=<ladder>                 Find publisher throughput ceiling: step encoder settings through this ladder (<width>x<height>@<kbps>[/<fps>],...).
+  --stub                            Use stub ndnrtc-client, nfd-status and ndnsec (no NFD or camera required).
   --thread_name=<thread_name>       Customized thread name (see NDN-RTC namespace >= v3)
+  --threads=<ladder>                Simulcast encoder threads in the form <name>:<width>x<height>@<kbps>,...
   -v,--verbose                      Verbose output.
 
 Examples:
@@ -26,7 +61,32 @@ Examples:
   ndnrtc-stream publish /ndn/edu/ucla/cs/alex
   ndnrtc-stream publish /ndn/edu/ucla/cs/alex -i /ndn/edu/csu/alex
   ndnrtc-stream fetch /ndn/edu/ucla/cs/alex
+  ndnrtc-stream fetch /ndn/edu/ucla/cs/alex /ndn/edu/ucla/cs/bob
+  ndnrtc-stream fetch -f prefixes.txt
   ndnrtc-stream publish /hello-ndn --stream-name custom
+  ndnrtc-stream publish /hello-ndn --threads hi:1280x720@2000,mid:640x360@800,lo:320x180@250
+  ndnrtc-stream fetch /hello-ndn --thread_name lo
+  ndnrtc-stream publish /hello-ndn -s 640x480 -b 1500
+  ndnrtc-stream publish /hello-ndn --capture v4l2 --device /dev/video1 --pixel_format i420
+  ndnrtc-stream publish /hello-ndn --capture file --device clip.mp4
+  ndnrtc-stream fetch /hello-ndn --pixel_format i420
+  ndnrtc-stream fetch /hello-ndn --record archive --record_codec libx264 --segment_time 300
+  ndnrtc-stream publish /hello-ndn --adapt 1280x720@2500,960x540@1200,640x360@600
+  ndnrtc-stream publish --stress 1280x720@1000/30,1280x720@2500/30,1280x720@5000/30,1920x1080@4000/30 -o stress.json
+  ndnrtc-stream publish --stress 1280x720@2000,1280x720@4000 --capture file --device clip.mp4 --step_time 60
+  ndnrtc-stream publish /hello-ndn-ecdsa --key_type ecdsa
+  ndnrtc-stream bench --key_type rsa,ecdsa -o keys.json
+  ndnrtc-stream publish /hello-ndn --run_root /dev/shm --history_dir ~/.ndnrtc-stream/runs --keep_size 512
+  ndnrtc-stream fetch /hello-ndn --metrics_port 9464
+  ndnrtc-stream bench -d 60 -o report.json
+  ndnrtc-stream bench --stub -d 10
+  ndnrtc-stream load /hello-ndn -n 50 --stagger 2 -o load.json
+  ndnrtc-stream publish /hello-ndn --stats_dir stats
+  ndnrtc-stream stats stats/
+  ndnrtc-stream stats stats/ --events rebuffer,state
+  ndnrtc-stream publish /hello-ndn --latency
+  ndnrtc-stream fetch /hello-ndn --latency
+  ndnrtc-stream fetch /hello-ndn --headless --frame_info --stats_dir stats
   ndnrtc-stream fetch /hello-ndn --stream-name custom
 
 Help:
@@ -34,24 +94,31 @@ Help:
   https://github.com/remap/ndnrtc-stream
 """
 
-from inspect import getmembers, isclass
+from .startup import startupProfile
 from docopt import docopt
 from . import __version__ as VERSION
 import logging
 
+startupProfile.mark('import docopt')
+
 rootLogger = logging.getLogger()
 rootLogger.handlers = []
 
 def main():
     """Main CLI entrypoint."""
-    import ndnrtc_stream.commands
     options = docopt(__doc__, version=VERSION)
+    startupProfile.enabled = options['--profile_startup']
+    startupProfile.mark('parse options')
 
-    for (k, v) in options.items(): 
-        if hasattr(ndnrtc_stream.commands, k) and v:
-            module = getattr(ndnrtc_stream.commands, k)
-            commands = getmembers(module, isclass)
-            command = [(name,cls) for (name,cls) in commands if name.lower() == k][0][1]
-            ndnrtc_stream.commands = commands
-            command = command(options)
-            command.run()
+    from ndnrtc_stream import commands
+    name = [k for k in commands.registry if options[k]][0]
+    command = commands.loadCommand(name)
+    startupProfile.mark('import %s'%name)
+    command = command(options)
+    startupProfile.mark('setup %s'%name)
+    if not command.reportsStartup:
+        startupProfile.report()
+    try:
+        command.run()
+    finally:
+        command.finishRunDir()
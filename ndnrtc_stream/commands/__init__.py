@@ -1,3 +1,17 @@
-from .publish import *
-from .fetch import *
-import logging
\ No newline at end of file
+""" Command registry: a command module is imported only when its command runs. """
+
+import importlib
+
+# command (docopt key) -> (module, class)
+registry = {
+    'publish': ('publish', 'Publish'),
+    'fetch': ('fetch', 'Fetch'),
+    'bench': ('bench', 'Bench'),
+    'load': ('load', 'Load'),
+    'stats': ('stats', 'Stats')
+}
+
+def loadCommand(name):
+    """ Imports module of a command and returns its class. """
+    module, cls = registry[name]
+    return getattr(importlib.import_module('.' + module, __name__), cls)
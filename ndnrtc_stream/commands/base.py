@@ -1,17 +1,43 @@
 """The base command."""
 
-from utils import *
+from .utils import *
+from .utils.rundir import runDirs
 from json import dumps
-import logging, os, signal, sys, time, tempfile
+from ndnrtc_stream.startup import startupProfile
+import logging, os, signal, sys, threading, time
 
 logger = logging.getLogger(__name__)
 
+supervisorCheckInterval = 0.5
+restartBackoff = 1.
+restartBackoffMax = 30.
+# a child running this long is considered recovered, backoff is reset
+restartStableTime = 60.
+# restart ndnrtc-client if no stat line was written for this long
+healthTimeout = 15.
+
 class Base(object):
     """A base command."""
 
+    # offline commands don't talk to NFD
+    requiresNfd = True
+    # commands without children get no run directory, output drainer or SIGINT handler
+    runsChildren = True
+    # commands that finish their startup in run() print the startup profile themselves
+    reportsStartup = False
+
     def __init__(self, options, *args, **kwargs):
         global logger
-        checkNfdIsRunning()
+        # sub-commands (e.g. bench's publisher and fetcher) share stubs set up by their parent
+        stub = options.get('--stub') and not utils.stubDir
+        if stub:
+            from ndnrtc_stream.stub import stubCommand
+            utils.ndnrtcClientCmd = stubCommand('ndnrtc-client')
+            utils.nfdStatusCmd = stubCommand('nfd-status')
+            utils.ndnsecCmd = stubCommand('ndnsec')
+        if self.requiresNfd:
+            checkNfdIsRunning()
+            startupProfile.mark('check nfd')
         self.options = options
         self.args = args
         self.kwargs = kwargs
@@ -25,19 +51,126 @@ class Base(object):
         logger.handlers = [ch]
 
         logger.debug('cli options: %s'%dumps(self.options, indent=2, sort_keys=True))
-        # temp run directory
-        self.runDir = tempfile.mkdtemp(prefix='ndnrtc-stream.')
-        logger.debug("temporary runtime directory %s"%self.runDir)
+        self.runDir = None
+        self.drainer = None
+        if self.runsChildren:
+            # run directory (sub-commands get one nested into their parent's)
+            if not runDirs.created:
+                runDirs.configureFromOptions(self.options, self.__class__.__name__.lower())
+            self.runDir = runDirs.create()
+            logger.debug("temporary runtime directory %s"%self.runDir)
+            if stub:
+                # keep stub identities out of the real ndnsec cache
+                utils.ndnsecCache = NdnsecCache(os.path.join(self.runDir, 'ndnsec.json'))
+                utils.stubDir = os.path.join(self.runDir, 'stub')
+                os.environ['NDNRTC_STUB_DIR'] = utils.stubDir
+            # single thread draining output of all child processes
+            self.drainer = OutputDrainer()
+        # optional Prometheus/OpenMetrics exporter, started by commands that have stats
+        self.metrics = None
+        self.supervisor = None
+        # stores of auxiliary stats (see exportStats)
+        self.exportedStores = []
+        self.logWatch = None
 
-        signal.signal(signal.SIGINT, self.signal_handler)
+        if self.runsChildren:
+            signal.signal(signal.SIGINT, self.signal_handler)
 
     def run(self):
         raise NotImplementedError('You must implement the run() method yourself!')
 
     def signal_handler(self, sig, frame):
         logger.warn('caught stop signal...')
+        if self.supervisor:
+            self.supervisor.stop()
         self.stopChildren()
 
+    def startSupervisor(self):
+        """ Starts children registered with `self.supervisor`, which also becomes
+        the owner of `self.childrenProcs`. """
+        self.childrenProcs = self.supervisor.procs
+        self.supervisor.start()
+
+    def supervise(self):
+        """ Blocks until stopped or a child fails for good, then reports restarts. """
+        self.supervisor.run()
+        for (name, stats) in self.supervisor.report().items():
+            if stats['restarts']:
+                logger.info('%s was restarted %d times (exit codes %s)'%(name, stats['restarts'], stats['exit_codes']))
+            if stats['reconfigs']:
+                logger.info('%s was restarted %d times to apply new settings'%(name, stats['reconfigs']))
+
+    def createStatRecorder(self, statistics, labels):
+        """ Returns StatRecorder for a stat stream if --stats_dir is given, None otherwise. """
+        statsDir = self.options.get('--stats_dir')
+        if not statsDir:
+            return None
+        from .utils.statrecord import StatRecorder, statRecordName
+        if not os.path.isdir(statsDir):
+            os.makedirs(statsDir)
+        fileName = os.path.join(statsDir, statRecordName(labels['role'], labels['prefix'], labels['stream']))
+        logger.info('recording stats into %s'%fileName)
+        return StatRecorder(fileName, statistics, labels)
+
+    def exportStats(self, store, labels, captions):
+        """ Records a StatStore into --stats_dir and serves it with metrics, if enabled. """
+        store.recorder = self.createStatRecorder(store.statistics, labels)
+        if self.metrics:
+            self.metrics.addStore(store, labels, captions)
+        self.exportedStores.append(store)
+
+    def closeExportedStats(self):
+        for store in self.exportedStores:
+            if store.recorder:
+                store.recorder.close()
+                store.recorder = None
+
+    def startLogWatch(self, labels):
+        """ Parses events out of ndnrtc-client log into `self.logWatch` (see ClientLogWatch).
+        The event index is written into --stats_dir, if given, or the run directory.
+        A log in the run directory is read from the start, so events logged before
+        the watch starts are kept; a log set up by --config_file may hold earlier runs. """
+        from .utils.logevents import ClientLogWatch, logEventCaptions, logEventsName, logEventsSuffix
+        general = self.config['general']
+        logFile = os.path.join(general.get('log_path') or '.', general.get('log_file') or 'client.log')
+        statsDir = self.options.get('--stats_dir')
+        if statsDir:
+            if not os.path.isdir(statsDir):
+                os.makedirs(statsDir)
+            indexFile = os.path.join(statsDir, logEventsName(labels['role'], labels['prefix'], labels['stream'],
+                                                            os.path.basename(self.runDir)))
+        else:
+            indexFile = os.path.join(self.runDir, 'client' + logEventsSuffix)
+        inRunDir = os.path.dirname(os.path.abspath(logFile)) == os.path.abspath(self.runDir)
+        self.logWatch = ClientLogWatch(logFile, indexFile, labels, fromStart=inRunDir)
+        self.logWatch.start()
+        self.exportStats(self.logWatch.store.statStore, dict(labels, role='log',
+                         stream='%s-%s'%(labels['stream'], labels['role'])), logEventCaptions)
+
+    def stopLogWatch(self):
+        if self.logWatch:
+            self.logWatch.stop()
+            from .utils.logevents import logEventTypes
+            counts = self.logWatch.store.summary()
+            logger.info('%s: %s'%(self.logWatch.logFile, ', '.join('%d %s'%(counts[t], t) for t in logEventTypes)))
+            logger.debug('event index saved to %s'%self.logWatch.indexFile)
+            self.logWatch = None
+
+    def finishRunDir(self):
+        """ Cleans up hot files of the run and hands it over to the janitor (see RunDirs). """
+        finished = runDirs.finish()
+        if finished and finished[0]:
+            logger.info('run directory %s: %.1f MB in %d files'%(finished[0], finished[1]/1024./1024., finished[2]))
+
+    def startMetrics(self):
+        if self.options.get('--metrics_port') or self.options.get('--metrics_socket'):
+            from .utils.metrics import startMetricsExporter
+            self.metrics = startMetricsExporter(self.options)
+
+    def stopMetrics(self):
+        if self.metrics:
+            self.metrics.stop()
+
     def stopChildren(self):
         logger.debug("stopping child processes...")
         try:
@@ -50,4 +183,174 @@ class Base(object):
     def kill(self, proc):
         # os.kill(proc.pid, signal.SIGTERM)
         if proc.poll() == None:
-            proc.terminate()
\ No newline at end of file
+            proc.terminate()
+
+    def reapChildren(self, timeout=2.):
+        """ Terminates child processes and waits for them to exit, killing the ones
+        still running after `timeout` seconds; return codes are final afterwards. """
+        for p in self.childrenProcs:
+            self.kill(p)
+        deadline = time.time() + timeout
+        for p in self.childrenProcs:
+            while p.poll() is None and time.time() < deadline:
+                time.sleep(0.05)
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        self.childrenProcs = []
+
+class Supervisor(object):
+    """ Watches child processes and restarts the ones that exit or become unhealthy.
+
+    Children are started in the order they were added. A child that exits
+    cleanly (exit code 0) ends supervision, as does any exit of a child added
+    with `restart=False` (e.g. a viewer window closed by the user). A child
+    that fails is restarted after a backoff delay which doubles with every
+    restart (up to `restartBackoffMax`) and is reset once the child stays up
+    for `restartStableTime`. If `activity` is given, it must return the time of
+    the last sign of life of the child (e.g. last stat line); the child is
+    restarted if there was none for `healthTimeout` seconds.
+    Output of every instance is drained into <logDir>/<name>.out|.err
+    (<name>-restart<N>.out|.err for later instances).
+    """
+
+    def __init__(self, drainer, logDir, checkInterval=None):
+        self.drainer = drainer
+        self.logDir = logDir
+        self.checkInterval = checkInterval if checkInterval else supervisorCheckInterval
+        self.children = []
+        # current process of every child, in the order children were added
+        self.procs = []
+        self.running = False
+        self.wakeup = threading.Event()
+        # names of children to restart on request
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def add(self, name, start, onStart=None, activity=None, restart=True,
+            stdout=True, stderr=True, echo=None):
+        """ Registers a child: `start()` returns a new Popen object, `onStart(proc)` is
+        called after every (re)start. A child with `restart=False` ends supervision
+        when it exits, whatever its exit code. `stdout`/`stderr` select which pipes to drain; stdout is also
+        copied to `echo`, if given.
+        """
+        self.children.append({'name': name, 'start': start, 'onStart': onStart, 'activity': activity,
+                              'restart': restart, 'stdout': stdout, 'stderr': stderr, 'echo': echo,
+                              'proc': None, 'startTime': None, 'nextRestart': None,
+                              'backoff': restartBackoff, 'restarts': 0, 'reconfigs': 0, 'instances': 0,
+                              'exitCodes': []})
+        self.procs.append(None)
+
+    def start(self):
+        self.running = True
+        for child in self.children:
+            self.spawn(child)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def restart(self, name):
+        """ Restarts a child right away (e.g. to apply a new config), without backoff;
+        this is not counted as a failure. """
+        with self.lock:
+            self.pending.add(name)
+        self.wakeup.set()
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self.checkInterval)
+            self.wakeup.clear()
+            if not self.running:
+                break
+            with self.lock:
+                pending, self.pending = self.pending, set()
+            for child in self.children:
+                if child['name'] in pending:
+                    self.reconfigure(child)
+            now = time.time()
+            for child in self.children:
+                self.check(child, now)
+
+    def report(self):
+        return dict((c['name'], {'restarts': c['restarts'], 'reconfigs': c['reconfigs'],
+                                 'exit_codes': list(c['exitCodes'])})
+                    for c in self.children)
+
+    def spawn(self, child):
+        proc = child['start']()
+        child['proc'] = proc
+        child['startTime'] = time.time()
+        self.procs[self.children.index(child)] = proc
+        suffix = '-restart%d'%child['instances'] if child['instances'] else ''
+        child['instances'] += 1
+        if child['stdout'] and proc.stdout:
+            self.drainer.add(proc.stdout, os.path.join(self.logDir, '%s%s.out'%(child['name'], suffix)),
+                             echo=child['echo'])
+        if child['stderr'] and proc.stderr:
+            self.drainer.add(proc.stderr, os.path.join(self.logDir, '%s%s.err'%(child['name'], suffix)))
+        if child['onStart']:
+            child['onStart'](proc)
+        logger.debug('started %s (pid %d)'%(child['name'], proc.pid))
+
+    def check(self, child, now):
+        if child['nextRestart'] is not None:
+            if now >= child['nextRestart']:
+                child['nextRestart'] = None
+                try:
+                    self.spawn(child)
+                except Exception as e:
+                    logger.error('failed to restart %s: %s'%(child['name'], e))
+                    self.scheduleRestart(child, now)
+            return
+        proc = child['proc']
+        exitCode = proc.poll()
+        if exitCode is None:
+            if child['activity']:
+                lastActivity = max(child['activity']() or 0, child['startTime'])
+                if now - lastActivity > healthTimeout:
+                    logger.warn('%s is not responding for %.0f sec'%(child['name'], now - lastActivity))
+                    self.terminate(proc)
+                    exitCode = 'unresponsive'
+            if exitCode is None:
+                if now - child['startTime'] > restartStableTime:
+                    child['backoff'] = restartBackoff
+                return
+        child['exitCodes'].append(exitCode)
+        if exitCode == 0:
+            logger.info('%s exited'%child['name'])
+            self.stop()
+            return
+        if not child['restart']:
+            logger.error('%s exited (%s)'%(child['name'], exitCode))
+            self.stop()
+            return
+        self.scheduleRestart(child, now)
+
+    def reconfigure(self, child):
+        if child['proc'] is not None and child['proc'].poll() is None:
+            self.terminate(child['proc'])
+        child['nextRestart'] = None
+        child['reconfigs'] += 1
+        logger.info('restarting %s'%child['name'])
+        try:
+            self.spawn(child)
+        except Exception as e:
+            logger.error('failed to restart %s: %s'%(child['name'], e))
+            child['exitCodes'].append('reconfigure')
+            self.scheduleRestart(child, time.time())
+
+    def scheduleRestart(self, child, now):
+        child['restarts'] += 1
+        child['nextRestart'] = now + child['backoff']
+        logger.warn('%s exited (%s), restarting in %.0f sec'%(child['name'], child['exitCodes'][-1], child['backoff']))
+        child['backoff'] = min(child['backoff'] * 2, restartBackoffMax)
+
+    def terminate(self, proc, timeout=2.):
+        proc.terminate()
+        deadline = time.time() + timeout
+        while proc.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
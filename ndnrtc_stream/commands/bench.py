@@ -0,0 +1,226 @@
+"""bench command."""
+
+import io
+import json
+import logging
+import os
+import signal
+
+from .base import *
+from .publish import Publish
+from .fetch import Fetch
+from ndnrtc_stream.commands.utils import *
+from ndnrtc_stream.commands.utils.statstore import *
+from ndnrtc_stream.commands.utils.procstat import *
+
+logger = logging.getLogger(__name__)
+ch = logging.StreamHandler(sys.stdout)
+ch.setFormatter(CustomFormatter())
+logger.propagate = False
+logger.handlers = [ch]
+
+benchPrefix = '/ndnrtc-stream-bench'
+benchDuration = 30.
+
+class Bench(Base):
+    """ Headless publish -> fetch loopback on the local host.
+
+    A synthetic test pattern is published by one ndnrtc-client and fetched
+    by another one into a null sink for a fixed duration; the result is
+    a JSON report of rates, latency-related stats and per-process usage.
+    With several --key_type values, the loopback is run once per key type
+    (each with its own identity) and signing/verification costs are compared.
+    """
+
+    def __init__(self, options, *args, **kwargs):
+        Base.__init__(self, options, args, kwargs)
+        self.stopped = False
+
+    def run(self):
+        self.duration = float(self.options['--duration']) if self.options['--duration'] else benchDuration
+        keyTypes = [parseKeyType(k) for k in self.options['--key_type'].split(',')] if self.options['--key_type'] else [None]
+        reports = []
+        for keyType in keyTypes:
+            if self.stopped:
+                break
+            self.keyType = keyType
+            reports.append(self.runLoopback('-%s'%keyType if len(keyTypes) > 1 else ''))
+        self.drainer.stop()
+        if len(reports) == 1:
+            self.saveReport(reports[0])
+        else:
+            self.saveReport({'runs': reports, 'key_types': self.compareKeyTypes(reports)})
+        logger.info("completed")
+
+    def runLoopback(self, suffix=''):
+        """ Runs publisher and fetcher for --duration and returns the report;
+        output of the clients is saved with `suffix` appended to their names. """
+        self.setupPublisher()
+        self.setupFetcher()
+        os.environ['NDNRTC_STUB_VIDEO_SIZE'] = '%dx%d'%(self.publisher.videoWidth, self.publisher.videoHeight)
+        os.environ['NDNRTC_STUB_PIXEL_FORMAT'] = self.publisher.pixelFormat
+
+        self.startSource()
+        self.publisher.ndnrtcClientProc = startNdnrtcClient(self.publisher.configFile,
+                                                self.publisher.signingIdentity, self.publisher.policyFile)
+        self.fetcher.ndnrtcClientProc = startNdnrtcClient(self.fetcher.configFile,
+                                                self.fetcher.signingIdentity, self.fetcher.policyFile)
+        self.childrenProcs = [self.publisher.ndnrtcClientProc, self.fetcher.ndnrtcClientProc]
+        for (name, proc) in [('publisher', self.publisher.ndnrtcClientProc), ('fetcher', self.fetcher.ndnrtcClientProc)]:
+            self.drainer.add(proc.stdout, os.path.join(self.runDir, '%s%s.out'%(name, suffix)))
+            self.drainer.add(proc.stderr, os.path.join(self.runDir, '%s%s.err'%(name, suffix)))
+        self.startSinks()
+        self.publisher.startStatWatch()
+        self.fetcher.startStatWatch()
+
+        self.monitor = ProcessMonitor()
+        self.monitor.add('publisher', self.publisher.ndnrtcClientProc)
+        self.monitor.add('fetcher', self.fetcher.ndnrtcClientProc)
+        logger.info('benchmarking %s for %.0f seconds...'%(self.fetcher.streams[0].basePrefix, self.duration))
+        deadline = time.time() + self.duration
+        while not self.stopped and time.time() < deadline:
+            time.sleep(min(1., max(0., deadline - time.time())))
+            self.monitor.sample()
+            if any(p.poll() is not None for p in self.childrenProcs):
+                logger.error('ndnrtc-client exited prematurely')
+                break
+        report = self.makeReport()
+
+        self.stopChildren()
+        self.stopSinks()
+        self.source.stop()
+        self.frameRing.stop()
+        self.publisher.stopStatWatch()
+        self.fetcher.stopStatWatch()
+        return report
+
+    def signal_handler(self, sig, frame):
+        logger.warn('caught stop signal...')
+        self.stopped = True
+
+    def subOptions(self, **kwargs):
+        options = dict(self.options)
+        options.update(kwargs)
+        return options
+
+    def setupPublisher(self):
+        prefix = self.options['<prefix>'] if self.options['<prefix>'] else benchPrefix
+        keyType = getattr(self, 'keyType', None)
+        self.publisher = Publish(self.subOptions(**{'<prefix>': keyTypeIdentity(prefix, keyType), '--key_type': keyType}))
+        self.publisher.setupVideoSize()
+        self.publisher.createSourcePipe()
+        self.publisher.createOverlayFile()
+        self.publisher.setupProducerConfig()
+        self.publisher.setupSigningIdentity()
+        self.publisher.setupVerificationPolicy()
+
+    def setupFetcher(self):
+        self.fetcher = Fetch(self.subOptions(**{'<stream_prefix>': [self.publisher.signingIdentity],
+                                                '--prefix_file': None, '--trust_schema': None,
+                                                '--headless': True, '--key_type': self.publisher.keyType}))
+        self.fetcher.setupConsumerConfig()
+        self.fetcher.setupSigningIdentity()
+        self.fetcher.setupVerificationPolicy()
+        self.fetcher.setupPreviewPipe()
+        self.fetcher.createOverlayFile()
+        # sub-commands installed their own handlers
+        signal.signal(signal.SIGINT, self.signal_handler)
+
+    def startSource(self):
+        w, h = self.publisher.videoWidth, self.publisher.videoHeight
+        pixelFormat = self.publisher.pixelFormat
+        from ndnrtc_stream.commands.utils.framering import FrameRing
+        from ndnrtc_stream.commands.utils.testpattern import TestPatternSource
+        self.frameRing = FrameRing(os.path.join(self.runDir, 'frames.ring'), rawFrameSize(w, h, pixelFormat))
+        if self.options['--latency']:
+            from ndnrtc_stream.commands.utils.watermark import Watermark
+            self.frameRing.watermark = Watermark(w, h, pixelFormat=pixelFormat)
+        self.source = TestPatternSource(self.frameRing, w, h, captureFrameRate, pixelFormat)
+        self.source.start()
+        self.frameRing.addReader('camera', self.publisher.sourcePipe)
+
+    def startSinks(self):
+        # the fetcher runs headless: its sink readers consume frames instead of viewers
+        self.fetcher.startSinkReaders()
+
+    def stopSinks(self):
+        self.fetcher.stopSinkReaders()
+
+    def makeReport(self):
+        pubStats = self.publisher.statStore
+        fetchStats = self.fetcher.streams[0].statStore
+        def latest(store, stat):
+            value = store.latest(stat) if stat in store.columns else float('nan')
+            return None if isNan(value) else value
+        def rate(store, stat):
+            value = store.counterRate(stat) if stat in store.columns else float('nan')
+            return None if isNan(value) else value
+        def summary(store, stat):
+            return store.summary(stat) if stat in store.columns else None
+        return {
+            'duration': self.duration,
+            'video_size': '%dx%d'%(self.publisher.videoWidth, self.publisher.videoHeight),
+            'pixel_format': self.publisher.pixelFormat,
+            'key_type': self.publisher.keyType,
+            'frame_rate': captureFrameRate,
+            'stub': bool(self.options['--stub']),
+            'source': {'frames': self.source.frames, 'late': self.source.late,
+                       'readers': self.frameRing.readerStats()},
+            'publish': {
+                'rate': rate(pubStats, 'framesPub'),
+                'prod_rate': summary(pubStats, 'prodRate'),
+                'frames_captured': latest(pubStats, 'framesCaptured'),
+                'frames_published': latest(pubStats, 'framesPub'),
+                'frames_dropped': latest(pubStats, 'framesDrop'),
+                'segments_published': latest(pubStats, 'segPub'),
+                'segment_rate': rate(pubStats, 'segPub'),
+            },
+            'fetch': {
+                'rate': rate(fetchStats, 'framesPlayed'),
+                'frames_played': latest(fetchStats, 'framesPlayed'),
+                'frames_incomplete': latest(fetchStats, 'framesInc'),
+                'frames_skipped': latest(fetchStats, 'skipNoKey'),
+                'timeouts': latest(fetchStats, 'timeouts'),
+                'nacks': latest(fetchStats, 'nacks'),
+                'verify_rate': rate(fetchStats, 'verifySuccess'),
+                'verify_failures': latest(fetchStats, 'verifyFailure'),
+                'drd_ms': summary(fetchStats, 'drdEst'),
+                'jitter_buffer_ms': summary(fetchStats, 'jitterPlay'),
+            },
+            'sink': [stream.sinkReader.stats() for stream in self.fetcher.streams],
+            'playback': [stream.timing.summary() for stream in self.fetcher.streams],
+            'latency': [stream.latency.summary() for stream in self.fetcher.streams if stream.latency] or None,
+            'processes': self.monitor.report()
+        }
+
+    def compareKeyTypes(self, reports):
+        """ Signing and verification cost per key type: CPU time of the publisher
+        per published segment and of the fetcher per verified one. """
+        comparison = {}
+        for report in reports:
+            publisher = report['processes'].get('publisher', {})
+            fetcher = report['processes'].get('fetcher', {})
+            segments = report['publish']['segments_published']
+            verified = report['fetch']['verify_rate']
+            def perThousand(cpuSeconds, count):
+                return 1000. * cpuSeconds / count if cpuSeconds is not None and count else None
+            comparison[report['key_type']] = {
+                'segment_rate': report['publish']['segment_rate'],
+                'publisher_cpu_percent': publisher.get('cpu_percent'),
+                'publisher_cpu_ms_per_segment': perThousand(publisher.get('cpu_seconds'), segments),
+                'verify_rate': verified,
+                'verify_failures': report['fetch']['verify_failures'],
+                'fetcher_cpu_percent': fetcher.get('cpu_percent'),
+                'fetcher_cpu_ms_per_segment': perThousand(fetcher.get('cpu_seconds'),
+                                                          verified * report['duration'] if verified else None)
+            }
+        return comparison
+
+    def saveReport(self, report):
+        out = json.dumps(report, indent=2, sort_keys=True)
+        if self.options['--report']:
+            with io.open(self.options['--report'], 'wb') as f:
+                f.write(out.encode('utf-8'))
+            logger.info('report saved to %s'%self.options['--report'])
+        else:
+            sys.stdout.write(out + '\n')
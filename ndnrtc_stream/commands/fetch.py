@@ -8,8 +8,14 @@ import tempfile
 
 from .base import *
 from json import dumps
+from copy import deepcopy
 from shutil import copyfile
 from ndnrtc_stream.commands.utils import *
+from ndnrtc_stream.commands.utils.statstore import *
+from ndnrtc_stream.commands.utils.overlay import *
+from ndnrtc_stream.commands.utils.tail import *
+from ndnrtc_stream.commands.utils.sink import *
+from ndnrtc_stream.commands.utils.fifo import fifoCaptions
 
 logger = logging.getLogger(__name__)
 ch = logging.StreamHandler(sys.stdout)
@@ -17,43 +23,50 @@ ch.setFormatter(CustomFormatter())
 logger.propagate = False
 logger.handlers = [ch]
 
-sampleConfig= \
-u'general = {\n\
-        log_path="";\n\
-        log_level = "default";\n\
-        log_file = "client.log";\n\
-    };\n\
-consume = {\n\
-    basic = {\n\
-        stat_gathering = ({\n\
-            name = "'+statFileId+'";\n\
-            statistics= ("isent", "segNumRcvd", "appNacks", "nacks", "timeouts", "rtxNum",\
-            "bytesRcvd", "rawBytesRcvd", "lambdaD", "drdEst", "jitterPlay",\
-            "framesReq", "framesPlayed", "framesInc", "skipNoKey",\
-            "verifySuccess", "verifyFailure");\n\
-        });\n\
-    };\n\
-    streams = ({\n\
-        type = "video";\n\
-        base_prefix = "";\n\
-        name = "'+streamName+'";\n\
-        thread_to_fetch = "'+threadName+'";\n\
-        sink = {\n\
-            name = "";\n\
-            type = "pipe";\n\
-            write_frame_info = false;\n\
-        }\n\
-    });\n\
-};\n'
+# consumer config template, built once as native objects (libconf lists are tuples)
+sampleConfig = {
+    'general': {
+        'log_path': '',
+        'log_level': 'default',
+        'log_file': 'client.log'
+    },
+    'consume': {
+        'basic': {
+            'stat_gathering': ({
+                'name': statFileId,
+                'statistics': ('isent', 'segNumRcvd', 'appNacks', 'nacks', 'timeouts', 'rtxNum',
+                               'bytesRcvd', 'rawBytesRcvd', 'lambdaD', 'drdEst', 'jitterPlay',
+                               'framesReq', 'framesPlayed', 'framesInc', 'skipNoKey',
+                               'verifySuccess', 'verifyFailure')
+            },)
+        },
+        'streams': ({
+            'type': 'video',
+            'base_prefix': '',
+            'name': streamName,
+            'thread_to_fetch': threadName,
+            'sink': {
+                'name': '',
+                'type': 'pipe',
+                'write_frame_info': False
+            }
+        },)
+    }
+}
 
 statCaptions = {'isent': 'Interests/sec', 'segNumRcvd': 'Segments/sec', 'appNacks': 'App Nacks', 'nacks': 'Netw Nacks', 
                 'timeouts':'Timeouts', 'rtxNum':'Retransmissions', 'bytesRcvd': 'Payload Kbps', 'rawBytesRcvd':'Total Kbps', 
                 'lambdaD': 'Min Pipeline', 'drdEst': 'DRD (ms)', 'jitterPlay':'Buffer size (ms)', 'framesReq': 'Frames Requested', 
                 'framesPlayed': 'Frames Played', 'framesInc': 'Frames Incomplete', 'skipNoKey': 'Frames Skipped',
                 'verifySuccess': 'Frames Verified', 'verifyFailure': 'Verify Failures' }
+# counters shown in the overlay as (smoothed) per-second rates
 derivativeStats = ['isent', 'segNumRcvd', 'bytesRcvd', 'rawBytesRcvd']
+# frames to average glass-to-glass latency over in the overlay
+latencyWindow = 25
 
 class Fetch(Base):
+    reportsStartup = True
+
     def __init__(self, options, *args, **kwargs):
         Base.__init__(self, options, args, kwargs)
 
@@ -63,52 +76,85 @@ class Fetch(Base):
         self.setupVerificationPolicy()
         self.setupPreviewPipe()
         self.createOverlayFile()
+        startupProfile.mark('config and identity')
 
-        self.ffplayProc = startFfplay(self.previewPipe, self.videoWidth, self.videoHeight, self.overlayFile)
-        self.ndnrtcClientProc = startNdnrtcClient(self.configFile, self.signingIdentity, self.policyFile)
-        self.childrenProcs = [self.ndnrtcClientProc, self.ffplayProc]
+        self.startSinkReaders()
+        # viewers are started first, so sink FIFOs have readers when ndnrtc-client opens them
+        self.supervisor = Supervisor(self.drainer, self.runDir)
+        for stream in self.streams if not self.headless() else []:
+            self.supervisor.add('ffplay-%d'%stream.idx, 
+                                lambda stream=stream: startFfplay(stream.viewerPipe, self.videoWidth, self.videoHeight, 
+                                                                    stream.overlayFile, self.pixelFormat),
+                                restart=False)
+        self.supervisor.add('ndnrtc-client', lambda: startNdnrtcClient(self.configFile, self.signingIdentity, self.policyFile),
+                            activity=None if self.options['--config_file'] else self.lastStatTime,
+                            echo=sys.stdout if self.options['--verbose'] else None)
+        self.startSupervisor()
+        startupProfile.mark('start children')
+        self.startMetrics()
         self.startStatWatch()
+        startupProfile.mark('start stat watch')
+        startupProfile.report()
 
-        dumpOutput(self.ffplayProc.stdout, os.path.join(self.runDir, 'ffplay.out'))
-        dumpOutput(self.ffplayProc.stderr, os.path.join(self.runDir, 'ffplay.err'))
-        dumpOutput(self.ndnrtcClientProc.stderr, os.path.join(self.runDir, 'ndnrtc-client.err'))
-
-        logger.info('fetching from %s'%self.basePrefix)
-        proc = self.ndnrtcClientProc
-        # proc = self.ffplayProc
-        try:
-            while proc.poll() == None:
-                line = proc.stdout.readline()
-                if self.options['--verbose']:
-                    sys.stdout.write(line)
-        except:
-            pass
+        for stream in self.streams:
+            logger.info('fetching from %s'%stream.basePrefix)
+        self.supervise()
 
         self.stopChildren()
+        self.drainer.stop()
+        self.stopSinkReaders()
         self.stopStatWatch()
+        self.stopMetrics()
         logger.info("completed")
 
+    def getStreamPrefixes(self):
+        prefixes = list(self.options['<stream_prefix>'] or [])
+        if self.options['--prefix_file']:
+            with io.open(self.options['--prefix_file'], 'r') as f:
+                prefixes += [l.strip() for l in f if l.strip() and not l.strip().startswith('#')]
+        if not prefixes:
+            logger.error('no stream prefixes to fetch')
+            raise Exception('no stream prefixes to fetch')
+        return prefixes
+
     def setupConsumerConfig(self):
         global sampleConfig, streamName
+        self.pixelFormat = parsePixelFormat(self.options['--pixel_format'])
         if self.options['--config_file']:
             self.config = libconf.load(self.options['--config_file'])
+            self.streams = []
+            for streamConfig in self.config['consume']['streams']:
+                stream = FetchStream(len(self.streams), streamConfig['base_prefix'], self.runDir)
+                stream.sinkPipe = streamConfig['sink']['name']
+                self.streams.append(stream)
         else:
-            self.config = libconf.loads(sampleConfig)
+            self.config = deepcopy(sampleConfig)
             self.config['general']['log_path'] = self.runDir
             if self.options['--verbose']:
                 self.config['general']['log_level'] = 'all' 
-            streamPrefix = self.options['<stream_prefix>']
             if self.options['--instance_name']:
                 utils.ndnrtcClientInstanceName = self.options['--instance_name']
-            self.basePrefix = streamPrefix if streamPrefix.endswith(utils.ndnrtcClientInstanceName) else os.path.join(streamPrefix, utils.ndnrtcClientInstanceName)
-            self.config['consume']['streams'][0]['base_prefix'] = self.basePrefix
-            self.sinkPipe = os.path.join(self.runDir, 'sink')
-            self.config['consume']['streams'][0]['sink']['name'] = self.sinkPipe
             if self.options['--stream_name']:
                 streamName = self.options['--stream_name']
-                self.config['consume']['streams'][0]['name'] = self.options['--stream_name']
-            if self.options['--thread_name']:
-                self.config['consume']['streams'][0]['thread_to_fetch'] = self.options['--thread_name']
+            # all streams are consumed by one ndnrtc-client, each one gets its own sink
+            template = self.config['consume']['streams'][0]
+            self.streams = []
+            streamsConfig = []
+            for streamPrefix in self.getStreamPrefixes():
+                stream = FetchStream(len(self.streams), streamPrefix, self.runDir)
+                streamConfig = deepcopy(template)
+                streamConfig['base_prefix'] = stream.basePrefix
+                streamConfig['sink']['name'] = stream.sinkPipe
+                streamConfig['name'] = streamName
+                if self.options['--thread_name']:
+                    streamConfig['thread_to_fetch'] = self.options['--thread_name']
+                if self.options['--frame_info']:
+                    streamConfig['sink']['write_frame_info'] = True
+                if self.pixelFormat != defaultPixelFormat:
+                    streamConfig['sink']['format'] = ndnrtcFrameFormats[self.pixelFormat]
+                self.streams.append(stream)
+                streamsConfig.append(streamConfig)
+            self.config['consume']['streams'] = tuple(streamsConfig)
 
         self.configFile = os.path.join(self.runDir, 'consumer.cfg')
         with io.open(self.configFile, mode="w") as f:
@@ -128,30 +174,39 @@ class Fetch(Base):
 
     def setupVerificationPolicy(self):
         self.policyFile = os.path.join(self.runDir, 'policy.conf')
+        self.keyType = parseKeyType(self.options['--key_type']) if self.options['--key_type'] else None
         if self.options['--trust_schema']:
             logger.debug('using provided trust schema policy file %s'%self.options['--trust_schema'])
             self.policyFile = self.options['--trust_schema']
         else:
             # will compose verification file based on following rules:
             # - if there's a cert file file provided, use it as trust anchor
-            # - if there's an identity that is a prefix of provided stream prefix, 
+            # - if there's an identity that is a prefix of all provided stream prefixes, 
             #       then will use this identity as trust anchor
             # - if there are no such identities, will use "any" trust anchor
+            # - data is expected to be signed with --key_type keys, or keys of
+            #       the same type as the trust anchor identity's (rsa if unknown)
             if self.options['<cert_file>']:
                 self.certFile = os.path.join(self.runDir, 'id.cert')
                 copyfile(self.options['<cert_file>'], self.certFile)
                 self.savePolicyFile()
             else:
-                allIdentities = ndnsec_getAllIdentities()
-                prefixes = [i for i in allIdentities if self.options['<stream_prefix>'].startswith(i)]
-                if allIdentities and len(prefixes) > 0:
-                    identity = prefixes[0]
+                allIdentities = ndnsec_getAllIdentities() or []
+                streamPrefixes = [stream.streamPrefix for stream in self.streams]
+                # prefix by name components: /alice is not a prefix of /alice-ecdsa
+                prefixes = [i for i in allIdentities if all(p == i or p.startswith(i.rstrip('/') + '/') for p in streamPrefixes)]
+                if len(prefixes) > 0:
+                    identity = max(prefixes, key=len)
+                    if not self.keyType:
+                        self.keyType = ndnsec_getKeyType(identity)
                     logger.info('using identity %s as a trust anchor'%identity)
                     self.saveCert(identity)
                     self.savePolicyFile()
                 else: # use "any"
                     with io.open(self.policyFile, 'w') as f:
-                        f.write(utils.samplePolicyAny)
+                        f.write(verificationPolicy(self.keyType))
+            self.keyType = self.keyType or defaultKeyType
+            logger.debug('data is expected to be signed with %s keys'%self.keyType)
             logger.debug('setup policy file at %s'%self.policyFile)
 
     def saveCert(self, identity):
@@ -163,10 +218,8 @@ class Fetch(Base):
         logger.debug('stored identity cert at %s'%self.certFile)
     
     def savePolicyFile(self):
-        policy = utils.samplePolicy
-        policy = policy.replace('CERT_FILENAME', self.certFile)
         with io.open(self.policyFile, 'w') as f:
-            f.write(policy)
+            f.write(verificationPolicy(self.keyType, self.certFile))
 
     def setupPreviewPipe(self):
         if self.options['--video_size']:
@@ -179,67 +232,175 @@ class Fetch(Base):
         else:
             self.videoWidth = 1280
             self.videoHeight = 720
-        self.previewPipe = '%s.%dx%d'%(self.sinkPipe, self.videoWidth, self.videoHeight)
-        if not os.path.exists(self.previewPipe):
-            os.mkfifo(self.previewPipe)
+        for stream in self.streams:
+            # ndnrtc-client appends frame resolution to the sink name
+            stream.previewPipe = '%s.%dx%d'%(stream.sinkPipe, self.videoWidth, self.videoHeight)
+            if not os.path.exists(stream.previewPipe):
+                os.mkfifo(stream.previewPipe)
+            if self.useSinkReader() and not self.headless():
+                # frames are relayed to the viewer through a sink reader
+                stream.viewerPipe = os.path.join(self.runDir, 'preview-%d'%stream.idx)
+                os.mkfifo(stream.viewerPipe)
+            else:
+                stream.viewerPipe = stream.previewPipe
+
+    def useSinkReader(self):
+        return bool(self.options['--latency'] or self.options['--frame_info'] or self.headless())
+
+    def headless(self):
+        # recording runs without viewers
+        return bool(self.options['--headless'] or self.options['--record'])
+
+    def startSinkReaders(self):
+        """ Starts in-process readers of ndnrtc-client sinks, which track frame timing
+        (and latency with --latency) and forward frames to viewers, unless headless. """
+        if not self.useSinkReader():
+            return
+        frameSize = rawFrameSize(self.videoWidth, self.videoHeight, self.pixelFormat)
+        for stream in self.streams:
+            stream.timing = FrameTiming()
+            stream.sinkReader = SinkReader(stream.previewPipe, frameSize, onFrame=stream.timing.onFrame,
+                                           forwardPipe=None if self.headless() else stream.viewerPipe,
+                                           frameInfo=bool(self.options['--frame_info']))
+            if self.options['--latency']:
+                from ndnrtc_stream.commands.utils.watermark import LatencyMeter
+                stream.latency = LatencyMeter(self.videoWidth, self.videoHeight, self.pixelFormat)
+                stream.sinkReader.addListener(stream.latency.onFrame)
+            if self.options['--record']:
+                from ndnrtc_stream.commands.utils.record import FrameRecorder
+                stream.recorder = FrameRecorder(os.path.join(self.options['--record'], stream.basePrefix.strip('/').replace('/', '-')),
+                                    self.videoWidth, self.videoHeight, self.pixelFormat, frameSize, 
+                                    codec=self.options['--record_codec'],
+                                    segmentSize=int(float(self.options['--segment_size']) * 1024 * 1024) if self.options['--segment_size'] else None,
+                                    segmentTime=self.options['--segment_time'])
+                stream.recorder.start()
+                stream.sinkReader.addListener(stream.recorder.onFrame)
+            stream.sinkReader.start()
+
+    def stopSinkReaders(self):
+        for stream in self.streams:
+            if stream.sinkReader:
+                stream.sinkReader.stop()
+            if stream.recorder:
+                stream.recorder.stop()
+                stats = stream.recorder.stats()
+                logger.info('%s: recorded %d frames into %d segments, %d dropped'%(stream.basePrefix, 
+                            stats['frames'], stats['segments'], stats['dropped']))
+            if stream.timing:
+                summary = stream.timing.summary()
+                logger.info('%s: %d frames, %d stalls (%.1f sec total, longest %.0f ms), %d frames missing'%(stream.basePrefix, 
+                            stream.sinkReader.frames, summary['stalls'], summary['stall_time_ms'] / 1000., 
+                            summary['longest_stall_ms'], summary['frames_missing']))
+            if stream.latency:
+                summary = stream.latency.summary()
+                logger.info('%s: glass-to-glass latency %s, %d frames, %d lost'%(stream.basePrefix, 
+                            'p50 %.0f ms, p95 %.0f ms'%(summary['latency_ms']['p50'], summary['latency_ms']['p95']) 
+                                if summary['latency_ms'] else 'n/a', summary['frames'], summary['lost']))
 
     def createOverlayFile(self):
-        self.overlayFile = os.path.join(self.runDir, 'overlay.txt')
-        with io.open(self.overlayFile, 'w') as f:
-            f.write(u'-')
+        # the overlay is only drawn by viewers
+        if self.headless():
+            return
+        for stream in self.streams:
+            stream.createOverlayFile(self.runDir)
 
     def startStatWatch(self):
-        global statFileId, streamName, derivativeStats
+        global statFileId, streamName
         if not self.options['--config_file']:
-            self.statFile = "%s%s-%s.stat"%(statFileId, self.basePrefix.replace('/','-'), streamName)
-            print("WATCHING STAT FILE "+self.statFile)
-            filePath = os.path.join(self.runDir, self.statFile)
-            
-            derivatives = {}
-            for s in derivativeStats:
-                derivatives[s] = [time.time(), None]
-            def onNewLine(statLine):
-                now = time.time()
-                overlay = "Fetching %s\n"%self.basePrefix.replace('%', '\%')
-                stats = statLine.split('\t')
-                if len(stats) > 1:
-                    idx = 1
-                    for statKey in self.config['consume']['basic']['stat_gathering'][0]['statistics']:
-                        try:
-                            update = True
-                            caption = statCaptions[statKey]
-                            value = float(stats[idx])
-                            if statKey in derivativeStats: # calculate derivative for this stat
-                                dT = now - derivatives[statKey][0]
-                                lastValue = derivatives[statKey][1]
-                                # if dT >= 1:
-                                derivatives[statKey][0] = now
-                                derivatives[statKey][1] = value
-                                if lastValue and lastValue < value:
-                                    dV = value - lastValue
-                                    d = dV / dT
-                                    value = d
-                                    # just a hack for bytes counters to convert derivative
-                                    # into Kbps
-                                    if 'bytes' in statKey.lower(): 
-                                        value = value * 8. / 1024.
-                                else:
-                                    update = False
-                            if update:
-                                if value - int(value) > 0:
-                                    overlay += "\n%20s %-10.2f"%(caption, value)
-                                else:
-                                    overlay += "\n%20s %-10d"%(caption, int(value))
-                            idx += 1
-                        except:
-                            logger.debug(sys.exc_info())
-                            pass
-                with open_atomic(self.overlayFile, 'w') as f:
-                    f.write(overlay)
-
-            self.statTail = Tail(filePath, onNewLine)
-            self.statTail.start()
+            for stream in self.streams:
+                statFile = "%s%s-%s.stat"%(statFileId, stream.basePrefix.replace('/','-'), streamName)
+                logger.debug('watching stat file %s'%statFile)
+                statGathering = self.config['consume']['basic']['stat_gathering'][0]
+                streamConfig = self.config['consume']['streams'][stream.idx]
+                labels = {'role': 'fetch', 'prefix': stream.basePrefix, 'stream': streamConfig['name'], 
+                          'thread': streamConfig['thread_to_fetch']}
+                self.exportStats(stream.createStatStore(statGathering), labels, statCaptions)
+                stream.startStatWatch(os.path.join(self.runDir, statFile))
+                if stream.timing:
+                    self.exportStats(stream.timing.statStore, dict(labels, role='playback'), frameTimingCaptions)
+                if stream.latency:
+                    from ndnrtc_stream.commands.utils.watermark import latencyCaptions
+                    self.exportStats(stream.latency.statStore, dict(labels, role='latency'), latencyCaptions)
+                if stream.sinkReader:
+                    for monitor in (stream.sinkReader.monitor, stream.sinkReader.forwardMonitor):
+                        if monitor:
+                            self.exportStats(monitor.statStore, dict(labels, role='fifo', pipe=monitor.name,
+                                             stream='%s-%s'%(labels['stream'], monitor.name)), fifoCaptions)
+            # one log for all streams, so its labels name all of them and no thread
+            names = [self.config['consume']['streams'][s.idx]['name'] for s in self.streams]
+            self.startLogWatch({'role': 'fetch', 'prefix': ','.join(s.basePrefix for s in self.streams),
+                                'stream': ','.join(sorted(set(names)))})
+
+    def stopStatWatch(self):
+        for stream in self.streams:
+            stream.stopStatWatch()
+        self.stopLogWatch()
+        self.closeExportedStats()
+
+    def lastStatTime(self):
+        times = [stream.statTime for stream in self.streams if stream.statTime]
+        return max(times) if times else None
+
+class FetchStream(object):
+    """ One of the streams consumed by the fetch command: its sink, viewer and stats. """
+
+    def __init__(self, idx, streamPrefix, runDir):
+        self.idx = idx
+        self.streamPrefix = streamPrefix.strip()
+        self.basePrefix = self.streamPrefix if self.streamPrefix.endswith(utils.ndnrtcClientInstanceName) else os.path.join(self.streamPrefix, utils.ndnrtcClientInstanceName)
+        self.sinkPipe = os.path.join(runDir, 'sink-%d'%idx)
+        self.statTail = None
+        self.statTime = None
+        self.overlay = None
+        self.sinkReader = None
+        self.timing = None
+        self.latency = None
+        self.recorder = None
+
+    def createOverlayFile(self, runDir):
+        self.overlayFile = overlayPath(runDir, 'overlay-%d'%self.idx)
+        self.overlay = OverlayWriter(self.overlayFile, self.renderOverlay)
+        logger.debug('overlay file %s'%self.overlayFile)
+
+    def createStatStore(self, statGathering):
+        global derivativeStats
+        self.statStore = StatStore.fromConfig(statGathering, counters=counterStats.union(derivativeStats))
+        return self.statStore
+
+    def startStatWatch(self, statFile):
+        def onNewLines(statLines):
+            if self.statStore.ingestLines(statLines):
+                self.statTime = time.time()
+                if self.overlay:
+                    self.overlay.update()
+
+        self.statTail = Tail(statFile, onNewLines=onNewLines)
+        self.statTail.start()
+        if self.overlay:
+            self.overlay.start()
 
     def stopStatWatch(self):
         if self.statTail:
-            self.statTail.stop()
\ No newline at end of file
+            self.statTail.stop()
+        if self.overlay:
+            self.overlay.stop(remove=True)
+
+    def renderOverlay(self):
+        overlay = "Fetching %s\n"%self.basePrefix.replace('%', '\%')
+        for statKey in self.statStore.statistics:
+            if not statKey in statCaptions:
+                continue
+            if statKey in derivativeStats:
+                value = self.statStore.rates.ewma(statKey)
+                # bytes counters are shown in Kbps
+                if 'bytes' in statKey.lower():
+                    value = value * 8. / 1024.
+            else:
+                value = self.statStore.latest(statKey)
+            overlay += formatStat(statCaptions[statKey], value)
+        if self.timing:
+            overlay += formatStat('Stalls', self.timing.stallCount)
+            overlay += formatStat('Stalled (ms)', self.timing.currentStall())
+        if self.latency:
+            overlay += formatStat('G2G latency (ms)', self.latency.statStore.mean('g2gLatency', latencyWindow))
+        return overlay
@@ -0,0 +1,197 @@
+"""load command."""
+
+import logging
+import os
+import signal
+
+from .base import *
+from .bench import Bench
+from .fetch import Fetch
+from ndnrtc_stream.commands.utils import *
+from ndnrtc_stream.commands.utils.statstore import *
+from ndnrtc_stream.commands.utils.procstat import *
+
+logger = logging.getLogger(__name__)
+ch = logging.StreamHandler(sys.stdout)
+ch.setFormatter(CustomFormatter())
+logger.propagate = False
+logger.handlers = [ch]
+
+loadConsumers = 10
+# seconds between consumer starts
+loadStagger = 1.
+# seconds all consumers run together
+loadDuration = 60.
+# consumers playing slower than this share of capture frame rate are starving...
+loadHealthyRate = 0.9
+# ...unless they started less than this many seconds ago
+loadWarmup = 10.
+# window (ms) of playback rates in the timeline
+loadRateWindow = 10000
+
+class LoadConsumer(Fetch):
+    """ Headless fetcher started by the load command. It works in a plain
+    subdirectory of the load's run directory and uses the load's output
+    drainer; the NFD check and stop signal handling are left to the load. """
+
+    requiresNfd = False
+    runsChildren = False
+
+    def __init__(self, load, idx, options):
+        Fetch.__init__(self, options)
+        self.runDir = os.path.join(load.runDir, 'consumer-%d'%idx)
+        os.mkdir(self.runDir)
+        self.drainer = load.drainer
+
+class Load(Bench):
+    """ Fan-out load test: N concurrent headless fetchers of one stream.
+
+    Every consumer is a LoadConsumer with its own directory, consumer
+    config, ndnrtc-client and null sink; consumers are started `--stagger`
+    seconds apart and then run together for `--duration`. The JSON report has
+    per-consumer results, their distributions across consumers and a timeline
+    of playback rates against the number of active consumers, which shows
+    where the publisher (or NFD) stops keeping up. With --stub, a stub
+    publisher of a test pattern is started locally (as in bench).
+    """
+
+    def run(self):
+        count = int(self.options['--consumers']) if self.options['--consumers'] else loadConsumers
+        stagger = float(self.options['--stagger']) if self.options['--stagger'] is not None else loadStagger
+        self.duration = float(self.options['--duration']) if self.options['--duration'] else loadDuration
+        self.publisher = None
+        self.consumers = []
+        self.childrenProcs = []
+        self.monitor = ProcessMonitor()
+        self.keyType = parseKeyType(self.options['--key_type']) if self.options['--key_type'] else None
+        if self.options['--stub']:
+            self.startStubPublisher()
+            prefix = self.publisher.signingIdentity
+        elif self.options['<stream_prefix>']:
+            prefix = self.options['<stream_prefix>'][0]
+        else:
+            logger.error('stream prefix is required (unless --stub is used)')
+            raise Exception('stream prefix is required')
+
+        logger.info('starting %d consumers of %s, %.1f sec apart...'%(count, prefix, stagger))
+        self.startTime = time.time()
+        self.timeline = []
+        deadline = self.startTime + stagger * (count - 1) + self.duration
+        nextSample = self.startTime + 1.
+        while not self.stopped and time.time() < deadline:
+            if len(self.consumers) < count and time.time() >= self.startTime + stagger * len(self.consumers):
+                self.startConsumer(prefix)
+                continue
+            time.sleep(0.1)
+            if time.time() >= nextSample:
+                nextSample += 1.
+                self.monitor.sample()
+                self.sample()
+                if self.publisher and self.publisher.ndnrtcClientProc.poll() is not None:
+                    logger.error('publisher exited prematurely')
+                    break
+        report = self.makeReport(prefix, count, stagger)
+
+        self.stopChildren()
+        self.drainer.stop()
+        for consumer in self.consumers:
+            consumer.stopSinkReaders()
+            consumer.stopStatWatch()
+        if self.publisher:
+            self.source.stop()
+            self.frameRing.stop()
+            self.publisher.stopStatWatch()
+        self.saveReport(report)
+        logger.info("completed")
+
+    def startStubPublisher(self):
+        self.setupPublisher()
+        os.environ['NDNRTC_STUB_VIDEO_SIZE'] = '%dx%d'%(self.publisher.videoWidth, self.publisher.videoHeight)
+        os.environ['NDNRTC_STUB_PIXEL_FORMAT'] = self.publisher.pixelFormat
+        self.startSource()
+        self.publisher.ndnrtcClientProc = startNdnrtcClient(self.publisher.configFile,
+                                                self.publisher.signingIdentity, self.publisher.policyFile)
+        self.childrenProcs.append(self.publisher.ndnrtcClientProc)
+        self.drainer.add(self.publisher.ndnrtcClientProc.stdout, os.path.join(self.runDir, 'publisher.out'))
+        self.drainer.add(self.publisher.ndnrtcClientProc.stderr, os.path.join(self.runDir, 'publisher.err'))
+        self.publisher.startStatWatch()
+        signal.signal(signal.SIGINT, self.signal_handler)
+
+    def startConsumer(self, prefix):
+        idx = len(self.consumers)
+        consumer = LoadConsumer(self, idx, self.subOptions(**{'<stream_prefix>': [prefix], '--prefix_file': None,
+                                '--headless': True, '--record': None, '--latency': False, '--metrics_port': None,
+                                '--metrics_socket': None, '--stats_dir': None}))
+        consumer.setupConsumerConfig()
+        consumer.setupSigningIdentity()
+        consumer.setupVerificationPolicy()
+        consumer.setupPreviewPipe()
+        consumer.startSinkReaders()
+        consumer.ndnrtcClientProc = startNdnrtcClient(consumer.configFile, consumer.signingIdentity, consumer.policyFile)
+        consumer.startTime = time.time()
+        self.drainer.add(consumer.ndnrtcClientProc.stdout, os.path.join(consumer.runDir, 'ndnrtc-client.out'))
+        self.drainer.add(consumer.ndnrtcClientProc.stderr, os.path.join(consumer.runDir, 'ndnrtc-client.err'))
+        consumer.startStatWatch()
+        self.childrenProcs.append(consumer.ndnrtcClientProc)
+        self.monitor.add('consumer-%d'%idx, consumer.ndnrtcClientProc)
+        self.consumers.append(consumer)
+        logger.debug('consumer %d started in %s'%(idx, consumer.runDir))
+
+    def playRate(self, consumer):
+        store = consumer.streams[0].statStore
+        return store.rates.rate('framesPlayed', loadRateWindow) if 'framesPlayed' in store.columns else float('nan')
+
+    def sample(self):
+        now = time.time()
+        active = [c for c in self.consumers if c.ndnrtcClientProc.poll() is None]
+        rates = [r for r in (self.playRate(c) for c in active) if not isNan(r)]
+        starving = [c for c in active if now - c.startTime >= loadWarmup and
+                    not self.playRate(c) >= loadHealthyRate * captureFrameRate]
+        drd = [c.streams[0].statStore.latest('drdEst') for c in active]
+        self.timeline.append({'t': now - self.startTime, 'consumers': len(active), 'starving': len(starving),
+                              'play_rate': summarize(rates), 'drd_ms': summarize([v for v in drd if not isNan(v)])})
+
+    def consumerReport(self, idx, consumer):
+        store = consumer.streams[0].statStore
+        def latest(stat):
+            value = store.latest(stat) if stat in store.columns else float('nan')
+            return None if isNan(value) else value
+        def summary(stat):
+            return store.summary(stat) if stat in store.columns else None
+        rate = self.playRate(consumer)
+        return {'idx': idx, 'run_dir': consumer.runDir, 'exit_code': consumer.ndnrtcClientProc.poll(),
+                'started': consumer.startTime - self.startTime,
+                'frames_played': latest('framesPlayed'), 'play_rate': None if isNan(rate) else rate,
+                'timeouts': latest('timeouts'), 'nacks': latest('nacks'),
+                'drd_ms': summary('drdEst'), 'jitter_buffer_ms': summary('jitterPlay'),
+                'playback': consumer.streams[0].timing.summary()}
+
+    def makeReport(self, prefix, count, stagger):
+        consumers = [self.consumerReport(idx, c) for (idx, c) in enumerate(self.consumers)]
+        def distribution(key, field=None):
+            values = [c[key][field] if field else c[key] for c in consumers if c[key] is not None]
+            return summarize([v for v in values if v is not None])
+        saturation = None
+        for entry in self.timeline:
+            if entry['starving']:
+                saturation = {'t': entry['t'], 'consumers': entry['consumers'], 'starving': entry['starving']}
+                break
+        return {
+            'prefix': prefix,
+            'consumers': count,
+            'stagger': stagger,
+            'duration': self.duration,
+            'stub': bool(self.options['--stub']),
+            'distribution': {
+                'frames_played': distribution('frames_played'),
+                'play_rate': distribution('play_rate'),
+                'timeouts': distribution('timeouts'),
+                'drd_ms_p50': distribution('drd_ms', 'p50'),
+                'jitter_buffer_ms_p50': distribution('jitter_buffer_ms', 'p50'),
+                'stalls': summarize([c['playback']['stalls'] for c in consumers]),
+            },
+            'saturation': saturation,
+            'timeline': self.timeline,
+            'per_consumer': consumers,
+            'processes': self.monitor.report()
+        }
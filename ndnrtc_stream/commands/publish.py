@@ -1,13 +1,21 @@
 """publish command."""
 
 import io
+import json
 import libconf
 import logging
 import os
+import signal
 import tempfile
 
 from .base import *
+from copy import deepcopy
 from ndnrtc_stream.commands.utils import *
+from ndnrtc_stream.commands.utils.statstore import *
+from ndnrtc_stream.commands.utils.overlay import *
+from ndnrtc_stream.commands.utils.tail import *
+from ndnrtc_stream.commands.utils.fifo import fifoCaptions
+from ndnrtc_stream.commands.utils.adapt import BitrateController, parseBitrateLadder
 
 logger = logging.getLogger(__name__)
 ch = logging.StreamHandler(sys.stdout)
@@ -15,75 +23,97 @@ ch.setFormatter(CustomFormatter())
 logger.propagate = False
 logger.handlers = [ch]
 
-sampleConfig = \
-u'general = {\n\
-        log_path = "";\n\
-        log_level = "default";\n\
-        log_file = "client.log";\n\
-    };\n\
-produce = {\n\
-    stat_gathering = ({\n\
-        name = "'+statFileId+'";\n\
-        statistics = ("framesCaptured", "framesPub", "framesDrop", "prodRate", "segPub");\n\
-    });\n\
-    streams = ({\n\
-        type = "video";\n\
-        name = "'+streamName+'";\n\
-        sync = "sound";\n\
-        source = {\n\
-            name = "/tmp/camera";\n\
-            type = "pipe";\n\
-        };\n\
-        threads = ({\n\
-            name = "'+threadName+'";\n\
-        });\n\
-    });\n\
-};\n'
+# producer config template, built once as native objects (libconf lists are tuples)
+sampleConfig = {
+    'general': {
+        'log_path': '',
+        'log_level': 'default',
+        'log_file': 'client.log'
+    },
+    'produce': {
+        'stat_gathering': ({
+            'name': statFileId,
+            'statistics': ('framesCaptured', 'framesPub', 'framesDrop', 'prodRate', 'segPub')
+        },),
+        'streams': ({
+            'type': 'video',
+            'name': streamName,
+            'sync': 'sound',
+            'source': {
+                'name': '/tmp/camera',
+                'type': 'pipe'
+            },
+            'threads': ({
+                'name': threadName
+            },)
+        },)
+    }
+}
 
 statCaptions = {'framesCaptured': 'Frames Captured', 'framesPub':'Frames Published', 'framesDrop':'Frames Dropped', 
                 'segPub':'Seg Published', 'prodRate':'Frame Publish Rate', 'irecvd':'Interests Recvd'}
 
+# seconds every stress step is held; stats of its first stressWarmup seconds are ignored
+stressStepTime = 20.
+stressWarmup = 5.
+# a stress step is saturated if more than this share of captured frames is dropped...
+stressDropShare = 0.02
+# ...or frames are published slower than this share of the step's frame rate
+stressRateShare = 0.95
+
 class Publish(Base):
+    reportsStartup = True
+
     def __init__(self, options, *args, **kwargs):
         Base.__init__(self, options, args, kwargs)
 
     def run(self):
         self.setupVideoSize()
+        if self.options['--stress']:
+            startupProfile.report()
+            return self.runStress()
         self.createSourcePipe()
         self.createPreviewPipe()
         self.createOverlayFile()
         self.setupProducerConfig()
         self.setupSigningIdentity()
         self.setupVerificationPolicy()
+        startupProfile.mark('config and identity')
 
-        self.ffplayProc = startFfplay(self.previewPipe, self.videoWidth, self.videoHeight, 
-                                        overlayFile=self.overlayFile)
-        self.ffmpegProc = startFfmpeg(self.sourcePipe, self.previewPipe, self.videoWidth, self.videoHeight)
-        self.ndnrtcClientProc = startNdnrtcClient(self.configFile, self.signingIdentity, self.policyFile)
-        self.childrenProcs = [self.ffplayProc, self.ffmpegProc, self.ndnrtcClientProc]
-        
-        dumpOutput(self.ffmpegProc.stdout, os.path.join(self.runDir, 'ffmpeg.out'))
-        dumpOutput(self.ffmpegProc.stderr, os.path.join(self.runDir, 'ffmpeg.err'))
-        dumpOutput(self.ffplayProc.stdout, os.path.join(self.runDir, 'ffplay.out'))
-        dumpOutput(self.ffplayProc.stderr, os.path.join(self.runDir, 'ffplay.err'))
-        # dumpOutput(self.ndnrtcClientProc.stdout, os.path.join(self.runDir, 'ndnrtc-client.out'))
-        dumpOutput(self.ndnrtcClientProc.stderr, os.path.join(self.runDir, 'ndnrtc-client.err'))
+        # ffmpeg writes every frame once into the frame ring, which feeds
+        # both ndnrtc-client's source pipe and the preview; ring readers reopen
+        # their FIFOs, so any child can be restarted independently
+        from ndnrtc_stream.commands.utils.framering import FrameRing
+        self.frameRing = FrameRing(os.path.join(self.runDir, 'frames.ring'), 
+                                    rawFrameSize(self.videoWidth, self.videoHeight, self.pixelFormat))
+        if self.options['--latency']:
+            from ndnrtc_stream.commands.utils.watermark import Watermark
+            self.frameRing.watermark = Watermark(self.videoWidth, self.videoHeight, pixelFormat=self.pixelFormat)
+            logger.info('frames will be watermarked for latency measurement')
+        self.supervisor = Supervisor(self.drainer, self.runDir)
+        self.supervisor.add('ffplay', lambda: startFfplay(self.previewPipe, self.videoWidth, self.videoHeight, 
+                                                        overlayFile=self.overlayFile, pixelFormat=self.pixelFormat),
+                            restart=False)
+        self.supervisor.add('ffmpeg', lambda: startFfmpeg('pipe:1', None, self.videoWidth, self.videoHeight,
+                                                        self.options['--capture'], self.options['--device'], self.pixelFormat),
+                            onStart=self.startFrameRing, stdout=False)
+        self.supervisor.add('ndnrtc-client', lambda: startNdnrtcClient(self.configFile, self.signingIdentity, self.policyFile),
+                            activity=None if self.options['--config_file'] else self.lastStatTime,
+                            echo=sys.stdout if self.options['--verbose'] else None)
+        self.startSupervisor()
+        startupProfile.mark('start children')
 
+        self.startMetrics()
         self.startStatWatch()
-
-        proc = self.ndnrtcClientProc
-        # proc = self.ffmpegProc
-        # proc = self.ffplayProc
-        try:
-            while proc.poll() == None:
-                line = proc.stdout.readline()
-                if self.options['--verbose']:
-                    sys.stdout.write(line)
-        except:
-            pass
+        startupProfile.mark('start stat watch')
+        startupProfile.report()
+        self.supervise()
 
         self.stopChildren()
+        self.drainer.stop()
+        self.stopFrameRing()
         self.stopStatWatch()
+        self.stopMetrics()
         logger.info("completed")
 
     def createSourcePipe(self):
@@ -96,46 +126,90 @@ class Publish(Base):
         os.mkfifo(self.previewPipe)
         logger.debug("camera preview pipe: %s"%self.previewPipe)
 
+    def startFrameRing(self, ffmpegProc):
+        self.frameRing.startProducer(ffmpegProc.stdout)
+        if not self.frameRing.readers:
+            self.frameRing.addReader('camera', self.sourcePipe)
+            self.frameRing.addReader('preview', self.previewPipe)
+
+    def stopFrameRing(self):
+        self.frameRing.stop()
+        for (name, stats) in self.frameRing.readerStats().items():
+            logger.info('%s: %d frames, %d dropped, writes blocked for %.1f sec (pipe buffer %s bytes)'%(name, 
+                        stats['frames'], stats['drops'], stats['pipe']['stall_ms'] / 1000., stats['pipe']['pipe_size']))
+
     def createOverlayFile(self):
-        self.overlayFile = os.path.join(self.runDir, 'overlay.txt')
-        with io.open(self.overlayFile, 'w') as f:
-            f.write(u'-')
+        self.overlayFile = overlayPath(self.runDir)
+        self.overlay = OverlayWriter(self.overlayFile, self.renderOverlay)
+        logger.debug('overlay file %s'%self.overlayFile)
 
     def setupProducerConfig(self):
         global sampleConfig, streamName
         if self.options['--config_file']:
             self.config = libconf.load(self.options['--config_file'])
         else:
-            self.config = libconf.loads(sampleConfig)
+            self.config = deepcopy(sampleConfig)
             self.config['general']['log_path'] = self.runDir
             if self.options['--verbose']:
                 self.config['general']['log_level'] = 'all' 
             self.config['produce']['streams'][0]['source']['name'] = self.sourcePipe
+            if self.pixelFormat != defaultPixelFormat:
+                self.config['produce']['streams'][0]['source']['format'] = ndnrtcFrameFormats[self.pixelFormat]
             # customize other things, if options are available
-            if self.options['--video_size']:
-                # TODO
-                logger.debug("will setup video size here")
-            if self.options['--bitrate']:
-                # TODO
-                logger.debug("will setup bitrate here")
+            if self.threadLadder and self.options['--bitrate']:
+                logger.warn('--bitrate is ignored when --threads is specified')
             if self.options['--stream_name']:
                 streamName = self.options['--stream_name']
                 self.config['produce']['streams'][0]['name'] = self.options['--stream_name']
-            if self.options['--thread_name']:
-                self.config['produce']['streams'][0]['threads'][0]['name'] = self.options['--thread_name']
+            if self.threadLadder:
+                # simulcast: one encoder thread per rung, all fed from the same capture
+                if self.options['--thread_name']:
+                    logger.warn('--thread_name is ignored when --threads is specified')
+                template = self.config['produce']['streams'][0]['threads'][0]
+                threads = []
+                for rung in self.threadLadder:
+                    thread = deepcopy(template)
+                    thread['name'] = rung['name']
+                    thread['coder'] = encoderConfig(rung['width'], rung['height'], rung['bitrate'])
+                    threads.append(thread)
+                    logger.info('thread %s: %dx%d @ %d Kbps'%(rung['name'], rung['width'], rung['height'], rung['bitrate']))
+                self.config['produce']['streams'][0]['threads'] = tuple(threads)
+            else:
+                if self.options['--thread_name']:
+                    self.config['produce']['streams'][0]['threads'][0]['name'] = self.options['--thread_name']
+                if self.bitrateLadder:
+                    self.setEncoder(self.bitrateLadder[0])
+                elif self.options['--video_size'] or self.options['--bitrate']:
+                    self.setEncoder({'width': self.videoWidth, 'height': self.videoHeight, 
+                                     'bitrate': int(self.options['--bitrate']) if self.options['--bitrate'] else defaultBitrate})
+        self.configFile = os.path.join(self.runDir, 'producer.cfg')
+        self.saveProducerConfig()
 
+    def saveProducerConfig(self):
         # save config to a temp file
-        self.configFile = os.path.join(self.runDir, 'producer.cfg')
         with io.open(self.configFile, mode="w") as f:
             libconf.dump(self.config, f)
         logger.debug("saved config to %s"%self.configFile)
 
+    def setEncoder(self, rung):
+        thread = self.config['produce']['streams'][0]['threads'][0]
+        thread['coder'] = encoderConfig(rung['width'], rung['height'], rung['bitrate'], rung.get('frameRate'))
+        logger.info('thread %s: %dx%d @ %d Kbps, %d fps'%(thread['name'], rung['width'], rung['height'], rung['bitrate'],
+                    thread['coder']['frame_rate']))
+
+    def applyEncoder(self, rung):
+        """ Called by the bitrate controller: ndnrtc-client is restarted with new encoder settings. """
+        self.setEncoder(rung)
+        self.saveProducerConfig()
+        self.supervisor.restart('ndnrtc-client')
+
     def setupSigningIdentity(self):
+        keyType = parseKeyType(self.options['--key_type']) if self.options['--key_type'] else None
         if self.options['--identity'] or self.options['<prefix>']:
             identity = self.options['--identity'].strip() if self.options['--identity'] else self.options['<prefix>'].strip()
             res = None
             if not ndnsec_checkIdentity(identity):
-                res = ndnsec_createIdentity(identity)
+                res = ndnsec_createIdentity(identity, keyType)
                 if res:
                     logger.info('created self-signed identity %s'%identity)
             else:
@@ -151,6 +225,13 @@ class Publish(Base):
                 logger.error('failed to acquire default identity. set default identity using ndnsec')
                 raise Exception("failed to acquire default identity. Set default identity using ndnsec")
             self.signingIdentity = identity
+        # policies must expect signatures of the key data is actually signed with
+        actualKeyType = ndnsec_getKeyType(self.signingIdentity)
+        if keyType and actualKeyType and actualKeyType != keyType:
+            logger.error('identity %s has %s key, not %s. use another identity or create a new key with ndnsec key-gen'%(
+                         self.signingIdentity, actualKeyType, keyType))
+            raise Exception('identity %s has %s key'%(self.signingIdentity, actualKeyType))
+        self.keyType = keyType if keyType else (actualKeyType or defaultKeyType)
         
         if self.options['<prefix>']:
             self.prefix = self.options['<prefix>']
@@ -161,9 +242,15 @@ class Publish(Base):
         self.ndnrtcClientPrefix = os.path.join(self.prefix.strip(), utils.ndnrtcClientInstanceName)
 
         logger.info('will publish stream under %s'%self.ndnrtcClientPrefix)
-        logger.info('data will be signed using %s identity'%self.signingIdentity)
+        logger.info('data will be signed using %s identity (%s key)'%(self.signingIdentity, self.keyType))
 
     def setupVideoSize(self):
+        self.pixelFormat = parsePixelFormat(self.options['--pixel_format'])
+        self.threadLadder = parseThreadLadder(self.options['--threads']) if self.options['--threads'] else None
+        self.bitrateLadder = parseBitrateLadder(self.options['--adapt']) if self.options['--adapt'] else None
+        if self.threadLadder and self.bitrateLadder:
+            logger.error('--adapt can not be used with --threads')
+            raise Exception('--adapt can not be used with --threads')
         if self.options['--video_size']:
             resolution = self.options['--video_size'].split('x')
             if len(resolution) < 2:
@@ -171,6 +258,15 @@ class Publish(Base):
                 raise Exception('incorrect video size specified. must be in a form <width>x<height>')
             self.videoWidth = int(resolution[0])
             self.videoHeight = int(resolution[1])
+        elif self.threadLadder:
+            # capture at the highest resolution of the ladder
+            top = max(self.threadLadder, key=lambda t: t['width']*t['height'])
+            self.videoWidth = top['width']
+            self.videoHeight = top['height']
+        elif self.bitrateLadder:
+            # capture at the top rung, lower rungs are scaled down by the encoder
+            self.videoWidth = self.bitrateLadder[0]['width']
+            self.videoHeight = self.bitrateLadder[0]['height']
         else:
             self.videoWidth = 1280
             self.videoHeight = 720
@@ -178,45 +274,257 @@ class Publish(Base):
     def setupVerificationPolicy(self):
         self.policyFile = os.path.join(self.runDir, 'policy.conf')
         with io.open(self.policyFile, 'w') as f:
-            f.write(utils.samplePolicyAny)
+            f.write(verificationPolicy(self.keyType))
         logger.debug('setup policy file at %s'%self.policyFile)
 
     def startStatWatch(self):
         global statFileId, streamName
+        self.adapter = None
+        if self.bitrateLadder and self.options['--config_file']:
+            logger.warn('--adapt is ignored when --config_file is specified')
         if not self.options['--config_file']:
-            self.statFile = "%s%s-%s-%s.stat"%(statFileId, self.signingIdentity.replace('/','-'), utils.ndnrtcClientInstanceName, streamName)
-            filePath = os.path.join(self.runDir, self.statFile)
+            filePath = self.statFilePath()
             logger.debug('overlay stats are here %s'%filePath)
             
-            def onNewLine(statLine):
-                # logger.debug('new line %s'%(statLine))
-                overlay = "Publishing %s\n"%self.ndnrtcClientPrefix.replace('%', '\%')
-                stats = statLine.split('\t')
-                if len(stats) > 1:
-                    idx = 1
-                    for statKey in self.config['produce']['stat_gathering'][0]['statistics']:
-                        try:
-                            caption = statCaptions[statKey]
-                            value = float(stats[idx])
-                            if value - int(value) > 0:
-                                overlay += "\n%20s %-10.2f"%(caption, value)
-                            else:
-                                overlay += "\n%20s %-10d"%(caption, int(value))
-                            idx += 1
-                        except:
-                            logger.debug(sys.exc_info())
-                            pass
-                # logger.debug('overlay %s to %s'%(overlay, self.overlayFile))
-                with open_atomic(self.overlayFile, 'w') as f:
-                    f.write(overlay)
-
-            self.statTail = Tail(filePath, onNewLine)
+            threads = [t['name'] for t in self.config['produce']['streams'][0]['threads']]
+            labels = {'role': 'publish', 'prefix': self.ndnrtcClientPrefix, 'stream': streamName, 'thread': ','.join(threads)}
+            self.statStore = StatStore.fromConfig(self.config['produce']['stat_gathering'][0])
+            self.exportStats(self.statStore, labels, statCaptions)
+            if self.bitrateLadder:
+                self.adapter = BitrateController(self.bitrateLadder, self.statStore, self.applyEncoder)
+
+            def onNewLines(statLines):
+                if self.statStore.ingestLines(statLines):
+                    self.statTime = time.time()
+                    if self.adapter:
+                        self.adapter.update()
+                    self.overlay.update()
+
+            self.statTail = Tail(filePath, onNewLines=onNewLines)
             self.statTail.start()
+            self.overlay.start()
+            # camera and preview FIFOs (bench feeds its own frame ring)
+            for reader in self.frameRing.readers if getattr(self, 'frameRing', None) else []:
+                self.exportStats(reader.monitor.statStore, dict(labels, role='fifo', pipe=reader.name,
+                                 stream='%s-%s'%(streamName, reader.name)), fifoCaptions)
+            self.startLogWatch(labels)
+
+    def statFilePath(self):
+        global statFileId, streamName
+        self.statFile = "%s%s-%s-%s.stat"%(statFileId, self.signingIdentity.replace('/','-'), utils.ndnrtcClientInstanceName, streamName)
+        return os.path.join(self.runDir, self.statFile)
+
+    def lastStatTime(self):
+        return getattr(self, 'statTime', None)
 
     def stopStatWatch(self):
-        if self.statTail:
+        if getattr(self, 'statTail', None):
             self.statTail.stop()
+        self.stopLogWatch()
+        self.closeExportedStats()
+        self.overlay.stop(remove=True)
+
+    def renderOverlay(self):
+        overlay = "Publishing %s\n"%self.ndnrtcClientPrefix.replace('%', '\%')
+        for statKey in self.statStore.statistics:
+            if statKey in statCaptions:
+                overlay += formatStat(statCaptions[statKey], self.statStore.latest(statKey))
+        if self.adapter:
+            rung = self.adapter.rung
+            overlay += "\n%20s %-10s"%('Encoder', '%dx%d@%dK'%(rung['width'], rung['height'], rung['bitrate']))
+        return overlay
+
+    def runStress(self):
+        """ Throughput ceiling test of the publisher.
+
+        ndnrtc-client is fed the test pattern (or the --capture source, e.g. a
+        pre-recorded file) with encoder settings stepped through the --stress
+        ladder, each step held for --step_time seconds. Steps of the same
+        resolution and frame rate run from the lowest bitrate up, until the first
+        one that saturates the publisher (drops frames or publishes them slower
+        than captured). The JSON report has stats of every step and the
+        saturation point of every configuration. With several --key_type values,
+        the ladder is run once per key type, each with its own identity.
+        """
+        if self.options['--config_file']:
+            logger.error('--stress can not be used with --config_file')
+            raise Exception('--stress can not be used with --config_file')
+        steps = parseBitrateLadder(self.options['--stress'])
+        stepTime = float(self.options['--step_time']) if self.options['--step_time'] else stressStepTime
+        if stepTime <= stressWarmup:
+            logger.error('--step_time must be longer than %.0f seconds'%stressWarmup)
+            raise Exception('--step_time is too short')
+        keyTypes = [parseKeyType(k) for k in self.options['--key_type'].split(',')] if self.options['--key_type'] else [None]
+        if len(keyTypes) > 1 and (self.options['--identity'] or not self.options['<prefix>']):
+            logger.error('comparing key types requires <prefix> (an identity is created for every key type), not --identity')
+            raise Exception('comparing key types requires <prefix>')
+        self.bitrateLadder = None
+        self.createSourcePipe()
+        self.createOverlayFile()
+        self.setupProducerConfig()
+        self.stopped = False
+        self.childrenProcs = []
+        signal.signal(signal.SIGINT, self.stopStress)
+
+        configs = {}
+        for rung in steps:
+            rung.setdefault('frameRate', captureFrameRate)
+            configs.setdefault((rung['width'], rung['height'], rung['frameRate']), []).append(rung)
+        results = []
+        saturation = []
+        prefixes = []
+        prefix = self.options['<prefix>']
+        for keyType in keyTypes:
+            if self.stopped:
+                break
+            if len(keyTypes) > 1:
+                self.options['<prefix>'] = keyTypeIdentity(prefix, keyType)
+            self.options['--key_type'] = keyType
+            self.setupSigningIdentity()
+            self.setupVerificationPolicy()
+            prefixes.append(self.ndnrtcClientPrefix)
+            logger.info('stress testing %s: %d steps of %.0f seconds...'%(self.ndnrtcClientPrefix, len(steps), stepTime))
+            for key in sorted(configs):
+                saturated = None
+                sustained = None
+                segmentRates = []
+                for rung in sorted(configs[key], key=lambda r: r['bitrate']):
+                    if self.stopped:
+                        break
+                    result = self.runStressStep(len(results), rung, stepTime)
+                    results.append(result)
+                    if result['segment_rate'] is not None:
+                        segmentRates.append(result['segment_rate'])
+                    if result['saturated']:
+                        saturated = rung['bitrate']
+                        break
+                    sustained = rung['bitrate']
+                saturation.append({'video_size': '%dx%d'%key[:2], 'frame_rate': key[2], 'key_type': self.keyType,
+                                   'max_sustained_bitrate': sustained, 'saturated_at_bitrate': saturated,
+                                   'max_segment_rate': max(segmentRates) if segmentRates else None})
+                if saturated is not None:
+                    logger.info('%dx%d@%dfps, %s key: saturated at %d Kbps'%(key + (self.keyType, saturated)))
+                elif sustained is not None:
+                    logger.info('%dx%d@%dfps, %s key: sustained up to %d Kbps'%(key + (self.keyType, sustained)))
+
+        self.drainer.stop()
+        self.overlay.stop(remove=True)
+        report = {
+            'prefix': prefixes[0] if len(prefixes) == 1 else prefixes,
+            'pixel_format': self.pixelFormat,
+            'source': self.options['--capture'] or 'testpattern',
+            'step_time': stepTime,
+            'warmup': stressWarmup,
+            'stub': bool(self.options['--stub']),
+            'thresholds': {'drop_share': stressDropShare, 'rate_share': stressRateShare},
+            'saturation': saturation,
+            'steps': results
+        }
+        out = json.dumps(report, indent=2, sort_keys=True)
+        if self.options['--report']:
+            with io.open(self.options['--report'], 'wb') as f:
+                f.write(out.encode('utf-8'))
+            logger.info('report saved to %s'%self.options['--report'])
+        else:
+            sys.stdout.write(out + '\n')
+        logger.info("completed")
+
+    def stopStress(self, sig, frame):
+        logger.warn('caught stop signal...')
+        self.stopped = True
+
+    def runStressStep(self, idx, rung, stepTime):
+        """ Publishes with encoder settings of `rung` for `stepTime` seconds and
+        returns stats of the step. """
+        w, h, frameRate = rung['width'], rung['height'], rung['frameRate']
+        logger.info('step %d: %dx%d @ %d Kbps, %d fps'%(idx, w, h, rung['bitrate'], frameRate))
+        self.videoWidth, self.videoHeight = w, h
+        self.setEncoder(rung)
+        self.saveProducerConfig()
+        os.environ['NDNRTC_STUB_VIDEO_SIZE'] = '%dx%d'%(w, h)
+        os.environ['NDNRTC_STUB_PIXEL_FORMAT'] = self.pixelFormat
+
+        from ndnrtc_stream.commands.utils.framering import FrameRing
+        self.frameRing = FrameRing(os.path.join(self.runDir, 'frames-%d.ring'%idx), rawFrameSize(w, h, self.pixelFormat))
+        source = None
+        if self.options['--capture']:
+            ffmpegProc = startFfmpeg('pipe:1', None, w, h, self.options['--capture'], self.options['--device'],
+                                     self.pixelFormat, frameRate)
+            self.childrenProcs.append(ffmpegProc)
+            self.drainer.add(ffmpegProc.stderr, os.path.join(self.runDir, 'ffmpeg-%d.log'%idx))
+            self.frameRing.startProducer(ffmpegProc.stdout)
+        else:
+            from ndnrtc_stream.commands.utils.testpattern import TestPatternSource
+            source = TestPatternSource(self.frameRing, w, h, frameRate, self.pixelFormat)
+            source.start()
+        self.frameRing.addReader('camera', self.sourcePipe)
 
+        # stat files are appended to, so every step starts with a fresh one
+        statFile = self.statFilePath()
+        if os.path.exists(statFile):
+            os.remove(statFile)
+        statStore = StatStore.fromConfig(self.config['produce']['stat_gathering'][0])
+        measureFrom = time.time() + stressWarmup
+        def onNewLines(statLines):
+            if time.time() >= measureFrom:
+                statStore.ingestLines(statLines)
+        statTail = Tail(statFile, onNewLines=onNewLines)
+        statTail.start()
 
+        clientProc = startNdnrtcClient(self.configFile, self.signingIdentity, self.policyFile)
+        self.childrenProcs.append(clientProc)
+        self.drainer.add(clientProc.stdout, os.path.join(self.runDir, 'ndnrtc-client-%d.out'%idx))
+        self.drainer.add(clientProc.stderr, os.path.join(self.runDir, 'ndnrtc-client-%d.err'%idx))
+        from ndnrtc_stream.commands.utils.procstat import ProcessMonitor
+        monitor = ProcessMonitor()
+        monitor.add('ndnrtc-client', clientProc)
+        deadline = time.time() + stepTime
+        exited = False
+        while not self.stopped and time.time() < deadline:
+            time.sleep(min(1., max(0., deadline - time.time())))
+            monitor.sample()
+            if clientProc.poll() is not None:
+                exited = True
+                break
 
+        # children are reaped before the ring goes away, so no reader is left
+        # blocked on a FIFO and the ring's mapping is closed with this step
+        self.reapChildren()
+        if exited:
+            logger.error('ndnrtc-client exited prematurely (%s)'%clientProc.returncode)
+        statTail.stop()
+        if source:
+            source.stop()
+        self.frameRing.stop()
 
+        def rate(stat):
+            value = statStore.counterRate(stat) if stat in statStore.columns else float('nan')
+            return None if isNan(value) else value
+        captured, published, dropped = rate('framesCaptured'), rate('framesPub'), rate('framesDrop')
+        dropShare = dropped / captured if captured and dropped is not None else None
+        saturated = exited and not self.stopped
+        if published is None or dropShare is None:
+            logger.warn('step %d: no publisher stats'%idx)
+            saturated = True
+        elif dropShare > stressDropShare or published < stressRateShare * frameRate:
+            saturated = True
+        reader = self.frameRing.readerStats()['camera']
+        logger.info('step %d: published %.1f fps, dropped %.1f%%%s'%(idx, published or 0., (dropShare or 0.) * 100.,
+                    ' - saturated' if saturated else ''))
+        return {
+            'step': idx,
+            'video_size': '%dx%d'%(w, h),
+            'bitrate': rung['bitrate'],
+            'frame_rate': frameRate,
+            'key_type': self.keyType,
+            'saturated': saturated,
+            'capture_rate': captured,
+            'publish_rate': published,
+            'drop_rate': dropped,
+            'drop_share': dropShare,
+            'segment_rate': rate('segPub'),
+            'prod_rate': statStore.summary('prodRate') if 'prodRate' in statStore.columns else None,
+            'source': {'frames': source.frames if source else reader['frames'], 'late': source.late if source else None,
+                       'pipe_drops': reader['drops'], 'pipe_stall_ms': reader['pipe']['stall_ms']},
+            'processes': monitor.report()
+        }
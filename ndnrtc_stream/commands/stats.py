@@ -0,0 +1,227 @@
+"""stats command."""
+
+import io
+import json
+import logging
+import os
+
+from .base import *
+from ndnrtc_stream.commands.utils import *
+from ndnrtc_stream.commands.utils.statstore import *
+from ndnrtc_stream.commands.utils.statrecord import *
+from ndnrtc_stream.commands.utils.logevents import *
+
+logger = logging.getLogger(__name__)
+ch = logging.StreamHandler(sys.stdout)
+ch.setFormatter(CustomFormatter())
+logger.propagate = False
+logger.handlers = [ch]
+
+# bucket size (ms) for publisher/fetcher time alignment
+alignInterval = 1000.
+# counters compared between a publisher and its fetchers
+publishedFramesStat = 'framesPub'
+fetchedFramesStat = 'framesPlayed'
+# fetcher gauges reported alongside aligned frame rates
+alignedGauges = ['drdEst', 'jitterPlay']
+
+class Stats(Base):
+    """ Offline analysis of stat recordings made with --stats_dir.
+
+    Prints summaries of every recording (percentiles of gauges, totals and
+    rates of counters) and, if both publisher and fetcher recordings are
+    given, compares each fetcher with its publisher on a common timeline.
+    Event indexes of ndnrtc-client logs (see ClientLogWatch) are summarized
+    too, and their events are counted on the same timeline; --events lists
+    events with their log lines.
+    """
+
+    requiresNfd = False
+    runsChildren = False
+
+    def __init__(self, options, *args, **kwargs):
+        Base.__init__(self, options, args, kwargs)
+
+    def run(self):
+        files = self.statFiles()
+        recordings = [StatRecording(f) for f in files if not f.endswith(logEventsSuffix)]
+        self.eventIndexes = [LogEventIndex(f) for f in files if f.endswith(logEventsSuffix)]
+        if not recordings and not self.eventIndexes:
+            logger.error('no stat recordings found')
+            raise Exception('no stat recordings found')
+        report = {'recordings': [self.summarize(r) for r in recordings],
+                  'events': [self.summarizeEvents(i) for i in self.eventIndexes]}
+        if self.options['--events']:
+            types = None if self.options['--events'] == 'all' else self.options['--events'].split(',')
+            for t in types or []:
+                if t not in logEventTypes:
+                    logger.error('unknown event type %s. must be one of: %s'%(t, ', '.join(logEventTypes)))
+                    raise Exception('unknown event type %s'%t)
+            for (summary, index) in zip(report['events'], self.eventIndexes):
+                summary['list'] = index.query(types=types)
+        publishers = [r for r in recordings if r.labels.get('role') == 'publish']
+        fetchers = [r for r in recordings if r.labels.get('role') == 'fetch']
+        if publishers and fetchers:
+            report['alignment'] = []
+            for fetcher in fetchers:
+                publisher = self.findPublisher(fetcher, publishers)
+                if publisher:
+                    report['alignment'].append(self.align(publisher, fetcher))
+                else:
+                    logger.warn('no publisher recording for %s'%fetcher.labels.get('prefix'))
+        if self.options['--report']:
+            with io.open(self.options['--report'], 'wb') as f:
+                f.write(json.dumps(report, indent=2, sort_keys=True).encode('utf-8'))
+            logger.info('stats report saved to %s'%self.options['--report'])
+        sys.stdout.write(self.formatReport(report))
+
+    def statFiles(self):
+        files = []
+        for path in self.options['<stats_file>']:
+            if os.path.isdir(path):
+                files += sorted(os.path.join(path, f) for f in os.listdir(path)
+                            if f.endswith(statRecordSuffix) or f.endswith(logEventsSuffix))
+            else:
+                files.append(path)
+        return files
+
+    def summarize(self, recording):
+        allTimestamps = recording.timestamps()
+        timestamps = [t for t in allTimestamps if not isNan(t)]
+        summary = {'file': recording.fileName, 'labels': recording.labels, 'samples': len(recording),
+                   'start': timestamps[0] if timestamps else None,
+                   'duration': (timestamps[-1] - timestamps[0]) / 1000. if timestamps else None,
+                   'stats': {}}
+        for stat in recording.statistics:
+            values = recording.column(stat)
+            if stat in counterStats:
+                summary['stats'][stat] = {'total': counterTotal(values),
+                                          'rate': summarize(counterRates(allTimestamps, values))}
+            else:
+                summary['stats'][stat] = summarize([v for v in values if not isNan(v)])
+        return summary
+
+    def summarizeEvents(self, index):
+        timestamps = [t for t in index.recording.timestamps() if not isNan(t)]
+        return {'file': index.recording.fileName, 'labels': index.labels, 'log': index.logFile,
+                'start': timestamps[0] if timestamps else None,
+                'duration': (timestamps[-1] - timestamps[0]) / 1000. if timestamps else None,
+                'counts': index.counts()}
+
+    def findEvents(self, fetcher):
+        """ Event index of the ndnrtc-client which fetched a recording, if any. """
+        for index in self.eventIndexes:
+            if index.labels.get('role') == 'fetch' and \
+                fetcher.labels.get('prefix') in index.labels.get('prefix', '').split(','):
+                return index
+        return None
+
+    def findPublisher(self, fetcher, publishers):
+        for publisher in publishers:
+            if publisher.labels.get('prefix') == fetcher.labels.get('prefix') and \
+                publisher.labels.get('stream') == fetcher.labels.get('stream'):
+                return publisher
+        return publishers[0] if len(publishers) == 1 else None
+
+    def buckets(self, recording, stat, start, count, last):
+        """ Resamples a column into `count` buckets of `alignInterval` starting at `start`:
+        last value in a bucket if `last` is True (counters), mean otherwise.
+        """
+        sums = [0.] * count
+        ns = [0] * count
+        lastValues = [float('nan')] * count
+        if stat in recording.columns:
+            for (t, v) in zip(recording.timestamps(), recording.column(stat)):
+                idx = int((t - start) // alignInterval) if not isNan(t) else -1
+                if 0 <= idx < count and not isNan(v):
+                    sums[idx] += v
+                    ns[idx] += 1
+                    lastValues[idx] = v
+        if last:
+            return lastValues
+        return [sums[i] / ns[i] if ns[i] else float('nan') for i in range(count)]
+
+    def bucketRates(self, values):
+        rates = [float('nan')]
+        for (prev, cur) in zip(values, values[1:]):
+            rates.append((cur - prev) * 1000. / alignInterval if cur >= prev else float('nan'))
+        return rates
+
+    def align(self, publisher, fetcher):
+        pubTimes = [t for t in publisher.timestamps() if not isNan(t)]
+        fetchTimes = [t for t in fetcher.timestamps() if not isNan(t)]
+        alignment = {'publisher': publisher.fileName, 'fetcher': fetcher.fileName, 'series': []}
+        if not pubTimes or not fetchTimes:
+            return alignment
+        start = max(pubTimes[0], fetchTimes[0])
+        end = min(pubTimes[-1], fetchTimes[-1])
+        if end <= start:
+            logger.warn('%s and %s do not overlap in time'%(publisher.fileName, fetcher.fileName))
+            return alignment
+        count = int((end - start) // alignInterval) + 1
+        published = self.buckets(publisher, publishedFramesStat, start, count, True)
+        fetched = self.buckets(fetcher, fetchedFramesStat, start, count, True)
+        gauges = dict((g, self.buckets(fetcher, g, start, count, False)) for g in alignedGauges)
+        pubRates = self.bucketRates(published)
+        fetchRates = self.bucketRates(fetched)
+        events = [dict() for i in range(count)]
+        index = self.findEvents(fetcher)
+        if index:
+            alignment['events'] = index.recording.fileName
+            for eventType in logEventTypes:
+                for t in index.times(eventType):
+                    idx = int((t - start) // alignInterval)
+                    if 0 <= idx < count:
+                        events[idx][eventType] = events[idx].get(eventType, 0) + 1
+        for i in range(count):
+            row = {'t': (start + i * alignInterval) / 1000., 'publish_rate': pubRates[i], 'fetch_rate': fetchRates[i]}
+            for g in alignedGauges:
+                row[g] = gauges[g][i]
+            row = dict((k, None if isNan(v) else v) for (k, v) in row.items())
+            if index:
+                row['events'] = events[i]
+            alignment['series'].append(row)
+        pairs = [(p, f) for (p, f) in zip(pubRates, fetchRates) if not isNan(p) and not isNan(f)]
+        pubTotal = counterTotal(published)
+        fetchTotal = counterTotal(fetched)
+        alignment['overlap'] = (end - start) / 1000.
+        alignment['published_frames'] = pubTotal
+        alignment['fetched_frames'] = fetchTotal
+        alignment['delivery_ratio'] = fetchTotal / pubTotal if pubTotal else None
+        alignment['rate_deficit'] = summarize([p - f for (p, f) in pairs])
+        return alignment
+
+    def formatReport(self, report):
+        out = u''
+        for summary in report['recordings']:
+            labels = summary['labels']
+            out += u'%s %s stream %s thread %s: %d samples, %.1f sec\n'%(labels.get('role', '?'), labels.get('prefix', '?'),
+                        labels.get('stream', '?'), labels.get('thread', '?'), summary['samples'], summary['duration'] or 0.)
+            out += u'  %-18s %10s %10s %10s %10s %10s %10s\n'%('', 'mean', 'min', 'max', 'p50', 'p95', 'p99')
+            for (stat, s) in sorted(summary['stats'].items()):
+                if stat in counterStats:
+                    name, s = '%s/sec'%stat, s['rate']
+                else:
+                    name = stat
+                if s:
+                    out += u'  %-18s %10.2f %10.2f %10.2f %10.2f %10.2f %10.2f\n'%(name, s['mean'], s['min'], s['max'],
+                                                                                  s['p50'], s['p95'], s['p99'])
+            out += u'\n'
+        for summary in report['events']:
+            labels = summary['labels']
+            out += u'%s %s events: %s\n'%(labels.get('role', '?'), labels.get('prefix', '?'),
+                        ', '.join('%d %s'%(summary['counts'][t], t) for t in logEventTypes))
+            for event in summary.get('list', []):
+                out += u'  %s %-8s %s\n'%('%.3f'%event['t'] if event['t'] is not None else '?', event['event'],
+                                          event['line'] if event['line'] is not None else '@%d'%event['offset'])
+            out += u'\n'
+        for alignment in report.get('alignment', []):
+            out += u'%s -> %s: %.1f sec overlap\n'%(os.path.basename(alignment['publisher']),
+                                                   os.path.basename(alignment['fetcher']), alignment.get('overlap', 0.))
+            if alignment.get('delivery_ratio') is not None:
+                out += u'  frames published %d, fetched %d (%.1f%%)\n'%(alignment['published_frames'],
+                            alignment['fetched_frames'], 100. * alignment['delivery_ratio'])
+            if alignment.get('rate_deficit'):
+                d = alignment['rate_deficit']
+                out += u'  publish - fetch rate: mean %.2f, p95 %.2f, max %.2f frames/sec\n'%(d['mean'], d['p95'], d['max'])
+        return out
@@ -1 +1,5 @@
-from .utils import *
\ No newline at end of file
+# helpers every command needs; commands import the other modules they use themselves
+from .utils import *
+from .drain import *
+from .capture import *
+from .ndnseccache import *
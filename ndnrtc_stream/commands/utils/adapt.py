@@ -0,0 +1,110 @@
+""" Encoder bitrate adaptation """
+
+import logging, threading, time
+
+from .utils import captureFrameRate
+from .statstore import isNan
+
+logger = logging.getLogger(__name__)
+
+# rate window (ms) the controller looks at
+adaptWindow = 10000
+# share of captured frames dropped that makes the controller step down...
+adaptDropHigh = 0.1
+# ...and the share low enough to consider stepping up
+adaptDropLow = 0.01
+# publish rate (share of capture frame rate) that makes the controller step down
+adaptRateLow = 0.8
+# how long (sec) overload must last to step down, and recovery to step up
+adaptDownTime = 5.
+adaptUpTime = 30.
+# no decisions for this long (sec) after a change, so the restarted encoder settles
+adaptHoldTime = 10.
+
+def parseBitrateLadder(ladder):
+    """ Parses ladder "<width>x<height>@<kbps>[/<fps>],..." into a list of dicts
+    with width, height, bitrate (and frameRate, if given) keys, highest bitrate first.
+    """
+    rungs = []
+    for rung in ladder.split(','):
+        try:
+            size, bitrate = rung.strip().split('@')
+            w, h = size.split('x')
+            bitrate = bitrate.split('/')
+            rungs.append({'width': int(w), 'height': int(h), 'bitrate': int(bitrate[0])})
+            if len(bitrate) > 1:
+                rungs[-1]['frameRate'] = int(bitrate[1])
+        except ValueError:
+            logger.error('incorrect ladder rung %s. must be in a form <width>x<height>@<kbps>[/<fps>]'%rung)
+            raise Exception('incorrect ladder rung %s'%rung)
+    return sorted(rungs, key=lambda r: (r['bitrate'], r['width']*r['height']), reverse=True)
+
+class BitrateController(object):
+    """ Steps encoder settings along a ladder, based on publisher stats.
+
+    The publisher is considered overloaded if more than `adaptDropHigh`
+    of captured frames are dropped, or frames are published slower than
+    `adaptRateLow` of the capture frame rate; after `adaptDownTime` of
+    overload the controller steps one rung down. After `adaptUpTime` of
+    no overload (drops under `adaptDropLow`) it steps one rung up.
+    `onChange(rung)` is called to apply a new rung (e.g. rewrite the
+    config and restart ndnrtc-client); decisions are put on hold for
+    `adaptHoldTime` afterwards.
+    """
+
+    def __init__(self, ladder, statStore, onChange, frameRate=None):
+        self.ladder = ladder
+        self.statStore = statStore
+        self.onChange = onChange
+        self.frameRate = frameRate if frameRate else captureFrameRate
+        self.idx = 0
+        self.overloadSince = None
+        self.healthySince = None
+        self.holdUntil = 0
+        self.changes = []
+        self.lock = threading.Lock()
+
+    @property
+    def rung(self):
+        return self.ladder[self.idx]
+
+    def status(self):
+        """ Returns (overloaded, healthy) judging by the latest rates; None for unknown. """
+        rates = self.statStore.rates
+        captured = rates.rate('framesCaptured', adaptWindow)
+        dropped = rates.rate('framesDrop', adaptWindow)
+        published = self.statStore.mean('prodRate', 10)
+        if isNan(captured) or isNan(dropped) or captured <= 0:
+            return None, None
+        dropShare = dropped / captured
+        slow = not isNan(published) and published < adaptRateLow * self.frameRate
+        return (dropShare > adaptDropHigh or slow), (dropShare < adaptDropLow and not slow)
+
+    def update(self, now=None):
+        """ Called on new stats; returns the new rung if it was changed. """
+        now = now if now else time.time()
+        with self.lock:
+            if now < self.holdUntil:
+                return None
+            overloaded, healthy = self.status()
+            if overloaded is None:
+                return None
+            self.overloadSince = (self.overloadSince or now) if overloaded else None
+            self.healthySince = (self.healthySince or now) if healthy else None
+            step = 0
+            if overloaded and now - self.overloadSince >= adaptDownTime and self.idx < len(self.ladder) - 1:
+                step = 1
+            elif healthy and now - self.healthySince >= adaptUpTime and self.idx > 0:
+                step = -1
+            if not step:
+                return None
+            self.idx += step
+            self.overloadSince = self.healthySince = None
+            self.holdUntil = now + adaptHoldTime
+            self.changes.append({'time': now, 'width': self.rung['width'], 'height': self.rung['height'],
+                                 'bitrate': self.rung['bitrate']})
+            rung = self.rung
+        logger.info('%s encoder to %dx%d @ %d Kbps'%('lowering' if step > 0 else 'raising',
+                    rung['width'], rung['height'], rung['bitrate']))
+        self.onChange(rung)
+        return rung
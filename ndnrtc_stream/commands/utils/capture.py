@@ -0,0 +1,77 @@
+""" Capture backends and raw pixel formats """
+
+import logging, sys
+
+logger = logging.getLogger(__name__)
+
+# bits per pixel for raw video formats we know how to size
+pixelFormatBits = {'0rgb': 32, 'argb': 32, 'rgb0': 32, 'bgra': 32, 'bgr0': 32,
+                   'rgb24': 24, 'bgr24': 24, 'yuv420p': 12, 'nv12': 12}
+
+captureBackends = ['avfoundation', 'v4l2', 'file', 'lavfi']
+defaultCaptureDevices = {'avfoundation': '0', 'v4l2': '/dev/video0', 'lavfi': 'testsrc2'}
+defaultPixelFormat = '0rgb'
+# pixel formats frames can be carried in (ffmpeg names) and their names in
+# ndnrtc-client source/sink configs
+ndnrtcFrameFormats = {'0rgb': 'argb', 'yuv420p': 'i420', 'nv12': 'nv12'}
+pixelFormatAliases = {'i420': 'yuv420p', 'argb': '0rgb'}
+yuvPixelFormats = ['yuv420p', 'nv12']
+
+def rawFrameSize(w, h, pixelFormat='0rgb'):
+    return w * h * pixelFormatBits[pixelFormat] // 8
+
+def parsePixelFormat(name):
+    """ Returns ffmpeg name of a supported pixel format (default if `name` is empty). """
+    if not name:
+        return defaultPixelFormat
+    pixelFormat = pixelFormatAliases.get(name.lower(), name.lower())
+    if pixelFormat not in ndnrtcFrameFormats:
+        logger.error('unsupported pixel format %s. must be one of: 0rgb, i420, nv12'%name)
+        raise Exception('unsupported pixel format %s'%name)
+    return pixelFormat
+
+def defaultCaptureBackend():
+    return 'avfoundation' if sys.platform == 'darwin' else 'v4l2'
+
+def captureInputArgs(backend, device, w, h, frameRate, pixelFormat):
+    """ Returns ffmpeg input arguments for a capture backend:
+      avfoundation - macOS camera (device index, 0 by default)
+      v4l2         - Linux camera (device path, /dev/video0 by default)
+      file         - video file played in a loop at its native rate (device is the file path)
+      lavfi        - ffmpeg test source (source name, e.g. testsrc2, or a full filter graph)
+    """
+    if backend not in captureBackends:
+        logger.error('unknown capture backend %s. must be one of: %s'%(backend, ', '.join(captureBackends)))
+        raise Exception('unknown capture backend %s'%backend)
+    device = device if device else defaultCaptureDevices.get(backend)
+    size = '%dx%d'%(w, h)
+    if backend == 'avfoundation':
+        # cameras deliver nv12 or 0rgb natively
+        return ['-f', 'avfoundation',
+                '-pixel_format', 'nv12' if pixelFormat in yuvPixelFormats else '0rgb',
+                '-framerate', str(frameRate),
+                '-video_size', size,
+                '-i', device]
+    if backend == 'v4l2':
+        return ['-f', 'v4l2',
+                '-framerate', str(frameRate),
+                '-video_size', size,
+                '-i', device]
+    if backend == 'file':
+        if not device:
+            logger.error('file capture backend requires a file (--device)')
+            raise Exception('file capture backend requires a file')
+        return ['-re', '-stream_loop', '-1', '-i', device]
+    if '=' not in device:
+        device = '%s=size=%s:rate=%d'%(device, size, frameRate)
+    return ['-f', 'lavfi', '-i', device]
+
+def captureOutputArgs(backend, w, h, pixelFormat, frameRate=None):
+    """ Returns ffmpeg output arguments which make every frame `w`x`h` in `pixelFormat`
+    (and resample files to `frameRate`, if given). """
+    args = ['-pix_fmt', pixelFormat]
+    if backend in ('file', 'lavfi'):
+        args += ['-vf', 'scale=%d:%d'%(w, h)]
+    if backend == 'file' and frameRate:
+        args += ['-r', str(frameRate)]
+    return args
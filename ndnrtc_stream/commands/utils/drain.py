@@ -0,0 +1,186 @@
+""" Child output drainer """
+
+import errno, fcntl, io, logging, os, select, threading, time
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+drainReadSize = 64*1024
+drainFlushSize = 256*1024
+drainFlushInterval = 1.
+drainMaxFileSize = 32*1024*1024
+drainBackupCount = 2
+
+class RotatingLog(object):
+    """ Buffered, size-capped log file.
+
+    Writes are accumulated in memory and flushed once `drainFlushSize` bytes
+    are pending or on `flush()`. When the file would grow past `maxSize`,
+    it's rotated: <file> -> <file>.1 -> ... -> <file>.<backupCount>.
+    """
+
+    def __init__(self, fileName, maxSize=None, backupCount=None):
+        self.fileName = fileName
+        self.maxSize = maxSize if maxSize is not None else drainMaxFileSize
+        self.backupCount = backupCount if backupCount is not None else drainBackupCount
+        self.pending = []
+        self.pendingSize = 0
+        self.file = io.open(fileName, 'wb')
+        self.size = 0
+
+    def write(self, data):
+        self.pending.append(data)
+        self.pendingSize += len(data)
+        if self.pendingSize >= drainFlushSize:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = b''.join(self.pending)
+        self.pending = []
+        self.pendingSize = 0
+        while self.maxSize and self.size + len(data) > self.maxSize:
+            room = self.maxSize - self.size
+            self.file.write(data[:room])
+            data = data[room:]
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backupCount-1, 0, -1):
+            src = '%s.%d'%(self.fileName, i)
+            if os.path.exists(src):
+                os.rename(src, '%s.%d'%(self.fileName, i+1))
+        if self.backupCount > 0:
+            os.rename(self.fileName, '%s.1'%self.fileName)
+        self.file = io.open(self.fileName, 'wb')
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class OutputDrainer(object):
+    """ Drains output pipes of child processes into log files.
+
+    One thread multiplexes every registered pipe with select(): reads are
+    non-blocking and large, writes are buffered and flushed at most every
+    `flushInterval` seconds. A pipe is closed and unregistered on EOF.
+    The thread and its wake-up pipe only exist between `start()` and `stop()`.
+    """
+
+    def __init__(self, flushInterval=None, maxFileSize=None, backupCount=None):
+        self.flushInterval = flushInterval if flushInterval else drainFlushInterval
+        self.maxFileSize = maxFileSize
+        self.backupCount = backupCount
+        self.pipes = {}
+        self.lock = threading.Lock()
+        self.wakeup = None
+        self.running = False
+        self.thread = None
+
+    def add(self, pipe, fileName, echo=None):
+        """ Drains `pipe` into `fileName`; data is also copied to `echo` stream, if given. """
+        fd = pipe.fileno()
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        with self.lock:
+            self.pipes[fd] = (pipe, RotatingLog(fileName, self.maxFileSize, self.backupCount), echo)
+        logger.debug('draining fd %d into %s'%(fd, fileName))
+        if not self.running:
+            self.start()
+        else:
+            self.wake()
+
+    def start(self):
+        self.wakeup = os.pipe()
+        self.running = True
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=2.):
+        """ Waits up to `timeout` seconds for pipes to reach EOF, then closes everything. """
+        deadline = time.time() + timeout
+        while self.pipes and time.time() < deadline:
+            time.sleep(0.05)
+        self.running = False
+        self.wake()
+        if self.thread and self.thread.is_alive():
+            self.thread.join()
+        with self.lock:
+            for fd in list(self.pipes.keys()):
+                self.remove(fd)
+        for fd in self.wakeup or []:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.wakeup = None
+
+    def wake(self):
+        if not self.wakeup:
+            return
+        try:
+            os.write(self.wakeup[1], b'x')
+        except OSError:
+            pass
+
+    def run(self):
+        lastFlush = time.time()
+        while self.running:
+            with self.lock:
+                fds = list(self.pipes.keys())
+            try:
+                ready = select.select(fds + [self.wakeup[0]], [], [], self.flushInterval)[0]
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                if fd == self.wakeup[0]:
+                    os.read(fd, drainReadSize)
+                else:
+                    self.drain(fd)
+            if time.time() - lastFlush >= self.flushInterval:
+                with self.lock:
+                    for (pipe, log, echo) in self.pipes.values():
+                        log.flush()
+                lastFlush = time.time()
+
+    def drain(self, fd):
+        with self.lock:
+            if not fd in self.pipes:
+                return
+            pipe, log, echo = self.pipes[fd]
+            while True:
+                try:
+                    data = os.read(fd, drainReadSize)
+                except OSError as e:
+                    if e.errno in (errno.EAGAIN, errno.EINTR):
+                        return
+                    data = b''
+                if not data: # EOF
+                    logger.debug('closing %s'%log.fileName)
+                    self.remove(fd)
+                    return
+                log.write(data)
+                if echo:
+                    getattr(echo, 'buffer', echo).write(data)
+                    echo.flush()
+                if len(data) < drainReadSize:
+                    return
+
+    def remove(self, fd):
+        pipe, log, echo = self.pipes.pop(fd)
+        log.close()
+        try:
+            pipe.close()
+        except (OSError, IOError):
+            pass
+
+defaultDrainer = OutputDrainer()
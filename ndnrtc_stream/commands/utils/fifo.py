@@ -0,0 +1,127 @@
+""" FIFO tuning and instrumentation """
+
+import errno, fcntl, logging, os, sys, termios, time
+from array import array
+
+from .statstore import StatStore
+
+logger = logging.getLogger(__name__)
+
+# Linux fcntl commands (not exposed by the fcntl module before Python 3.10)
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
+pipeMaxSizeFile = '/proc/sys/fs/pipe-max-size'
+defaultPipeSize = 65536
+# whole frames a FIFO buffer should hold
+fifoFrames = 2
+# a write blocked for longer than this (ms) counts as a stall
+fifoStallThreshold = 1.
+fifoStats = ['fifoBytes', 'fifoFrames', 'fifoStallTime', 'fifoOccupancy']
+fifoCaptions = {'fifoBytes': 'Bytes through the pipe', 'fifoFrames': 'Frames through the pipe',
+                'fifoStallTime': 'Time writes were blocked by a full pipe (ms)',
+                'fifoOccupancy': 'Bytes queued in the pipe'}
+fifoCounters = ['fifoBytes', 'fifoFrames', 'fifoStallTime']
+
+def pipeMaxSize():
+    """ Largest pipe buffer an unprivileged process may ask for (None if unknown). """
+    try:
+        with open(pipeMaxSizeFile) as f:
+            return int(f.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+def setPipeSize(fd, frameSize, frames=None):
+    """ Grows the buffer of the pipe behind `fd` to hold `frames` whole frames
+    (as many as fit under pipe-max-size, at least the default size).
+    Returns the resulting size, or None where pipe size can't be changed.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    frames = frames if frames else fifoFrames
+    limit = pipeMaxSize()
+    size = frames * frameSize
+    if limit and size > limit:
+        size = max(limit // frameSize, 1) * frameSize if frameSize <= limit else limit
+    while size > defaultPipeSize:
+        try:
+            return fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EPERM, errno.EBUSY, errno.ENOMEM):
+                logger.debug('failed to set pipe size: %s'%e)
+                break
+            # over the per-user pipe limit: settle for less
+            size = size - frameSize if size > frameSize else size // 2
+    try:
+        return fcntl.fcntl(fd, F_GETPIPE_SZ)
+    except (IOError, OSError):
+        return None
+
+def pipeOccupancy(fd):
+    """ Number of bytes queued in the pipe behind `fd`. """
+    buf = array('i', [0])
+    fcntl.ioctl(fd, termios.FIONREAD, buf, True)
+    return buf[0]
+
+class FifoMonitor(object):
+    """ Transport stats of our end of a FIFO: bytes and frames passed,
+    time writes were blocked (the reader didn't keep up) and how full the pipe
+    was after every frame. Every frame adds a row to `statStore` (`fifoStats`).
+    """
+
+    def __init__(self, name, frameSize, frames=None):
+        self.name = name
+        self.frameSize = frameSize
+        self.frames = frames
+        self.statStore = StatStore(fifoStats, counters=fifoCounters)
+        self.fd = -1
+        self.pipeSize = None
+        self.bytes = 0
+        self.frameCount = 0
+        self.stallTime = 0.
+        self.maxOccupancy = 0
+
+    def attach(self, fd):
+        """ Called whenever the FIFO is (re)opened. """
+        self.fd = fd
+        self.pipeSize = setPipeSize(fd, self.frameSize, self.frames)
+        logger.debug('%s: pipe buffer %s bytes'%(self.name, self.pipeSize if self.pipeSize else 'default'))
+
+    def detach(self):
+        self.fd = -1
+
+    def write(self, view):
+        """ Writes a whole frame; returns False if the reader went away. """
+        written = 0
+        while written < len(view):
+            start = time.time()
+            try:
+                written += os.write(self.fd, view[written:])
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.EPIPE:
+                    return False
+                raise
+            finally:
+                blocked = (time.time() - start) * 1000.
+                if blocked > fifoStallThreshold:
+                    self.stallTime += blocked
+        self.onFrame(len(view))
+        return True
+
+    def onFrame(self, size):
+        """ Accounts a frame that went through the pipe (writers call write() instead). """
+        self.bytes += size
+        self.frameCount += 1
+        occupancy = float('nan')
+        if self.fd >= 0:
+            try:
+                occupancy = pipeOccupancy(self.fd)
+                self.maxOccupancy = max(self.maxOccupancy, occupancy)
+            except (IOError, OSError):
+                pass
+        self.statStore.add(time.time() * 1000., [self.bytes, self.frameCount, self.stallTime, occupancy])
+
+    def stats(self):
+        return {'pipe_size': self.pipeSize, 'bytes': self.bytes, 'stall_ms': self.stallTime,
+                'occupancy': self.statStore.summary('fifoOccupancy'), 'max_occupancy': self.maxOccupancy}
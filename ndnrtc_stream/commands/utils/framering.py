@@ -0,0 +1,273 @@
+""" Shared-memory frame ring """
+
+import errno, fcntl, io, logging, mmap, os, struct, sys, threading, time
+from threading import Thread
+
+from .fifo import FifoMonitor
+
+logger = logging.getLogger(__name__)
+
+frameRingSlots = 8
+frameRingMagic = b'NRFR'
+# magic, version, frame size, number of slots, last written sequence number
+frameRingHeader = struct.Struct('<4sIQIxxxxQ')
+# sequence number (0 while slot is being written), capture timestamp (ms)
+frameSlotHeader = struct.Struct('<QQ')
+pipeOpenRetry = 0.1
+
+class FrameRing(object):
+    """ mmap-backed ring of raw video frames.
+
+    A single producer reads frames straight from a pipe (ffmpeg's stdout) into
+    ring slots, so every frame is received and stored exactly once. Any number
+    of FrameRingReaders write frames from their slots into their own FIFOs,
+    without copying them. The producer never waits for readers: a reader that
+    falls more than a ring behind skips ahead to the newest frame and counts
+    the frames it dropped.
+
+    The backing file lives in the run directory, so the ring can also be
+    inspected by other processes (see `frameRingHeader`/`frameSlotHeader`).
+    """
+
+    def __init__(self, fileName, frameSize, slots=None):
+        self.fileName = fileName
+        self.frameSize = frameSize
+        self.slots = slots if slots else frameRingSlots
+        self.slotSize = frameSlotHeader.size + frameSize
+        size = frameRingHeader.size + self.slots * self.slotSize
+        with io.open(fileName, 'wb') as f:
+            f.truncate(size)
+        self.file = io.open(fileName, 'r+b')
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+        try:
+            self.buffer = memoryview(self.mmap)
+        except TypeError:
+            # python 2 mmap has no new-style buffer interface, a ctypes array over it does
+            import ctypes
+            self.buffer = memoryview((ctypes.c_char * size).from_buffer(self.mmap))
+        self.writeSeq = 0
+        self.writeHeader()
+        self.condition = threading.Condition()
+        self.running = False
+        self.producer = None
+        self.readers = []
+        # optional Watermark stamped into every frame at capture
+        self.watermark = None
+        logger.debug('frame ring %s: %d slots of %d bytes'%(fileName, self.slots, frameSize))
+
+    def writeHeader(self):
+        frameRingHeader.pack_into(self.mmap, 0, frameRingMagic, 1, self.frameSize, self.slots, self.writeSeq)
+
+    def slotOffset(self, seq):
+        return frameRingHeader.size + ((seq-1) % self.slots) * self.slotSize
+
+    def start(self):
+        self.running = True
+
+    def startProducer(self, pipe):
+        self.start()
+        # unbuffered reads straight into ring slots
+        pipe = io.FileIO(pipe.fileno(), 'r', closefd=False)
+        self.producer = Thread(target = self.produce, args = (pipe,))
+        self.producer.daemon = True
+        self.producer.start()
+
+    def produce(self, pipe):
+        while self.running:
+            seq = self.writeSeq + 1
+            offset = self.slotOffset(seq)
+            frameSlotHeader.pack_into(self.mmap, offset, 0, 0)
+            start = offset+frameSlotHeader.size
+            if not self.readFrame(pipe, self.buffer[start:offset+self.slotSize]):
+                break
+            timestamp = int(time.time()*1000)
+            if self.watermark:
+                self.watermark.stamp(self.mmap, start, seq, timestamp)
+            self.commit(seq, offset, timestamp)
+        # readers stay connected: a restarted producer may continue the ring
+        logger.debug('frame ring producer stopped after %d frames'%self.writeSeq)
+        with self.condition:
+            self.condition.notify_all()
+
+    def push(self, frame):
+        """ Writes one frame into the ring (for producers that generate frames in-process). """
+        seq = self.writeSeq + 1
+        offset = self.slotOffset(seq)
+        frameSlotHeader.pack_into(self.mmap, offset, 0, 0)
+        self.mmap[offset+frameSlotHeader.size:offset+self.slotSize] = frame
+        timestamp = int(time.time()*1000)
+        if self.watermark:
+            self.watermark.stamp(self.mmap, offset+frameSlotHeader.size, seq, timestamp)
+        self.commit(seq, offset, timestamp)
+
+    def commit(self, seq, offset, timestamp):
+        frameSlotHeader.pack_into(self.mmap, offset, seq, timestamp)
+        with self.condition:
+            self.writeSeq = seq
+            self.writeHeader()
+            self.condition.notify_all()
+
+    def readFrame(self, pipe, frame):
+        got = 0
+        while got < self.frameSize:
+            try:
+                n = pipe.readinto(frame[got:])
+            except (OSError, IOError) as e:
+                if e.errno == errno.EINTR:
+                    continue
+                return False
+            if not n:
+                return False
+            got += n
+        return True
+
+    def addReader(self, name, pipeName):
+        reader = FrameRingReader(self, name, pipeName)
+        self.readers.append(reader)
+        reader.start()
+        return reader
+
+    def waitFrame(self, afterSeq, timeout=None):
+        """ Blocks until a frame newer than `afterSeq` is available. Returns the newest sequence number. """
+        with self.condition:
+            while self.running and self.writeSeq <= afterSeq:
+                self.condition.wait(timeout)
+                if timeout:
+                    break
+            return self.writeSeq
+
+    def frameView(self, seq):
+        """ Returns a view of frame `seq` in its slot, None if it was already overwritten.
+        The slot may be reused while the view is used, see `hasFrame`. """
+        offset = self.slotOffset(seq)
+        if not self.hasFrame(seq):
+            return None
+        return self.buffer[offset+frameSlotHeader.size:offset+self.slotSize]
+
+    def hasFrame(self, seq):
+        """ True if the slot of frame `seq` still holds it. """
+        return frameSlotHeader.unpack_from(self.mmap, self.slotOffset(seq))[0] == seq
+
+    def readerStats(self):
+        return dict((r.name, r.stats()) for r in self.readers)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for r in self.readers:
+            r.stop()
+        for r in self.readers:
+            logger.debug('frame ring reader %s: %s'%(r.name, r.stats()))
+        if self.producer and self.producer.is_alive():
+            self.producer.join(1.)
+        if self.producer and self.producer.is_alive() or any(r.thread.is_alive() for r in self.readers):
+            # a thread stuck in a pipe call still uses the slots: leave the mapping to the GC
+            logger.debug('frame ring %s is still in use'%self.fileName)
+        else:
+            if hasattr(self.buffer, 'release'):
+                self.buffer.release()
+            self.buffer = None
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass
+        self.file.close()
+
+class FrameRingReader(object):
+    """ Feeds frames from a FrameRing into a FIFO.
+
+    Frames are written straight from their ring slots; a slot the producer
+    reused while its frame was being written (the reader fell a whole ring
+    behind mid-write) is counted in `torn`. The FIFO is (re)opened whenever
+    its consumer goes away, so a restarted consumer picks up from the newest
+    frame. Its buffer is sized in whole frames and its transport stats are
+    kept by `monitor` (see FifoMonitor).
+    """
+
+    def __init__(self, ring, name, pipeName):
+        self.ring = ring
+        self.name = name
+        self.pipeName = pipeName
+        self.readSeq = 0
+        self.frames = 0
+        self.drops = 0
+        self.torn = 0
+        self.running = False
+        self.fd = -1
+        self.monitor = FifoMonitor(name, ring.frameSize)
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join(1.)
+        if not self.thread.is_alive():
+            self.closePipe()
+
+    def stats(self):
+        return {'frames': self.frames, 'drops': self.drops, 'torn': self.torn,
+                'lag': max(0, self.ring.writeSeq - self.readSeq),
+                'pipe': self.monitor.stats()}
+
+    def openPipe(self):
+        while self.running:
+            try:
+                self.fd = os.open(self.pipeName, os.O_WRONLY | os.O_NONBLOCK)
+                flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+                fcntl.fcntl(self.fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+                self.monitor.attach(self.fd)
+                logger.debug('frame ring reader %s connected to %s'%(self.name, self.pipeName))
+                return True
+            except OSError as e:
+                if e.errno != errno.ENXIO: # ENXIO - no consumer yet
+                    raise
+                time.sleep(pipeOpenRetry)
+        return False
+
+    def closePipe(self):
+        if self.fd >= 0:
+            self.monitor.detach()
+            os.close(self.fd)
+            self.fd = -1
+
+    def run(self):
+        try:
+            while self.running:
+                if self.fd < 0 and not self.openPipe():
+                    break
+                newest = self.ring.waitFrame(self.readSeq, 0.5)
+                if newest <= self.readSeq:
+                    if not self.ring.running:
+                        break
+                    continue
+                seq = self.readSeq + 1
+                if newest - seq >= self.ring.slots - 1:
+                    # fell behind the producer, skip to the newest frame
+                    self.drops += newest - seq
+                    seq = newest
+                self.readSeq = seq
+                frame = self.ring.frameView(seq)
+                if frame is None:
+                    self.drops += 1
+                    continue
+                if self.writeFrame(frame):
+                    self.frames += 1
+                    if not self.ring.hasFrame(seq):
+                        self.torn += 1
+                del frame
+        except:
+            logger.debug(sys.exc_info())
+        self.closePipe()
+
+    def writeFrame(self, frame):
+        if not self.monitor.write(frame):
+            logger.debug('consumer of %s went away'%self.pipeName)
+            self.closePipe()
+            return False
+        return True
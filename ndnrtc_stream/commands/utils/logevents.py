@@ -0,0 +1,220 @@
+""" ndnrtc-client log analysis """
+
+import gzip, io, logging, os, re, threading, time
+from collections import deque
+
+from .statstore import StatStore, isNan
+from .statrecord import StatRecorder, StatRecording
+from .tail import Tail
+
+logger = logging.getLogger(__name__)
+
+logEventTypes = ['timeout', 'nack', 'rebuffer', 'state', 'keySkip']
+# cumulative count of every event type, in the order of logEventTypes
+logEventStats = ['logTimeouts', 'logNacks', 'logRebuffers', 'logStateChanges', 'logKeySkips']
+logEventCaptions = {'logTimeouts': 'Timeouts logged', 'logNacks': 'Nacks logged', 'logRebuffers': 'Rebufferings logged',
+                    'logStateChanges': 'State changes logged', 'logKeySkips': 'Key frame skips logged'}
+# a line is classified by the first pattern it matches (case-insensitive)
+logEventPatterns = [
+    ('rebuffer', br'rebuffer'),
+    ('keySkip', br'skip\w*\W+(?:\w+\W+){0,3}?key|key\W*frames?\W+(?:\w+\W+){0,2}?skip'),
+    ('state', br'state\W+(?:changed?|switch)|new state|->\s*\w+\s*state|state\s*->'),
+    ('nack', br'\bnack'),
+    ('timeout', br'time\s?out')
+]
+# keywords every event line has: lines without them are rejected by one search over
+# a whole (lowercased) batch, case-insensitive searches are much slower
+logEventFilter = re.compile(br'rebuffer|skip|state|nack|time\s?out')
+logEventClassifiers = [(logEventTypes.index(t), re.compile(p, re.I)) for (t, p) in logEventPatterns]
+# epoch seconds/milliseconds or a date and time at the start of a line, optionally in brackets
+logTimestampPattern = re.compile(br'^\s*\[?\s*(?:(\d{10}(?:\.\d+)?|\d{13}(?:\.\d+)?)\b|'
+                                 br'(\d{4})-(\d\d)-(\d\d)[ T](\d\d):(\d\d):(\d\d)(?:[.,](\d+))?)')
+# events kept in memory for live queries
+logEventCapacity = 10000
+logEventTextSize = 240
+logEventsSuffix = '.nrevents'
+
+def logEventsName(role, prefix, stream, run):
+    # offsets are only valid for one log, so every run gets its own index
+    return '%s%s-%s.%s%s'%(role, prefix.replace('/', '-'), stream, run, logEventsSuffix)
+
+def logLineTimestamp(line):
+    """ Timestamp (ms) of a log line, NaN if the line doesn't start with one. """
+    m = logTimestampPattern.match(line)
+    if not m:
+        return float('nan')
+    if m.group(1):
+        value = float(m.group(1))
+        return value if len(m.group(1).split(b'.')[0]) == 13 else value * 1000.
+    fields = [int(g) for g in m.groups()[1:7]]
+    fraction = m.group(8)
+    ms = float(b'0.' + fraction) * 1000. if fraction else 0.
+    return time.mktime(tuple(fields) + (0, 0, -1)) * 1000. + ms
+
+def classifyLogLine(line):
+    """ Index of the event type (in logEventTypes) of a log line, None if it's not an event. """
+    for (idx, pattern) in logEventClassifiers:
+        if pattern.search(line):
+            return idx
+    return None
+
+def scanLogEvents(data, offset=0):
+    """ Yields (timestamp, event type index, offset, line) of every event in a chunk
+    of complete log lines that starts at `offset` in the log. Lines without
+    a timestamp of their own get the timestamp of the last line that had one
+    (NaN if there was none).
+    """
+    nextLine = 0
+    lastTimestamp = float('nan')
+    for m in logEventFilter.finditer(data.lower()):
+        start = data.rfind(b'\n', 0, m.start()) + 1
+        if start < nextLine:
+            continue
+        end = data.find(b'\n', m.end())
+        end = end if end >= 0 else len(data)
+        nextLine = end + 1
+        line = data[start:end]
+        eventType = classifyLogLine(line)
+        if eventType is None:
+            continue
+        timestamp = logLineTimestamp(line)
+        if isNan(timestamp):
+            timestamp = lastTimestamp
+        else:
+            lastTimestamp = timestamp
+        yield timestamp, eventType, offset + start, line
+
+class LogEventStore(object):
+    """ Time-indexed events of one ndnrtc-client log.
+
+    The `capacity` most recent events are kept in memory for live queries;
+    cumulative counts of every event type are kept in `statStore`
+    (`logEventStats`, timestamped like ndnrtc-client stats, so it can be
+    exported and recorded like any other stat stream). If `recorder` is
+    given, every event is also appended to it as a row of (event type index,
+    log offset) - an index of the log that can be queried offline with
+    LogEventIndex.
+    """
+
+    def __init__(self, capacity=None, recorder=None):
+        self.events = deque(maxlen=capacity if capacity else logEventCapacity)
+        self.counts = [0] * len(logEventTypes)
+        self.statStore = StatStore(logEventStats, counters=logEventStats)
+        self.recorder = recorder
+        self.lock = threading.Lock()
+
+    def add(self, events):
+        """ Adds a batch of (timestamp, event type index, offset, line) events. """
+        last = None
+        with self.lock:
+            for (timestamp, eventType, offset, line) in events:
+                self.counts[eventType] += 1
+                text = line[:logEventTextSize].decode('utf-8', 'replace')
+                self.events.append((timestamp, eventType, offset, text))
+                if self.recorder:
+                    self.recorder.write(timestamp, [eventType, offset])
+                last = timestamp
+            counts = list(self.counts)
+        if last is not None:
+            self.statStore.add(last, counts)
+
+    def query(self, start=None, end=None, types=None):
+        """ Events (dicts) in [start, end] ms of given types, oldest first. """
+        with self.lock:
+            events = list(self.events)
+        return [logEvent(t, e, o, text) for (t, e, o, text) in events
+                if (start is None or t >= start) and (end is None or t <= end) and
+                   (types is None or logEventTypes[e] in types)]
+
+    def summary(self):
+        with self.lock:
+            return dict(zip(logEventTypes, self.counts))
+
+def logEvent(timestamp, eventType, offset, text):
+    return {'t': None if isNan(timestamp) else timestamp / 1000., 'event': logEventTypes[eventType],
+            'offset': offset, 'line': text}
+
+class ClientLogWatch(object):
+    """ Follows an ndnrtc-client log (which grows huge with log_level "all")
+    and feeds its events into a LogEventStore, with bounded memory: the log
+    is read in batches (see Tail) and only lines matching `logEventFilter`
+    are ever decoded. Lines without a timestamp are stamped with the time
+    they were read. If `indexFile` is given, the event index is written there.
+    With `fromStart`, events already in the log are indexed too (for a log
+    the client was started with a moment ago), otherwise only new ones.
+    """
+
+    def __init__(self, logFile, indexFile=None, labels=None, capacity=None, fromStart=False):
+        self.logFile = logFile
+        self.indexFile = indexFile
+        recorder = None
+        if indexFile:
+            recorder = StatRecorder(indexFile, ['event', 'offset'],
+                                    dict(labels or {}, log=os.path.abspath(logFile), events=','.join(logEventTypes)))
+        self.store = LogEventStore(capacity, recorder)
+        self.tail = Tail(logFile, onNewData=self.onData, fromStart=fromStart)
+
+    def start(self):
+        self.tail.start()
+        logger.debug('parsing events of %s'%self.logFile)
+
+    def stop(self):
+        self.tail.stop()
+        if self.store.recorder:
+            self.store.recorder.close()
+
+    def onData(self, data, offset):
+        now = time.time() * 1000.
+        self.store.add((now if isNan(t) else t, e, o, line) for (t, e, o, line) in scanLogEvents(data, offset))
+
+class LogEventIndex(object):
+    """ Offline view of an event index written by ClientLogWatch. Lines of
+    events are read from the log by offset, as long as the log (or its gzipped
+    copy, once the run is archived) is around; an index kept in the run
+    directory finds the log next to it, even if the run was moved.
+    """
+
+    def __init__(self, fileName):
+        self.recording = StatRecording(fileName)
+        self.labels = self.recording.labels
+        self.logFile = self.labels.get('log')
+
+    def __len__(self):
+        return len(self.recording)
+
+    def counts(self):
+        counts = [0] * len(logEventTypes)
+        for e in self.recording.column('event'):
+            counts[int(e)] += 1
+        return dict(zip(logEventTypes, counts))
+
+    def times(self, eventType):
+        """ Timestamps (ms) of all events of a type. """
+        idx = logEventTypes.index(eventType)
+        return [t for (t, e) in zip(self.recording.timestamps(), self.recording.column('event')) if int(e) == idx]
+
+    def query(self, start=None, end=None, types=None):
+        """ Events (dicts) in [start, end] ms of given types, with their log lines. """
+        rows = [(t, int(e), int(o)) for (t, e, o) in zip(self.recording.timestamps(), self.recording.column('event'),
+                                                           self.recording.column('offset'))
+                if (start is None or t >= start) and (end is None or t <= end) and
+                   (types is None or logEventTypes[int(e)] in types)]
+        log = None
+        if rows and self.logFile:
+            nearby = os.path.join(os.path.dirname(os.path.abspath(self.recording.fileName)), os.path.basename(self.logFile))
+            for fileName in (self.logFile, self.logFile + '.gz', nearby, nearby + '.gz'):
+                if os.path.exists(fileName):
+                    log = gzip.open(fileName, 'rb') if fileName.endswith('.gz') else io.open(fileName, 'rb')
+                    break
+        events = []
+        try:
+            for (t, e, o) in rows:
+                text = None
+                if log:
+                    log.seek(o)
+                    text = log.readline(logEventTextSize).rstrip(b'\n').decode('utf-8', 'replace')
+                events.append(logEvent(t, e, o, text))
+        finally:
+            if log:
+                log.close()
+        return events
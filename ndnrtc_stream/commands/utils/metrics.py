@@ -0,0 +1,151 @@
+""" Prometheus/OpenMetrics exporter """
+
+import logging, os, re, threading
+from threading import Thread
+
+from .statstore import counterStats, isNan
+
+logger = logging.getLogger(__name__)
+
+metricsPrefix = 'ndnrtc_'
+openMetricsType = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+prometheusType = 'text/plain; version=0.0.4; charset=utf-8'
+
+def metricName(stat):
+    return metricsPrefix + re.sub('([a-z0-9])([A-Z])', r'\1_\2', stat).lower()
+
+def labelValue(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsExporter(object):
+    """ Serves latest values of registered StatStores over HTTP (TCP port or
+    Unix socket) in Prometheus text or OpenMetrics format.
+
+    Scrapes never touch stat lines: they read numbers already parsed into the
+    stores, and the rendered page is reused until any store gets new data.
+    """
+
+    def __init__(self, port=None, socketPath=None, host=''):
+        self.sources = []
+        self.lock = threading.Lock()
+        self.cache = {}
+        exporter = self
+        # imported here, so commands without metrics don't pay for the HTTP server at startup
+        try:
+            from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+            from SocketServer import ThreadingMixIn, UnixStreamServer
+        except ImportError: # python 3
+            from http.server import BaseHTTPRequestHandler, HTTPServer
+            from socketserver import ThreadingMixIn, UnixStreamServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                openMetrics = 'application/openmetrics-text' in (self.headers.get('Accept') or '')
+                body = exporter.render(openMetrics).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', openMetricsType if openMetrics else prometheusType)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def address_string(self):
+                return str(self.client_address)
+
+            def log_message(self, format, *args):
+                pass
+
+        if socketPath:
+            if os.path.exists(socketPath):
+                os.remove(socketPath)
+            class Server(ThreadingMixIn, UnixStreamServer):
+                daemon_threads = True
+            self.server = Server(socketPath, Handler)
+            self.address = socketPath
+        else:
+            class Server(ThreadingMixIn, HTTPServer):
+                daemon_threads = True
+                allow_reuse_address = True
+            self.server = Server((host, int(port)), Handler)
+            self.address = '%s:%d'%(host or '*', self.server.server_address[1])
+        self.socketPath = socketPath
+        self.thread = Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        logger.info('serving metrics on %s'%self.address)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socketPath and os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+
+    def addStore(self, store, labels, captions=None):
+        """ Registers a StatStore; `labels` is a dict (e.g. prefix, stream, thread). """
+        labelStr = ','.join('%s="%s"'%(k, labelValue(str(v))) for (k, v) in sorted(labels.items()))
+        with self.lock:
+            self.sources.append((store, labelStr, captions or {}))
+            self.cache = {}
+
+    def render(self, openMetrics=False):
+        with self.lock:
+            version = tuple(store.count for (store, l, c) in self.sources)
+            cached = self.cache.get(openMetrics)
+            if cached and cached[0] == version:
+                return cached[1]
+            families = {}
+            order = []
+            rateFamilies = {}
+            rateOrder = []
+            for (store, labelStr, captions) in self.sources:
+                row = store.latestRow()
+                for stat in store.statistics:
+                    value = row[stat]
+                    if isNan(value):
+                        continue
+                    if not stat in families:
+                        families[stat] = []
+                        order.append((stat, captions.get(stat, stat)))
+                    families[stat].append((labelStr, value))
+                for (stat, rates) in store.rates.snapshot().items():
+                    rateStat = stat + 'Rate'
+                    if not rateStat in rateFamilies:
+                        rateFamilies[rateStat] = []
+                        rateOrder.append((rateStat, 'Per-second rate of %s'%captions.get(stat, stat)))
+                    for (window, value) in sorted(rates.items()):
+                        if not isNan(value):
+                            rateFamilies[rateStat].append(('%s,window="%s"'%(labelStr, window), value))
+            lines = []
+            for (stat, caption) in order:
+                name = metricName(stat)
+                isCounter = stat in counterStats
+                family = name if (openMetrics or not isCounter) else name + '_total'
+                sample = name + '_total' if isCounter else name
+                lines.append('# HELP %s %s'%(family, caption))
+                lines.append('# TYPE %s %s'%(family, 'counter' if isCounter else 'gauge'))
+                for (labelStr, value) in families[stat]:
+                    lines.append('%s{%s} %s'%(sample, labelStr, repr(float(value))))
+            # counter rates (sliding windows and EWMA) are gauges
+            for (stat, caption) in rateOrder:
+                name = metricName(stat)
+                lines.append('# HELP %s %s'%(name, caption))
+                lines.append('# TYPE %s gauge'%name)
+                for (labelStr, value) in rateFamilies[stat]:
+                    lines.append('%s{%s} %s'%(name, labelStr, repr(float(value))))
+            if openMetrics:
+                lines.append('# EOF')
+            text = '\n'.join(lines) + '\n'
+            self.cache[openMetrics] = (version, text)
+            return text
+
+def startMetricsExporter(options):
+    """ Starts exporter if --metrics_port or --metrics_socket option is given. """
+    if options.get('--metrics_port') or options.get('--metrics_socket'):
+        exporter = MetricsExporter(port=options.get('--metrics_port'), socketPath=options.get('--metrics_socket'))
+        exporter.start()
+        return exporter
+    return None
@@ -0,0 +1,99 @@
+""" ndnsec cache """
+
+import hashlib, io, json, logging, os
+
+logger = logging.getLogger(__name__)
+
+ndnsecCacheFile = os.path.join(os.path.expanduser('~'), '.cache', 'ndnrtc-stream', 'ndnsec.json')
+
+def ndnHome():
+    return os.path.join(os.path.expanduser('~'), '.ndn')
+
+def locatorPath(envVar, defaultPath):
+    # locators look like "pib-sqlite3:/path/to/dir" or "tpm-file:"
+    locator = os.environ.get(envVar, '')
+    if ':' in locator and locator.split(':', 1)[1]:
+        return os.path.expanduser(locator.split(':', 1)[1])
+    return defaultPath
+
+def pibTpmState():
+    """ Returns a digest of everything ndnsec output depends on: PIB database,
+    file TPM directory and client.conf (modification times and sizes).
+    """
+    home = ndnHome()
+    pibDir = locatorPath('NDN_CLIENT_PIB', home)
+    paths = [os.path.join(home, 'client.conf'),
+             os.path.join(pibDir, 'pib.db'),
+             os.path.join(pibDir, 'pib.db-wal'),
+             os.path.join(pibDir, 'pib.db-journal'),
+             locatorPath('NDN_CLIENT_TPM', os.path.join(home, 'ndnsec-key-file'))]
+    state = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            state.append('%s:%r:%d'%(p, st.st_mtime, st.st_size))
+        except OSError:
+            state.append('%s:-'%p)
+    state.append(os.environ.get('NDN_CLIENT_PIB', ''))
+    state.append(os.environ.get('NDN_CLIENT_TPM', ''))
+    return hashlib.sha1('\n'.join(state).encode('utf-8')).hexdigest()
+
+class NdnsecCache(object):
+    """ On-disk cache of ndnsec query results (identity list, default identity,
+    dumped certificates).
+
+    Entries are valid as long as PIB/TPM state stays the same; any change of
+    it (new key, new default, deleted identity) drops the whole cache.
+    """
+
+    def __init__(self, fileName=None):
+        self.fileName = fileName if fileName else ndnsecCacheFile
+        self.entries = None
+        self.state = None
+
+    def load(self):
+        state = pibTpmState()
+        if self.entries is not None and state == self.state:
+            return
+        self.state = state
+        self.entries = {}
+        try:
+            with io.open(self.fileName, 'r') as f:
+                cached = json.load(f)
+            if cached.get('state') == state:
+                self.entries = cached.get('entries', {})
+            else:
+                logger.debug('PIB/TPM state changed, dropping ndnsec cache')
+        except (IOError, OSError, ValueError):
+            pass
+
+    def get(self, key):
+        self.load()
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.load()
+        self.entries[key] = value
+        self.save()
+
+    def invalidate(self):
+        self.entries = None
+        self.state = None
+        try:
+            os.remove(self.fileName)
+        except OSError:
+            pass
+
+    def save(self):
+        try:
+            cacheDir = os.path.dirname(self.fileName)
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+            tmpFileName = '%s.%d'%(self.fileName, os.getpid())
+            with io.open(tmpFileName, 'wb') as f:
+                f.write(json.dumps({'state': self.state, 'entries': self.entries}).encode('utf-8'))
+            os.rename(tmpFileName, self.fileName)
+        except (IOError, OSError) as e:
+            logger.debug('failed to save ndnsec cache: %s'%e)
+
+ndnsecCache = NdnsecCache()
@@ -0,0 +1,74 @@
+""" Overlay writer """
+
+import io, logging, os, sys, threading
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+overlayInterval = 0.33
+overlayShmDir = '/dev/shm'
+
+def overlayPath(runDir, name='overlay', useShm=True):
+    """ Picks overlay file location: /dev/shm if available, run directory otherwise. """
+    if useShm and os.path.isdir(overlayShmDir) and os.access(overlayShmDir, os.W_OK):
+        return os.path.join(overlayShmDir, '%s.%s.txt'%(os.path.basename(runDir), name))
+    return os.path.join(runDir, '%s.txt'%name)
+
+class OverlayWriter(object):
+    """ Periodically renders overlay text for ffplay's drawtext filter.
+
+    `render()` is called at most once every `interval` seconds, and only after
+    `update()` signalled new data. The file is rewritten (via rename of a fixed
+    temporary file, so ffplay never sees partial text) only when the rendered
+    text has changed.
+    """
+
+    def __init__(self, fileName, render, interval=None):
+        self.fileName = fileName
+        self.tmpFileName = fileName + '.tmp'
+        self.render = render
+        self.interval = interval if interval else overlayInterval
+        self.text = None
+        self.dirty = False
+        self.writes = 0
+        self.stopEvent = threading.Event()
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+        self.write(u'-')
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, remove=False):
+        self.stopEvent.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        logger.debug('overlay %s rewritten %d times'%(self.fileName, self.writes))
+        if remove:
+            for f in [self.fileName, self.tmpFileName]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+    def update(self):
+        self.dirty = True
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            if not self.dirty:
+                continue
+            self.dirty = False
+            try:
+                text = self.render()
+                if text != self.text:
+                    self.write(text)
+            except:
+                logger.debug(sys.exc_info())
+
+    def write(self, text):
+        if not isinstance(text, type(u'')):
+            text = text.decode('utf-8')
+        with io.open(self.tmpFileName, 'w') as f:
+            f.write(text)
+        os.rename(self.tmpFileName, self.fileName)
+        self.text = text
+        self.writes += 1
@@ -0,0 +1,61 @@
+""" Process resource usage """
+
+import os, resource, time
+
+try:
+    clockTicks = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    clockTicks = 100
+
+def processUsage(pid):
+    """ Returns CPU time and memory usage of a running process (Linux /proc only):
+    dict with cpu_seconds, rss_kb and max_rss_kb, or None if not available.
+    """
+    try:
+        with open('/proc/%d/stat'%pid) as f:
+            # skip "pid (comm)", comm may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        usage = {'cpu_seconds': (int(fields[11]) + int(fields[12])) / float(clockTicks)}
+        with open('/proc/%d/status'%pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss_kb'] = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    usage['max_rss_kb'] = int(line.split()[1])
+        return usage
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+def selfUsage():
+    """ Resource usage of this process (portable, via getrusage). """
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    maxRss = ru.ru_maxrss if os.uname()[0] != 'Darwin' else ru.ru_maxrss // 1024
+    return {'cpu_seconds': ru.ru_utime + ru.ru_stime, 'max_rss_kb': maxRss}
+
+class ProcessMonitor(object):
+    """ Tracks usage of a set of named processes, keeping the last sample taken
+    while each of them was alive.
+    """
+
+    def __init__(self):
+        self.procs = {}
+        self.usage = {}
+        self.started = time.time()
+
+    def add(self, name, proc):
+        self.procs[name] = proc
+
+    def sample(self):
+        for (name, proc) in self.procs.items():
+            if proc.poll() is None:
+                usage = processUsage(proc.pid)
+                if usage:
+                    self.usage[name] = usage
+
+    def report(self):
+        elapsed = time.time() - self.started
+        report = {}
+        for (name, usage) in list(self.usage.items()) + [('ndnrtc-stream', selfUsage())]:
+            report[name] = dict(usage)
+            report[name]['cpu_percent'] = 100. * usage['cpu_seconds'] / elapsed if elapsed > 0 else None
+        return report
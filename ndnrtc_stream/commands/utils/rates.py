@@ -0,0 +1,103 @@
+""" Counter rates """
+
+import math, threading
+from collections import deque
+
+# sliding windows, ms of stat timestamps
+rateWindows = (1000, 10000, 60000)
+# EWMA time constant, ms
+rateTimeConstant = 2000.
+
+def windowName(window):
+    return '%ds'%(window // 1000) if window % 1000 == 0 else '%dms'%window
+
+class CounterRate(object):
+    """ Per-second rate of one monotonic counter.
+
+    Uses stat line timestamps (ms), not arrival time, so lines delivered in
+    a batch don't produce spikes. A counter going down is treated as a reset
+    (ndnrtc-client restart): the new value counts from zero. The EWMA is
+    time-aware, i.e. weights every interval by its length.
+    """
+
+    def __init__(self, maxWindow=None, timeConstant=None):
+        self.maxWindow = maxWindow if maxWindow else max(rateWindows)
+        self.timeConstant = timeConstant if timeConstant else rateTimeConstant
+        # (timestamp, reset-corrected cumulative value)
+        self.samples = deque()
+        self.lastValue = None
+        self.offset = 0.
+        self.ewma = float('nan')
+
+    def add(self, timestamp, value):
+        if math.isnan(timestamp) or math.isnan(value):
+            return
+        if self.samples:
+            lastTime, lastTotal = self.samples[-1]
+            if timestamp <= lastTime:
+                return
+            if value < self.lastValue:
+                self.offset += self.lastValue
+            total = value + self.offset
+            dt = timestamp - lastTime
+            instant = (total - lastTotal) * 1000. / dt
+            if math.isnan(self.ewma):
+                self.ewma = instant
+            else:
+                self.ewma += (1. - math.exp(-dt / self.timeConstant)) * (instant - self.ewma)
+        else:
+            total = value
+        self.lastValue = value
+        self.samples.append((timestamp, total))
+        # keep one sample at or before the start of the largest window
+        while len(self.samples) > 2 and self.samples[1][0] <= timestamp - self.maxWindow:
+            self.samples.popleft()
+
+    def rate(self, window):
+        """ Average rate over the last `window` ms (NaN until two samples are available). """
+        if len(self.samples) < 2:
+            return float('nan')
+        newestTime, newestTotal = self.samples[-1]
+        start = self.samples[0]
+        for sample in reversed(self.samples):
+            start = sample
+            if sample[0] <= newestTime - window:
+                break
+        if start[0] >= newestTime:
+            return float('nan')
+        return (newestTotal - start[1]) * 1000. / (newestTime - start[0])
+
+class RateEngine(object):
+    """ Rates of a set of counters, fed with parsed stat rows. """
+
+    def __init__(self, statistics, counters, windows=None, timeConstant=None):
+        self.windows = tuple(windows) if windows else rateWindows
+        self.counters = [s for s in statistics if s in counters]
+        self.statistics = list(statistics)
+        self.rates = dict((s, CounterRate(max(self.windows), timeConstant)) for s in self.counters)
+        self.lock = threading.Lock()
+
+    def add(self, timestamp, values):
+        """ `values` are in the order of `statistics`. """
+        with self.lock:
+            for (s, value) in zip(self.statistics, values):
+                if s in self.rates:
+                    self.rates[s].add(timestamp, value)
+
+    def rate(self, stat, window=None):
+        """ Sliding window rate (shortest window by default). """
+        with self.lock:
+            return self.rates[stat].rate(window if window else self.windows[0])
+
+    def ewma(self, stat):
+        with self.lock:
+            return self.rates[stat].ewma
+
+    def snapshot(self):
+        """ Returns {stat: {'ewma': rate, '<window>': rate, ...}} for all counters. """
+        with self.lock:
+            snapshot = {}
+            for (s, r) in self.rates.items():
+                snapshot[s] = dict((windowName(w), r.rate(w)) for w in self.windows)
+                snapshot[s]['ewma'] = r.ewma
+            return snapshot
@@ -0,0 +1,177 @@
+""" Recording of fetched frames to disk """
+
+import io, json, logging, os, struct, threading
+from collections import deque
+from threading import Thread
+
+from .utils import captureFrameRate, open_atomic, startFfmpegEncoder
+
+logger = logging.getLogger(__name__)
+
+# raw segments are rotated at whichever limit is hit first
+recordSegmentSize = 1024 * 1024 * 1024
+recordSegmentTime = 60
+# frames buffered in memory between the sink and the disk
+recordQueueFrames = 16
+recordWriteBuffer = 8 * 1024 * 1024
+recordIndexName = 'index.bin'
+recordManifestName = 'segments.json'
+# frame number, segment number, offset in the segment (bytes for raw
+# segments, frames for encoded ones), receive timestamp (sec)
+recordIndexEntry = struct.Struct('<QIQd')
+recordDropPolicies = ['newest', 'oldest']
+
+class FrameRecorder(object):
+    """ Writes frames received by a SinkReader (use `onFrame` as its listener)
+    into rotated segment files in `directory`, without ever blocking the sink.
+
+    Frames are copied into one of `queueFrames` preallocated buffers and written
+    by a separate thread. If the disk falls behind and all buffers are taken,
+    either the incoming frame ('newest') or the oldest queued one ('oldest')
+    is dropped, per `dropPolicy`.
+
+    Raw segments (segment-NNNNN.raw) are rotated by size or time. If `codec`
+    is given, frames are re-encoded by a single ffmpeg process into
+    segment-NNNNN.mkv files of `segmentTime` seconds each. Every written frame
+    gets a `recordIndexEntry` in index.bin, so frames can be located without
+    scanning segments; segments.json describes the recording and its segments.
+    """
+
+    def __init__(self, directory, w, h, pixelFormat, frameSize, codec=None, segmentSize=None,
+                 segmentTime=None, queueFrames=None, dropPolicy='oldest'):
+        if dropPolicy not in recordDropPolicies:
+            logger.error('unknown drop policy %s'%dropPolicy)
+            raise Exception('unknown drop policy %s'%dropPolicy)
+        self.directory = directory
+        self.width = w
+        self.height = h
+        self.pixelFormat = pixelFormat
+        self.frameSize = frameSize
+        self.codec = codec
+        self.segmentSize = segmentSize if segmentSize else recordSegmentSize
+        self.segmentTime = int(segmentTime) if segmentTime else recordSegmentTime
+        self.dropPolicy = dropPolicy
+        self.free = [bytearray(frameSize) for i in range(queueFrames if queueFrames else recordQueueFrames)]
+        # (buffer, frame number, receive time)
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.maxQueued = 0
+        self.segments = []
+        self.segment = None
+        self.encoder = None
+        self.running = False
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.index = io.open(os.path.join(directory, recordIndexName), 'wb')
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.running = True
+        if self.codec:
+            self.encoderLog = io.open(os.path.join(self.directory, 'ffmpeg.log'), 'wb')
+            self.encoder = startFfmpegEncoder(os.path.join(self.directory, 'segment-%05d.mkv'),
+                                self.width, self.height, self.pixelFormat, self.codec, self.segmentTime,
+                                os.path.join(self.directory, 'segments.csv'), self.encoderLog)
+        self.thread.start()
+        logger.info('recording frames into %s'%self.directory)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+        self.closeSegment()
+        if self.encoder:
+            self.encoder.stdin.close()
+            self.encoder.wait()
+            self.encoderLog.close()
+        self.index.close()
+        self.saveManifest()
+
+    def onFrame(self, frame, receiveTime, info=None):
+        with self.condition:
+            if not self.running:
+                return
+            if self.free:
+                buf = self.free.pop()
+            elif self.dropPolicy == 'oldest':
+                buf = self.queue.popleft()[0]
+                self.dropped += 1
+            else:
+                self.dropped += 1
+                self.received += 1
+                return
+            buf[:] = frame
+            self.queue.append((buf, self.received, receiveTime))
+            self.received += 1
+            self.maxQueued = max(self.maxQueued, len(self.queue))
+            self.condition.notify()
+
+    def stats(self):
+        return {'frames': self.written, 'dropped': self.dropped, 'bytes': self.bytes,
+                'segments': len(self.segments), 'max_queued': self.maxQueued}
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                buf, frameNo, receiveTime = self.queue.popleft()
+            try:
+                self.write(buf, frameNo, receiveTime)
+            except (IOError, OSError) as e:
+                logger.error('failed to record frame %d: %s'%(frameNo, e))
+                with self.condition:
+                    self.dropped += 1
+            with self.condition:
+                self.free.append(buf)
+
+    def write(self, buf, frameNo, receiveTime):
+        if self.encoder:
+            framesPerSegment = self.segmentTime * captureFrameRate
+            segmentNo, offset = divmod(self.written, framesPerSegment)
+            if segmentNo >= len(self.segments):
+                self.segments.append({'file': 'segment-%05d.mkv'%segmentNo, 'first_frame': frameNo,
+                                      'start': receiveTime, 'frames': 0})
+            self.encoder.stdin.write(buf)
+        else:
+            if self.segment is None or self.segment.tell() + self.frameSize > self.segmentSize or \
+                    receiveTime - self.segments[-1]['start'] >= self.segmentTime:
+                self.openSegment(frameNo, receiveTime)
+            offset = self.segment.tell()
+            self.segment.write(buf)
+        segment = self.segments[-1]
+        segment['frames'] += 1
+        segment['end'] = receiveTime
+        self.index.write(recordIndexEntry.pack(frameNo, len(self.segments) - 1, offset, receiveTime))
+        self.written += 1
+        self.bytes += len(buf)
+
+    def openSegment(self, frameNo, receiveTime):
+        self.closeSegment()
+        name = 'segment-%05d.raw'%len(self.segments)
+        self.segment = io.open(os.path.join(self.directory, name), 'wb', buffering=recordWriteBuffer)
+        self.segments.append({'file': name, 'first_frame': frameNo, 'start': receiveTime, 'frames': 0})
+        self.saveManifest()
+
+    def closeSegment(self):
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+            self.index.flush()
+
+    def saveManifest(self):
+        manifest = {'width': self.width, 'height': self.height, 'pixel_format': self.pixelFormat,
+                    'frame_size': self.frameSize, 'codec': self.codec or 'rawvideo',
+                    'frame_rate': captureFrameRate, 'offset_unit': 'frame' if self.codec else 'byte',
+                    'index_entry': recordIndexEntry.format, 'segments': self.segments,
+                    'frames': self.written, 'dropped': self.dropped}
+        with open_atomic(os.path.join(self.directory, recordManifestName), 'w') as f:
+            f.write(json.dumps(manifest, indent=2, sort_keys=True))
@@ -0,0 +1,262 @@
+""" Run directory lifecycle """
+
+import errno, fcntl, io, json, logging, os, re, stat, subprocess, sys, tempfile, time
+
+from .overlay import overlayShmDir
+
+logger = logging.getLogger(__name__)
+
+runDirPrefix = 'ndnrtc-stream.'
+runInfoName = 'run.json'
+janitorLockName = '.ndnrtc-stream.lock'
+# history retention: number of runs, total size (MB) and age (days)
+historyRuns = 20
+historySize = 1024
+historyDays = 7.
+# logs, child output dumps (including rotated ones) and stat files of finished runs are gzipped
+compressPattern = re.compile(r'\.(log|out|err|stat)(\.\d+)?$')
+compressMinSize = 4096
+compressLevel = 6
+# hot files (FIFOs and sockets are detected by type) removed as soon as a run is finished
+hotFilePattern = re.compile(r'\.ring$')
+
+def runDirSize(path):
+    """ Returns (bytes, files) of regular files under `path`. """
+    size = files = 0
+    for (root, dirs, names) in os.walk(path):
+        for name in names:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                size += st.st_size
+                files += 1
+    return size, files
+
+def lastModified(path):
+    """ Latest modification time of `path` and anything under it. """
+    latest = os.path.getmtime(path)
+    for (root, dirs, names) in os.walk(path):
+        for name in dirs + names:
+            try:
+                latest = max(latest, os.lstat(os.path.join(root, name)).st_mtime)
+            except OSError:
+                pass
+    return latest
+
+def readRunInfo(runDir):
+    try:
+        with io.open(os.path.join(runDir, runInfoName), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+
+def writeRunInfo(runDir, info):
+    fileName = os.path.join(runDir, runInfoName)
+    with io.open(fileName + '.tmp', 'wb') as f:
+        f.write(json.dumps(info, indent=2, sort_keys=True).encode('utf-8'))
+    os.rename(fileName + '.tmp', fileName)
+
+def isAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+def removeHotFiles(runDir):
+    """ Removes FIFOs, sockets, frame rings and overlays (which may live in
+    /dev/shm) of a run, including nested runs; returns the number of bytes freed. """
+    import glob
+    freed = 0
+    for (root, dirs, names) in os.walk(runDir):
+        paths = [os.path.join(root, name) for name in names]
+        paths += glob.glob(os.path.join(overlayShmDir, '%s.*.txt*'%os.path.basename(root)))
+        for path in paths:
+            try:
+                st = os.lstat(path)
+                if stat.S_ISFIFO(st.st_mode) or stat.S_ISSOCK(st.st_mode) or \
+                   hotFilePattern.search(path) or path.startswith(overlayShmDir + os.sep):
+                    os.remove(path)
+                    freed += st.st_size if stat.S_ISREG(st.st_mode) else 0
+            except OSError:
+                pass
+    return freed
+
+def compressFile(fileName):
+    """ Replaces a file with its gzipped copy; returns the compressed size. """
+    # imported here (shutil too), so commands don't pay for them at startup
+    import gzip, shutil
+    tmpFileName = fileName + '.gz.tmp'
+    with io.open(fileName, 'rb') as src:
+        dst = gzip.open(tmpFileName, 'wb', compressLevel)
+        try:
+            shutil.copyfileobj(src, dst, 1024*1024)
+        finally:
+            dst.close()
+    st = os.stat(fileName)
+    os.utime(tmpFileName, (st.st_atime, st.st_mtime))
+    os.rename(tmpFileName, fileName + '.gz')
+    os.remove(fileName)
+    return os.path.getsize(fileName + '.gz')
+
+class RunDirs(object):
+    """ Run directories of ndnrtc-stream commands.
+
+    Every command gets a run directory under `root` (system temp directory
+    by default; e.g. /dev/shm keeps FIFOs, frame rings and logs in RAM), with
+    a run.json holding pid, command, start time and, later, sizes.
+    Sub-commands (bench's publisher and fetcher, load's consumers) get nested
+    run directories of the first one, so a run is always one directory.
+
+    When the command is done, hot files are removed right away and the run is
+    marked finished; a detached janitor process then gzips its logs, moves it
+    to `historyDir` (if different from `root`) and trims the history to
+    `keepRuns` runs, `keepSize` MB and `keepDays` days. Runs abandoned by
+    killed processes are collected by the janitor of the next command.
+    Directories without run.json (made by older versions or anything else
+    using the prefix) are never touched.
+    """
+
+    def __init__(self, root=None, historyDir=None, keepRuns=None, keepSize=None, keepDays=None):
+        self.configure(root, historyDir, keepRuns, keepSize, keepDays)
+        self.created = []
+        self.command = None
+
+    def configure(self, root=None, historyDir=None, keepRuns=None, keepSize=None, keepDays=None):
+        self.root = os.path.abspath(root) if root else tempfile.gettempdir()
+        self.historyDir = os.path.abspath(historyDir) if historyDir else self.root
+        self.keepRuns = int(keepRuns) if keepRuns is not None else historyRuns
+        self.keepSize = float(keepSize) if keepSize is not None else historySize
+        self.keepDays = float(keepDays) if keepDays is not None else historyDays
+
+    def configureFromOptions(self, options, command):
+        """ Configures from --run_root, --history_dir and --keep_* options. """
+        self.configure(options.get('--run_root'), options.get('--history_dir'), options.get('--keep_runs'),
+                       options.get('--keep_size'), options.get('--keep_days'))
+        self.command = command
+        for path in (self.root, self.historyDir):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def settings(self):
+        return {'root': self.root, 'historyDir': self.historyDir, 'keepRuns': self.keepRuns,
+                'keepSize': self.keepSize, 'keepDays': self.keepDays}
+
+    def create(self):
+        """ Creates a run directory (nested into the first one of this process). """
+        runDir = tempfile.mkdtemp(prefix=runDirPrefix, dir=self.created[0] if self.created else self.root)
+        if not self.created:
+            writeRunInfo(runDir, {'pid': os.getpid(), 'command': self.command, 'started': time.time()})
+        self.created.append(runDir)
+        return runDir
+
+    def finish(self):
+        """ Removes hot files of this process' run, marks it finished and starts
+        the janitor. Returns (run directory, bytes, files); the directory is
+        removed (and None returned for it) if the run left nothing behind. """
+        if not self.created:
+            return None
+        runDir = self.created[0]
+        self.created = []
+        import shutil
+        removeHotFiles(runDir)
+        size, files = runDirSize(runDir)
+        info = readRunInfo(runDir) or {}
+        if files <= 1:
+            # nothing but run.json
+            shutil.rmtree(runDir, ignore_errors=True)
+            runDir = None
+        else:
+            info.update({'finished': time.time(), 'bytes': size, 'files': files})
+            writeRunInfo(runDir, info)
+        self.startJanitor()
+        return runDir, size, files
+
+    def startJanitor(self):
+        """ Runs `collect` in a detached process, so compression doesn't hold the command up. """
+        package = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([package] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+        script = 'import json, sys; from ndnrtc_stream.commands.utils.rundir import RunDirs; ' \
+                 'RunDirs(**json.loads(sys.argv[1])).collect()'
+        with io.open(os.devnull, 'wb') as devnull:
+            subprocess.Popen([sys.executable, '-c', script, json.dumps(self.settings())], env=env,
+                             stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True, preexec_fn=os.setsid)
+
+    def collect(self):
+        """ Archives finished and abandoned runs under `root` and trims the history.
+        Only one janitor works on a history directory at a time. """
+        try:
+            lock = io.open(os.path.join(self.historyDir, janitorLockName), 'ab')
+        except (IOError, OSError) as e:
+            logger.debug('run directories are not collected: %s'%e)
+            return
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            for runDir in self.runDirs(self.root):
+                info = readRunInfo(runDir)
+                if info is None or info.get('archived'):
+                    continue
+                if not info.get('finished') and isAlive(info.get('pid', 0)):
+                    continue
+                try:
+                    self.archive(runDir, info)
+                except (IOError, OSError) as e:
+                    logger.warn('failed to archive %s: %s'%(runDir, e))
+            self.trim()
+        finally:
+            lock.close()
+
+    def runDirs(self, path):
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return []
+        return [os.path.join(path, n) for n in names if n.startswith(runDirPrefix) and
+                os.path.isdir(os.path.join(path, n)) and not os.path.islink(os.path.join(path, n))]
+
+    def archive(self, runDir, info):
+        """ Compresses logs of a run, records its sizes and moves it to the history. """
+        import shutil
+        removeHotFiles(runDir)
+        if 'bytes' not in info:
+            info['bytes'], info['files'] = runDirSize(runDir)
+            info.setdefault('finished', lastModified(runDir))
+        compressed = 0
+        for (root, dirs, names) in os.walk(runDir):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith('.gz.tmp'):
+                    # left by an interrupted janitor
+                    os.remove(path)
+                elif compressPattern.search(name) and os.path.isfile(path) and os.path.getsize(path) >= compressMinSize:
+                    compressFile(path)
+                    compressed += 1
+        info['archived'] = time.time()
+        info['archived_bytes'] = runDirSize(runDir)[0]
+        info['compressed_files'] = compressed
+        writeRunInfo(runDir, info)
+        if self.historyDir != self.root:
+            shutil.move(runDir, os.path.join(self.historyDir, os.path.basename(runDir)))
+        logger.debug('archived %s: %d -> %d bytes'%(runDir, info['bytes'], info['archived_bytes']))
+
+    def history(self):
+        """ Archived runs as (run directory, run info), newest first. """
+        runs = [(d, readRunInfo(d)) for d in self.runDirs(self.historyDir)]
+        runs = [(d, info) for (d, info) in runs if info and info.get('archived')]
+        return sorted(runs, key=lambda r: r[1].get('finished', 0), reverse=True)
+
+    def trim(self):
+        """ Removes the oldest archived runs beyond `keepRuns`, `keepSize` MB or `keepDays`. """
+        import shutil
+        total = 0
+        oldest = time.time() - self.keepDays * 86400.
+        for (idx, (runDir, info)) in enumerate(self.history()):
+            total += info.get('archived_bytes', 0)
+            if idx >= self.keepRuns or total > self.keepSize * 1024 * 1024 or info.get('finished', 0) < oldest:
+                shutil.rmtree(runDir, ignore_errors=True)
+                logger.debug('removed run directory %s'%runDir)
+
+runDirs = RunDirs()
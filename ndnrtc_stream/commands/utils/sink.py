@@ -0,0 +1,235 @@
+""" Sink readers """
+
+import errno, fcntl, io, logging, os, struct, time
+from collections import deque
+from threading import Thread
+
+from .statstore import StatStore
+from .fifo import FifoMonitor
+
+logger = logging.getLogger(__name__)
+
+# header ndnrtc-client writes before every frame when sink's write_frame_info
+# is enabled: capture timestamp (ms), playback number, length of the frame's
+# NDN name which follows the header
+frameInfoHeader = struct.Struct('<QiI')
+frameInfoMaxName = 4096
+# inter-frame interval considered a playback stall, ms
+frameStallThreshold = 250.
+# upper bounds (ms) of inter-frame interval histogram buckets
+frameIntervalBuckets = [10, 20, 30, 40, 50, 60, 80, 100, 150, 200, 300, 500, 1000, 2000]
+frameTimingStats = ['frameInterval', 'frameStalls', 'frameStallTime', 'frameGaps', 'framesMissing']
+frameTimingCaptions = {'frameInterval': 'Inter-frame interval (ms)', 'frameStalls': 'Playback stalls',
+                       'frameStallTime': 'Playback stall time (ms)', 'frameGaps': 'Playback number gaps',
+                       'framesMissing': 'Frames missing from playback'}
+frameTimingCounters = ['frameStalls', 'frameStallTime', 'frameGaps', 'framesMissing']
+# stalls kept for reports
+frameStallHistory = 100
+
+def readExactly(pipe, view):
+    """ Fills `view` from `pipe`; returns False on EOF. """
+    got = 0
+    while got < len(view):
+        n = pipe.readinto(view[got:])
+        if not n:
+            return False
+        got += n
+    return True
+
+class FrameInfo(object):
+    """ Frame info of the last frame read by a SinkReader (reused for every frame;
+    the name itself is in the reader's `nameBuffer`, truncated to `frameInfoMaxName`).
+    """
+    __slots__ = ['timestamp', 'playbackNo', 'nameLength']
+
+    def __init__(self):
+        self.timestamp = 0
+        self.playbackNo = -1
+        self.nameLength = 0
+
+class FrameTiming(object):
+    """ Tracks frame arrival: inter-frame interval distribution, stalls (intervals
+    longer than `stallThreshold` ms) and gaps in playback numbers (if frame info
+    is available). Per-frame values are kept in `statStore` (`frameTimingStats`).
+    """
+
+    def __init__(self, stallThreshold=None):
+        self.stallThreshold = stallThreshold if stallThreshold else frameStallThreshold
+        self.statStore = StatStore(frameTimingStats, counters=frameTimingCounters)
+        self.histogram = [0] * (len(frameIntervalBuckets) + 1)
+        self.stalls = deque(maxlen=frameStallHistory)
+        self.stallCount = 0
+        self.stallTime = 0.
+        self.longestStall = 0.
+        self.gaps = 0
+        self.missing = 0
+        self.lastTime = None
+        self.lastPlaybackNo = None
+
+    def onFrame(self, frame, receiveTime, info=None):
+        now = receiveTime * 1000.
+        interval = float('nan')
+        if self.lastTime is not None:
+            interval = now - self.lastTime
+            bucket = 0
+            while bucket < len(frameIntervalBuckets) and interval > frameIntervalBuckets[bucket]:
+                bucket += 1
+            self.histogram[bucket] += 1
+            if interval > self.stallThreshold:
+                self.stallCount += 1
+                self.stallTime += interval
+                self.longestStall = max(self.longestStall, interval)
+                self.stalls.append({'start': self.lastTime / 1000., 'duration_ms': interval})
+        self.lastTime = now
+        if info is not None and info.playbackNo >= 0:
+            if self.lastPlaybackNo is not None and info.playbackNo > self.lastPlaybackNo + 1:
+                self.gaps += 1
+                self.missing += info.playbackNo - self.lastPlaybackNo - 1
+            self.lastPlaybackNo = info.playbackNo
+        self.statStore.add(now, [interval, self.stallCount, self.stallTime, self.gaps, self.missing])
+
+    def currentStall(self, now=None):
+        """ Time (ms) since the last frame if it's over the stall threshold, 0 otherwise. """
+        if self.lastTime is None:
+            return 0.
+        elapsed = (now if now else time.time()) * 1000. - self.lastTime
+        return elapsed if elapsed > self.stallThreshold else 0.
+
+    def summary(self):
+        labels = ['<=%d'%b for b in frameIntervalBuckets] + ['>%d'%frameIntervalBuckets[-1]]
+        return {'interval_ms': self.statStore.summary('frameInterval'),
+                'interval_histogram': dict(zip(labels, self.histogram)),
+                'stalls': self.stallCount, 'stall_time_ms': self.stallTime, 'longest_stall_ms': self.longestStall,
+                'recent_stalls': list(self.stalls), 'gaps': self.gaps, 'frames_missing': self.missing}
+
+class SinkReader(object):
+    """ Reads whole raw frames from ndnrtc-client's sink FIFO into
+    preallocated buffers.
+
+    If `frameInfo` is True, every frame is expected to be preceded by
+    `frameInfoHeader` and the frame's name (sink's write_frame_info option).
+    Every frame is passed to the listeners - `onFrame(frame, receiveTime, info)`
+    callables, `info` is a FrameInfo or None - and forwarded to `forwardPipe`
+    (e.g. a viewer's FIFO), if given; frames are dropped while nobody reads
+    the forward pipe. Both FIFOs are reopened if the other side goes away.
+    Pipe buffers are sized in whole frames; transport stats of both pipes
+    are kept by `monitor` and `forwardMonitor` (see FifoMonitor).
+    """
+
+    def __init__(self, pipeName, frameSize, onFrame=None, forwardPipe=None, frameInfo=False):
+        self.pipeName = pipeName
+        self.frameSize = frameSize
+        self.listeners = [onFrame] if onFrame else []
+        self.forwardPipe = forwardPipe
+        self.frameInfo = FrameInfo() if frameInfo else None
+        self.buffer = bytearray(frameSize)
+        self.infoBuffer = bytearray(frameInfoHeader.size)
+        self.infoView = memoryview(self.infoBuffer)
+        self.nameBuffer = bytearray(frameInfoMaxName)
+        self.nameView = memoryview(self.nameBuffer)
+        self.bytes = 0
+        self.frames = 0
+        self.forwarded = 0
+        self.lastFrameTime = None
+        self.forwardFd = -1
+        self.monitor = FifoMonitor('sink', frameSize)
+        self.forwardMonitor = FifoMonitor('viewer', frameSize) if forwardPipe else None
+        self.running = False
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+
+    def addListener(self, onFrame):
+        self.listeners.append(onFrame)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        # unblock open() waiting for a writer
+        try:
+            os.close(os.open(self.pipeName, os.O_WRONLY | os.O_NONBLOCK))
+        except OSError:
+            pass
+        self.thread.join(1.)
+        if not self.thread.is_alive():
+            self.closeForward()
+
+    def stats(self):
+        stats = {'frames': self.frames, 'bytes': self.bytes, 'pipe': self.monitor.stats()}
+        if self.forwardPipe:
+            stats['forwarded'] = self.forwarded
+            stats['forward_pipe'] = self.forwardMonitor.stats()
+        return stats
+
+    def run(self):
+        view = memoryview(self.buffer)
+        while self.running:
+            try:
+                with io.open(self.pipeName, 'rb', buffering=0) as pipe:
+                    self.monitor.attach(pipe.fileno())
+                    while self.running:
+                        frameStart = self.bytes
+                        if self.frameInfo and not self.readFrameInfo(pipe):
+                            break
+                        if not readExactly(pipe, view):
+                            break
+                        self.bytes += self.frameSize
+                        self.frames += 1
+                        self.monitor.onFrame(self.bytes - frameStart)
+                        self.lastFrameTime = time.time()
+                        for onFrame in self.listeners:
+                            onFrame(self.buffer, self.lastFrameTime, self.frameInfo)
+                        if self.forwardPipe:
+                            self.forward(view)
+                    self.monitor.detach()
+            except (OSError, IOError) as e:
+                if e.errno != errno.EINTR:
+                    logger.debug('sink %s: %s'%(self.pipeName, e))
+                    time.sleep(0.1)
+
+    def readFrameInfo(self, pipe):
+        if not readExactly(pipe, self.infoView):
+            return False
+        info = self.frameInfo
+        info.timestamp, info.playbackNo, info.nameLength = frameInfoHeader.unpack_from(self.infoBuffer)
+        left = info.nameLength
+        while left > 0:
+            chunk = min(left, frameInfoMaxName)
+            if not readExactly(pipe, self.nameView[:chunk]):
+                return False
+            left -= chunk
+        self.bytes += len(self.infoBuffer) + info.nameLength
+        return True
+
+    def forward(self, view):
+        if self.forwardFd < 0:
+            try:
+                self.forwardFd = os.open(self.forwardPipe, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno == errno.ENXIO: # no reader yet
+                    return
+                raise
+            flags = fcntl.fcntl(self.forwardFd, fcntl.F_GETFL)
+            fcntl.fcntl(self.forwardFd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+            self.forwardMonitor.attach(self.forwardFd)
+        if not self.forwardMonitor.write(view):
+            self.closeForward()
+            return
+        self.forwarded += 1
+
+    def closeForward(self):
+        if self.forwardFd >= 0:
+            self.forwardMonitor.detach()
+            os.close(self.forwardFd)
+            self.forwardFd = -1
+
+class NullSink(SinkReader):
+    """ Consumes frames from ndnrtc-client's sink FIFO and discards them.
+
+    Used instead of a viewer in headless modes.
+    """
+
+    def __init__(self, pipeName, frameSize, onFrame=None, frameInfo=False):
+        SinkReader.__init__(self, pipeName, frameSize, onFrame, frameInfo=frameInfo)
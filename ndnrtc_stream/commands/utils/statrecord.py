@@ -0,0 +1,118 @@
+""" Binary stat recordings """
+
+import io, json, logging, mmap, os, struct, sys, threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+statRecordMagic = b'NRSTATS1'
+statRecordVersion = 1
+statRecordSuffix = '.nrstat'
+# magic, version, length of the JSON description that follows
+statRecordHeader = struct.Struct('<8sII')
+statRecordFlushInterval = 1.
+
+def statRecordName(role, prefix, stream):
+    return '%s%s-%s%s'%(role, prefix.replace('/', '-'), stream, statRecordSuffix)
+
+def littleEndian(values):
+    if sys.byteorder != 'little':
+        values = array('d', values)
+        values.byteswap()
+    return values
+
+class StatRecorder(object):
+    """ Appends parsed stat rows to a binary columnar file.
+
+    Layout: `statRecordHeader`, a JSON description ({"statistics": [...],
+    "labels": {...}}) padded with spaces to a multiple of 8 bytes, then
+    fixed-size rows of little-endian float64: the stat line timestamp
+    followed by one value per statistic. Row N starts at
+    dataOffset + N * 8 * (1 + len(statistics)), so recordings can be
+    memory-mapped and read while they are still being written.
+    An existing recording is appended to if it has the same statistics.
+    """
+
+    def __init__(self, fileName, statistics, labels=None):
+        self.fileName = fileName
+        self.statistics = list(statistics)
+        self.rowSize = 8 * (1 + len(self.statistics))
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.lastFlush = 0
+        if os.path.exists(fileName) and os.path.getsize(fileName):
+            recording = StatRecording(fileName)
+            if recording.statistics != self.statistics:
+                logger.error('stat recording %s has different statistics'%fileName)
+                raise Exception('stat recording %s has different statistics'%fileName)
+            self.file = io.open(fileName, 'ab')
+            # drop partially written row, if any
+            self.file.truncate(recording.dataOffset + len(recording) * self.rowSize)
+        else:
+            self.file = io.open(fileName, 'wb')
+            description = json.dumps({'statistics': self.statistics, 'labels': labels or {}}).encode('utf-8')
+            description += b' ' * (-(statRecordHeader.size + len(description)) % 8)
+            self.file.write(statRecordHeader.pack(statRecordMagic, statRecordVersion, len(description)))
+            self.file.write(description)
+        logger.debug('recording stats into %s'%fileName)
+
+    def write(self, timestamp, values):
+        row = littleEndian(array('d', [timestamp] + list(values)))
+        with self.lock:
+            self.file.write(row.tostring() if sys.version_info[0] < 3 else row.tobytes())
+            self.rows += 1
+            if timestamp - self.lastFlush >= statRecordFlushInterval * 1000 or timestamp < self.lastFlush:
+                self.file.flush()
+                self.lastFlush = timestamp
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class StatRecording(object):
+    """ Read-only view of a stat recording made by StatRecorder. """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        with io.open(fileName, 'rb') as f:
+            magic, version, descriptionSize = statRecordHeader.unpack(f.read(statRecordHeader.size))
+            if magic != statRecordMagic:
+                logger.error('%s is not a stat recording'%fileName)
+                raise Exception('%s is not a stat recording'%fileName)
+            description = json.loads(f.read(descriptionSize).decode('utf-8'))
+        self.version = version
+        self.statistics = description['statistics']
+        self.labels = description.get('labels', {})
+        self.columns = dict((s, idx+1) for (idx, s) in enumerate(self.statistics))
+        self.width = 1 + len(self.statistics)
+        self.rowSize = 8 * self.width
+        self.dataOffset = statRecordHeader.size + descriptionSize
+        self.data = None
+
+    def __len__(self):
+        return (os.path.getsize(self.fileName) - self.dataOffset) // self.rowSize
+
+    def load(self):
+        """ Maps the file and returns all complete rows as one flat array of doubles. """
+        if self.data is None:
+            n = len(self)
+            self.data = array('d')
+            if n:
+                with io.open(self.fileName, 'rb') as f:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        raw = m[self.dataOffset:self.dataOffset + n * self.rowSize]
+                    finally:
+                        m.close()
+                if sys.version_info[0] < 3:
+                    self.data.fromstring(raw)
+                else:
+                    self.data.frombytes(raw)
+                self.data = littleEndian(self.data)
+        return self.data
+
+    def timestamps(self):
+        return self.load()[0::self.width]
+
+    def column(self, stat):
+        return self.load()[self.columns[stat]::self.width]
@@ -0,0 +1,212 @@
+""" Stat store """
+
+import logging, math, threading
+from array import array
+from .rates import RateEngine
+
+logger = logging.getLogger(__name__)
+
+statStoreCapacity = 4096
+# ndnrtc-client statistics that are monotonically increasing counters,
+# everything else is a gauge
+counterStats = set(['isent', 'segNumRcvd', 'appNacks', 'nacks', 'timeouts', 'rtxNum',
+                    'bytesRcvd', 'rawBytesRcvd', 'framesReq', 'framesPlayed', 'framesInc',
+                    'skipNoKey', 'verifySuccess', 'verifyFailure', 'framesCaptured',
+                    'framesPub', 'framesDrop', 'segPub', 'irecvd',
+                    # events parsed from ndnrtc-client logs (see ClientLogWatch)
+                    'logTimeouts', 'logNacks', 'logRebuffers', 'logStateChanges', 'logKeySkips'])
+
+def isNan(value):
+    return value != value
+
+def formatStat(caption, value):
+    """ Formats one overlay line the way publish/fetch always did. """
+    if isNan(value):
+        return ''
+    if value - int(value) > 0:
+        return "\n%20s %-10.2f"%(caption, value)
+    return "\n%20s %-10d"%(caption, int(value))
+
+class StatStore(object):
+    """ Fixed-size columnar history of ndnrtc-client stat lines.
+
+    Stat lines are tab-separated: a timestamp followed by one value per
+    statistic, in the order they were listed in the `stat_gathering` config.
+    Column indexes are resolved once, at construction. Every statistic is kept
+    in its own ring buffer of doubles (missing or malformed values are stored
+    as NaN and ignored by queries).
+
+    Rates of counters (all `counterStats` unless `counters` is given) are
+    kept up to date by `rates` (see RateEngine). Parsed rows can also be
+    persisted by attaching a `recorder` (see StatRecorder).
+
+    Windowed queries take `window` - the number of most recent samples to
+    look at (all stored samples if omitted).
+    """
+
+    def __init__(self, statistics, capacity=None, counters=None):
+        self.statistics = list(statistics)
+        self.capacity = capacity if capacity else statStoreCapacity
+        # column 0 of a stat line is the timestamp
+        self.columns = dict((s, idx+1) for (idx, s) in enumerate(self.statistics))
+        self.timestamps = array('d', [float('nan')])*self.capacity
+        self.data = dict((s, array('d', [float('nan')])*self.capacity) for s in self.statistics)
+        self.count = 0
+        self.lock = threading.Lock()
+        # optional StatRecorder, gets every ingested row
+        self.recorder = None
+        # sliding window and EWMA rates of counters
+        self.rates = RateEngine(self.statistics, counters if counters is not None else counterStats)
+
+    @classmethod
+    def fromConfig(cls, statGathering, capacity=None, counters=None):
+        """ Creates store for a `stat_gathering` entry of ndnrtc-client config. """
+        return cls(statGathering['statistics'], capacity, counters)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def ingest(self, statLine):
+        stats = statLine.rstrip('\r\n').split('\t')
+        if len(stats) < 2:
+            return False
+        timestamp = self.parse(stats[0])
+        values = [self.parse(stats[self.columns[s]]) if self.columns[s] < len(stats) else float('nan') 
+                    for s in self.statistics]
+        self.add(timestamp, values)
+        return True
+
+    def add(self, timestamp, values):
+        """ Adds a parsed row: `values` are in the order of `statistics`. """
+        with self.lock:
+            slot = self.count % self.capacity
+            self.timestamps[slot] = timestamp
+            for (s, value) in zip(self.statistics, values):
+                self.data[s][slot] = value
+            self.count += 1
+        self.rates.add(timestamp, values)
+        if self.recorder:
+            self.recorder.write(timestamp, values)
+
+    def ingestLines(self, statLines):
+        n = 0
+        for l in statLines:
+            if self.ingest(l):
+                n += 1
+        return n
+
+    def parse(self, value):
+        try:
+            return float(value)
+        except ValueError:
+            return float('nan')
+
+    def latest(self, stat):
+        if not self.count:
+            return float('nan')
+        return self.data[stat][(self.count-1) % self.capacity]
+
+    def latestTimestamp(self):
+        if not self.count:
+            return float('nan')
+        return self.timestamps[(self.count-1) % self.capacity]
+
+    def latestRow(self):
+        """ Returns a dict of the most recent value of every statistic. """
+        with self.lock:
+            return dict((s, self.latest(s)) for s in self.statistics)
+
+    def window(self, stat, window=None):
+        """ Returns up to `window` most recent values, oldest first. """
+        return self.slice(self.data[stat], window)
+
+    def windowTimestamps(self, window=None):
+        return self.slice(self.timestamps, window)
+
+    def slice(self, column, window):
+        with self.lock:
+            n = len(self)
+            if window is not None:
+                n = min(n, window)
+            end = self.count % self.capacity
+            start = end - n
+            if start >= 0:
+                return column[start:end]
+            return column[start:] + column[:end]
+
+    def values(self, stat, window=None):
+        return [v for v in self.window(stat, window) if not isNan(v)]
+
+    def mean(self, stat, window=None):
+        values = self.values(stat, window)
+        return math.fsum(values)/len(values) if values else float('nan')
+
+    def min(self, stat, window=None):
+        values = self.values(stat, window)
+        return min(values) if values else float('nan')
+
+    def max(self, stat, window=None):
+        values = self.values(stat, window)
+        return max(values) if values else float('nan')
+
+    def percentile(self, stat, p, window=None):
+        """ Linearly interpolated percentile, `p` is in [0, 100]. """
+        return percentile(sorted(self.values(stat, window)), p)
+
+    def summary(self, stat, window=None):
+        """ Returns dict with mean, min, max and p50/p95/p99 of a statistic (None if no samples). """
+        return summarize(self.values(stat, window))
+
+    def counterRate(self, stat, window=None):
+        """ Average per-second increase of a counter over the window, based on
+        stat line timestamps (milliseconds). A counter going down (ndnrtc-client
+        restart) counts from zero, as in `counterTotal`.
+        """
+        samples = [(t, v) for (t, v) in zip(self.windowTimestamps(window), self.window(stat, window)) 
+                    if not isNan(t) and not isNan(v)]
+        if len(samples) < 2 or samples[-1][0] <= samples[0][0]:
+            return float('nan')
+        return counterTotal([v for (t, v) in samples]) * 1000. / (samples[-1][0] - samples[0][0])
+
+def percentile(sortedValues, p):
+    if not sortedValues:
+        return float('nan')
+    k = (len(sortedValues)-1) * p / 100.
+    lo = int(math.floor(k))
+    hi = int(math.ceil(k))
+    if lo == hi:
+        return sortedValues[lo]
+    return sortedValues[lo] + (sortedValues[hi]-sortedValues[lo]) * (k-lo)
+
+def summarize(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {'mean': math.fsum(values)/len(values), 'min': values[0], 'max': values[-1],
+            'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99)}
+
+def counterRates(timestamps, values):
+    """ Per-second rates between consecutive samples of a counter (timestamps in
+    milliseconds). Intervals where the counter went down (client restart) are skipped.
+    """
+    rates = []
+    last = None
+    for (t, v) in zip(timestamps, values):
+        if isNan(t) or isNan(v):
+            continue
+        if last and t > last[0] and v >= last[1]:
+            rates.append((v - last[1]) * 1000. / (t - last[0]))
+        last = (t, v)
+    return rates
+
+def counterTotal(values):
+    """ Total increase of a counter, accounting for resets to zero. """
+    total = 0.
+    last = None
+    for v in values:
+        if isNan(v):
+            continue
+        if last is not None:
+            total += v - last if v >= last else v
+        last = v
+    return total
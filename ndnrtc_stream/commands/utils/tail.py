@@ -0,0 +1,261 @@
+""" Tail """
+
+import errno, io, logging, os, select, struct, sys, threading
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+# inotify constants (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+inotifyEventHeader = struct.Struct('iIII')
+tailReadSize = 64*1024
+# most bytes delivered at once, so catching up on a big file takes bounded memory
+tailMaxBatch = 4*1024*1024
+tailPollInterval = 0.05
+
+class Inotify(object):
+    """ Minimal ctypes binding for Linux inotify.
+
+    Watches a single directory and reports names of entries that changed.
+    Raises OSError if inotify is not available on this platform.
+    """
+
+    libc = None
+
+    def __init__(self, path, mask):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        # imported here: ctypes is only needed once a file is tailed
+        import ctypes
+        if not Inotify.libc:
+            # libc symbols are visible through the interpreter's own handle
+            Inotify.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = Inotify.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding() or 'utf-8')
+        self.wd = Inotify.libc.inotify_add_watch(self.fd, path, mask)
+        if self.wd < 0:
+            e = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(e, os.strerror(e))
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """ Returns a list of (mask, name) tuples for all pending events. """
+        events = []
+        while True:
+            try:
+                buf = os.read(self.fd, tailReadSize)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not buf:
+                break
+            pos = 0
+            while pos + inotifyEventHeader.size <= len(buf):
+                wd, mask, cookie, length = inotifyEventHeader.unpack_from(buf, pos)
+                pos += inotifyEventHeader.size
+                name = buf[pos:pos+length].rstrip(b'\0')
+                pos += length
+                events.append((mask, name.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class Tail(object):
+    """ Follows a text file and delivers appended lines.
+
+    Uses inotify on the file's directory when available and falls back to
+    polling otherwise. A file that does not exist yet is picked up once it
+    appears; truncation and rotation (rename or delete + create) are detected
+    and the new file is read from the beginning.
+
+    Lines are delivered to `onNewLine(line)` one by one, or, if `onNewLines`
+    is given, in batches as `onNewLines([line, ...])` - one batch per wake-up
+    (up to `tailMaxBatch` bytes). If `onNewData` is given instead, batches of
+    complete lines are delivered undecoded as `onNewData(data, offset)`, where
+    `offset` is the position of data in the file.
+    Lines already in the file when tailing starts are skipped, unless
+    `fromStart` is set.
+    """
+
+    running = False
+
+    def __init__(self, fileName, onNewLine=None, onNewLines=None, pollInterval=None, onNewData=None,
+                 fromStart=False):
+        self.fileName = os.path.abspath(fileName)
+        self.fromStart = fromStart
+        self.onNewLine = onNewLine
+        self.onNewLines = onNewLines
+        self.onNewData = onNewData
+        self.pollInterval = pollInterval if pollInterval else tailPollInterval
+        self.file = None
+        self.inode = None
+        self.position = 0
+        self.remainder = b''
+        self.stopEvent = threading.Event()
+        self.wakeup = os.pipe()
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stopEvent.set()
+        try:
+            os.write(self.wakeup[1], b'x')
+        except OSError:
+            pass
+        if self.thread.is_alive():
+            self.thread.join()
+        for fd in self.wakeup:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def run(self):
+        watcher = None
+        try:
+            watcher = Inotify(os.path.dirname(self.fileName),
+                              IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE |
+                              IN_MOVED_FROM | IN_MOVED_TO | IN_ATTRIB)
+            logger.debug('tailing %s using inotify'%self.fileName)
+        except (OSError, AttributeError) as e:
+            logger.debug('inotify unavailable (%s), polling %s every %.0fms'%(e, self.fileName, self.pollInterval*1000))
+
+        self.reopen(seekToEnd=not self.fromStart)
+        try:
+            while self.running:
+                self.check()
+                if watcher:
+                    self.waitEvents(watcher)
+                else:
+                    self.stopEvent.wait(self.pollInterval)
+            self.check()
+        finally:
+            if watcher:
+                watcher.close()
+            self.closeFile()
+
+    def waitEvents(self, watcher):
+        baseName = os.path.basename(self.fileName)
+        while self.running:
+            try:
+                ready = select.select([watcher, self.wakeup[0]], [], [])[0]
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if watcher in ready:
+                for mask, name in watcher.read():
+                    if name == baseName or mask & IN_Q_OVERFLOW:
+                        return
+            else:
+                return
+
+    def reopen(self, seekToEnd=False):
+        self.closeFile()
+        try:
+            self.file = io.open(self.fileName, 'rb', buffering=0)
+        except (OSError, IOError):
+            return False
+        st = os.fstat(self.file.fileno())
+        self.inode = (st.st_dev, st.st_ino)
+        self.position = st.st_size if seekToEnd else 0
+        self.file.seek(self.position)
+        self.remainder = b''
+        return True
+
+    def closeFile(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.inode = None
+
+    def check(self):
+        if not self.file:
+            if not self.reopen():
+                return
+        # truncated in place
+        if os.fstat(self.file.fileno()).st_size < self.position:
+            logger.debug('%s truncated'%self.fileName)
+            self.position = 0
+            self.file.seek(0)
+            self.remainder = b''
+        self.readAvailable()
+        # rotated or removed: old file is fully drained at this point
+        try:
+            st = os.stat(self.fileName)
+            rotated = (st.st_dev, st.st_ino) != self.inode
+        except (OSError, IOError):
+            rotated = True
+        if rotated:
+            logger.debug('%s rotated'%self.fileName)
+            if self.reopen():
+                self.readAvailable()
+            else:
+                self.closeFile()
+
+    def readAvailable(self):
+        while True:
+            chunks = []
+            size = 0
+            while size < tailMaxBatch:
+                chunk = self.file.read(tailReadSize)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+            if not chunks:
+                return
+            offset = self.position - len(self.remainder)
+            data = self.remainder + b''.join(chunks)
+            self.position += size
+            end = data.rfind(b'\n')
+            if end < 0:
+                if len(data) < tailMaxBatch:
+                    self.remainder = data
+                    continue
+                # a runaway line is delivered in pieces
+                end = len(data)
+            self.remainder = data[end+1:]
+            self.deliver(data[:end], offset)
+
+    def deliver(self, data, offset):
+        try:
+            if self.onNewData:
+                self.onNewData(data, offset)
+                return
+            lines = [l.decode('utf-8', 'replace')+u'\n' for l in data.split(b'\n')]
+            if self.onNewLines:
+                self.onNewLines(lines)
+            elif self.onNewLine:
+                for line in lines:
+                    self.onNewLine(line)
+        except:
+            logger.debug(sys.exc_info())
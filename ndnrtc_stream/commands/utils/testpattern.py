@@ -0,0 +1,64 @@
+""" Synthetic video source """
+
+import logging, threading, time
+from threading import Thread
+
+from .capture import defaultPixelFormat, yuvPixelFormats
+
+logger = logging.getLogger(__name__)
+
+testPatternBarWidth = 32
+
+class TestPatternSource(object):
+    """ Pushes a synthetic test pattern (a white bar sweeping over a dark
+    background, 0rgb or yuv420p/nv12 with neutral chroma) into a FrameRing
+    at a fixed frame rate. Needs neither a camera nor ffmpeg.
+    """
+
+    def __init__(self, ring, w, h, frameRate, pixelFormat=None):
+        self.ring = ring
+        self.width = w
+        self.height = h
+        self.frameRate = frameRate
+        self.pixelFormat = pixelFormat if pixelFormat else defaultPixelFormat
+        if self.pixelFormat in yuvPixelFormats:
+            self.dark, self.bright = b'\x10', b'\xeb'
+            # both formats have a w*h luma plane followed by w*h/2 bytes of chroma
+            self.chroma = b'\x80' * (w * h // 2)
+        else:
+            self.dark, self.bright = b'\x00\x10\x10\x10', b'\x00\xff\xff\xff'
+            self.chroma = b''
+        self.frames = 0
+        self.late = 0
+        self.stopEvent = threading.Event()
+        self.thread = Thread(target = self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.ring.start()
+        self.thread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def makeFrame(self, idx):
+        barWidth = min(testPatternBarWidth, self.width)
+        x = (idx * 8) % (self.width - barWidth + 1)
+        row = self.dark * x + self.bright * barWidth + self.dark * (self.width - x - barWidth)
+        return row * self.height + self.chroma
+
+    def run(self):
+        interval = 1. / self.frameRate
+        nextFrame = time.time()
+        while not self.stopEvent.is_set():
+            self.ring.push(self.makeFrame(self.frames))
+            self.frames += 1
+            nextFrame += interval
+            delay = nextFrame - time.time()
+            if delay > 0:
+                self.stopEvent.wait(delay)
+            else:
+                self.late += 1
+        logger.debug('test pattern source stopped after %d frames (%d late)'%(self.frames, self.late))
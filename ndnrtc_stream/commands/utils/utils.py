@@ -1,20 +1,38 @@
 """ Utils """
 
-import io, logging, os, sys, threading, time
+import base64, binascii, io, logging, os, re, sys, threading, time
 from subprocess import PIPE, Popen as popen
-from threading import Thread
 import tempfile as tmp
 from contextlib import contextmanager
+from .drain import defaultDrainer
+from .ndnseccache import ndnsecCache
+from .capture import captureInputArgs, captureOutputArgs, defaultCaptureBackend, defaultPixelFormat
 
 ffmpegCmd = "ffmpeg"
 ffplayCmd = "ffplay"
 ndnrtcClientCmd = "ndnrtc-client"
 ndnsecCmd = "ndnsec"
+nfdStatusCmd = "nfd-status"
+# directory shared by stub tools, if --stub is used
+stubDir = None
 ndnrtcClientInstanceName = 'rtc-stream'
 defaultRunTime = 10000
 streamName = "camera"
 threadName = "t"
+captureFrameRate = 25
+# encoder bitrate (Kbps) if only --video_size is given
+defaultBitrate = 1000
 statFileId = "overlay-stats"
+# used for overlays if present, otherwise ffplay picks a font through fontconfig
+overlayFontFile = "/System/Library/Fonts/Courier.dfont"
+# key types identities can be created with and signature types of data signed with them
+keyTypes = {'rsa': 'rsa-sha256', 'ecdsa': 'ecdsa-sha256'}
+defaultKeyType = 'rsa'
+# `ndnsec key-gen -t` values
+ndnsecKeyTypes = {'rsa': 'r', 'ecdsa': 'e'}
+# DER-encoded algorithm OIDs of public keys (rsaEncryption, id-ecPublicKey)
+keyAlgorithmOids = {'rsa': b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x01\x01',
+                    'ecdsa': b'\x06\x07\x2a\x86\x48\xce\x3d\x02\x01'}
 
 samplePolicyAny = \
 u'validator\n\
@@ -26,7 +44,7 @@ u'validator\n\
         checker\n\
         {\n\
             type hierarchical\n\
-            sig-type rsa-sha256\n\
+            sig-type SIG_TYPE\n\
         }\n\
     }\n\
     trust-anchor\n\
@@ -45,7 +63,7 @@ u'validator\n\
         checker\n\
         {\n\
             type hierarchical\n\
-            sig-type rsa-sha256\n\
+            sig-type SIG_TYPE\n\
         }\n\
     }\n\
     trust-anchor\n\
@@ -85,18 +103,25 @@ ch.setFormatter(CustomFormatter())
 logger.propagate = False
 logger.handlers = [ch]
 
+def commandArgs(cmd):
+    """ Tool commands are either an executable name or a full argument list
+    (e.g. [sys.executable, '-m', 'ndnrtc_stream.stub', 'ndnrtc-client']).
+    """
+    return list(cmd) if isinstance(cmd, (list, tuple)) else [cmd]
+
 def checkNfdIsRunning():
-    proc = popen(['nfd-status'], stdout=PIPE)
+    proc = popen(commandArgs(nfdStatusCmd), stdout=PIPE)
     out = proc.communicate()[0]
     if proc.returncode != 0:
         logger.error('apparently, NFD is not running. please start NFD to use this app')
         sys.exit(1)
 
-def startFfplay(previewPipe, w, h, overlayFile=''):
+def startFfplay(previewPipe, w, h, overlayFile='', pixelFormat=None):
+    font = ' fontfile='+overlayFontFile+':' if os.path.exists(overlayFontFile) else ''
     proc = popen([ffplayCmd, '-f', 'rawvideo', 
                     # '-vf', 'drawtext=text=\'%{localtime} '+str+'\': x=10: y=10: fontcolor=white: fontsize=20: box=1: boxcolor=0x00000000@1',
-                    '-vf', 'drawtext=textfile='+overlayFile+':reload=1: x=10: y=10: fontcolor=white: fontfile=/System/Library/Fonts/Courier.dfont: fontsize=20: box=1: boxcolor=0x00000000@0.3',
-                    '-pixel_format', '0rgb',
+                    '-vf', 'drawtext=textfile='+overlayFile+':reload=1: x=10: y=10: fontcolor=white:'+font+' fontsize=20: box=1: boxcolor=0x00000000@0.3',
+                    '-pixel_format', pixelFormat if pixelFormat else defaultPixelFormat,
                     '-video_size', '%dx%d'%(w,h),
                     '-i', previewPipe],
                   stdout=PIPE, 
@@ -104,31 +129,57 @@ def startFfplay(previewPipe, w, h, overlayFile=''):
     logger.debug('started ffplay to read frames of %dx%d size from %s'%(w,h, previewPipe))
     return proc
 
-def startFfmpeg(cameraPipe, previewPipe, w,h):
-    proc = popen([ffmpegCmd,'-y',
-                     '-f', 'avfoundation',
-                    '-pixel_format', '0rgb',
-                    '-framerate', '25',
-                    '-video_size', '%dx%d'%(w,h),
-                    '-i', '0',
-                    '-map', '0:v',
-                    '-vsync', '2',
-                    # '-c', 'copy',
-                    '-f', 'rawvideo',
-                    cameraPipe,
-                    '-map', '0:v',
+def startFfmpeg(cameraPipe, previewPipe, w,h, backend=None, device=None, pixelFormat=None, frameRate=None):
+    """ Starts camera capture. If previewPipe is None, frames go to cameraPipe only
+    (use 'pipe:1' to read them from the process' stdout). Frames are captured
+    with `backend` (see captureInputArgs, platform camera by default) and
+    converted to `pixelFormat` (0rgb by default) at `frameRate` (captureFrameRate by default).
+    """
+    frameRate = frameRate if frameRate else captureFrameRate
+    backend = backend if backend else defaultCaptureBackend()
+    pixelFormat = pixelFormat if pixelFormat else defaultPixelFormat
+    outputs = ['-map', '0:v',
+                '-vsync', '2',
+                # '-c', 'copy',
+                '-f', 'rawvideo'] + captureOutputArgs(backend, w, h, pixelFormat, frameRate) + [cameraPipe]
+    if previewPipe:
+        outputs += ['-map', '0:v',
                     '-vsync', '2',
                     # '-c', 'copy',
-                    '-f', 'rawvideo',
-                    previewPipe],
+                    '-f', 'rawvideo'] + captureOutputArgs(backend, w, h, pixelFormat, frameRate) + [previewPipe]
+    proc = popen([ffmpegCmd,'-y'] + captureInputArgs(backend, device, w, h, frameRate, pixelFormat) + outputs,
                     stdout=PIPE,
                     stderr=PIPE)
-    logger.debug('started ffmpeg to read frames of %dx%d from camera into camera pipe %s and preview pipe %s'%(w,h,cameraPipe, previewPipe))
+    logger.debug('started ffmpeg to read %s frames of %dx%d from %s into camera pipe %s and preview pipe %s'%(pixelFormat, 
+                    w, h, backend, cameraPipe, previewPipe))
+    return proc
+
+def startFfmpegEncoder(outputPattern, w, h, pixelFormat, codec, segmentTime, segmentList, logFile):
+    """ Starts ffmpeg encoding raw frames written to its stdin into segments of
+    `segmentTime` seconds (a key frame starts every segment), listed in `segmentList`.
+    """
+    proc = popen([ffmpegCmd, '-y', '-loglevel', 'warning',
+                    '-f', 'rawvideo',
+                    '-pixel_format', pixelFormat,
+                    '-video_size', '%dx%d'%(w,h),
+                    '-framerate', str(captureFrameRate),
+                    '-i', 'pipe:0',
+                    '-c:v', codec,
+                    '-force_key_frames', 'expr:gte(t,n_forced*%d)'%segmentTime,
+                    '-f', 'segment',
+                    '-segment_time', str(segmentTime),
+                    '-reset_timestamps', '1',
+                    '-segment_list', segmentList,
+                    outputPattern],
+                    stdin=PIPE,
+                    stdout=logFile,
+                    stderr=logFile)
+    logger.debug('started ffmpeg to encode frames of %dx%d with %s into %s'%(w, h, codec, outputPattern))
     return proc
 
 def startNdnrtcClient(configFile, signingIdentity, verificationPolicy):
     global defaultRunTime
-    proc = popen([ndnrtcClientCmd, '-v', '-c', configFile,
+    proc = popen(commandArgs(ndnrtcClientCmd) + ['-v', '-c', configFile,
                     '-s', signingIdentity,
                     '-p', verificationPolicy,
                     '-t', str(defaultRunTime),
@@ -138,36 +189,100 @@ def startNdnrtcClient(configFile, signingIdentity, verificationPolicy):
     logger.debug('started ndnrtc-client process.')
     return proc
 
+def parseThreadLadder(ladder):
+    """ Parses simulcast ladder "<name>:<width>x<height>@<kbps>,..." into a list of
+    dicts with name, width, height and bitrate keys.
+    """
+    threads = []
+    for rung in ladder.split(','):
+        try:
+            name, spec = rung.strip().split(':')
+            size, bitrate = spec.split('@')
+            w, h = size.split('x')
+            threads.append({'name': name, 'width': int(w), 'height': int(h), 'bitrate': int(bitrate)})
+        except ValueError:
+            logger.error('incorrect thread specification %s. must be in a form <name>:<width>x<height>@<kbps>'%rung)
+            raise Exception('incorrect thread specification %s'%rung)
+    if len(set([t['name'] for t in threads])) != len(threads):
+        logger.error('thread names must be unique: %s'%ladder)
+        raise Exception('thread names must be unique')
+    return threads
+
+def encoderConfig(w, h, bitrate, frameRate=None):
+    """ Returns "coder" section of ndnrtc-client producer thread config. """
+    frameRate = frameRate if frameRate else captureFrameRate
+    return {'frame_rate': frameRate,
+            'gop': frameRate,
+            'start_bitrate': bitrate,
+            'max_bitrate': bitrate,
+            'encode_width': w,
+            'encode_height': h,
+            'drop_frames': True}
+
+def parseKeyType(name):
+    """ Returns a supported key type (default if `name` is empty). """
+    if not name:
+        return defaultKeyType
+    if name.lower() not in keyTypes:
+        logger.error('unsupported key type %s. must be one of: %s'%(name, ', '.join(sorted(keyTypes))))
+        raise Exception('unsupported key type %s'%name)
+    return name.lower()
+
+def keyTypeIdentity(prefix, keyType):
+    """ Identity used to compare key types: `prefix` itself for the default
+    key type, `prefix`-<keyType> otherwise (an identity keeps its key type). """
+    return prefix if not keyType or keyType == defaultKeyType else '%s-%s'%(prefix, keyType)
+
+def verificationPolicy(keyType=None, certFile=None):
+    """ Returns validator config for data signed with `keyType` keys, with
+    `certFile` as a trust anchor (any trust anchor if omitted). """
+    policy = samplePolicy.replace('CERT_FILENAME', certFile) if certFile else samplePolicyAny
+    return policy.replace('SIG_TYPE', keyTypes[keyType if keyType else defaultKeyType])
+
+def ndnsec_run(args, cacheKey=None):
+    """ Runs ndnsec with given arguments and returns its output (None on failure).
+    If cacheKey is given, output is served from/stored to the ndnsec cache.
+    """
+    if cacheKey:
+        output = ndnsecCache.get(cacheKey)
+        if output is not None:
+            return output
+    ndnsecProc = popen(commandArgs(ndnsecCmd) + args, stdout=PIPE)
+    output = ndnsecProc.communicate()[0]
+    if ndnsecProc.returncode == 0:
+        if not isinstance(output, str): # python 3
+            output = output.decode('utf-8')
+        if cacheKey:
+            ndnsecCache.set(cacheKey, output)
+        return output
+    return None
+
 def ndnsec_checkIdentity(identityName):
-    ndnsecList = popen([ndnsecCmd, 'list'], stdout=PIPE)
-    ndnsecList.wait()
-    if ndnsecList.returncode == 0:
-        output = ndnsecList.communicate()[0]
+    output = ndnsec_run(['list'], 'list')
+    if output is not None:
         return (identityName in output)
     return False
 
-def ndnsec_createIdentity(identityName):
+def ndnsec_createIdentity(identityName, keyType=None):
     if not ndnsec_checkIdentity(identityName):
-        logger.info('creating self-signed identity %s'%identityName)
+        keyType = keyType if keyType else defaultKeyType
+        logger.info('creating self-signed identity %s (%s key)'%(identityName, keyType))
 
-        ndnsecInstallCert = popen([ndnsecCmd, 'cert-install', '-'], stdin=PIPE, stdout=PIPE)
+        ndnsecInstallCert = popen(commandArgs(ndnsecCmd) + ['cert-install', '-'], stdin=PIPE, stdout=PIPE)
         ndnsecInstallCertStdIn = ndnsecInstallCert.stdin
-        ndnsecKeyGen = popen([ndnsecCmd, 'key-gen', '-i', identityName], stdout=ndnsecInstallCertStdIn)
+        ndnsecKeyGen = popen(commandArgs(ndnsecCmd) + ['key-gen', '-t', ndnsecKeyTypes[keyType], '-i', identityName],
+                             stdout=ndnsecInstallCertStdIn)
         output = ndnsecInstallCert.communicate()[0]
+        ndnsecCache.invalidate()
         if ndnsecInstallCert.returncode == 0:
             return ndnsec_checkIdentity(identityName)
 
 def ndnsec_getDefaultIdentity():
-    ndnsecProc = popen([ndnsecCmd, 'get-default'], stdout=PIPE)
-    output = ndnsecProc.communicate()[0]
-    if ndnsecProc.returncode == 0:
-        return output
-    return None
+    return ndnsec_run(['get-default'], 'default')
 
 def ndnsec_getAllIdentities():
-    ndnsecProc = popen([ndnsecCmd, 'list'], stdout=PIPE)
-    output = ndnsecProc.communicate()[0]
-    if ndnsecProc.returncode == 0:
+    output = ndnsec_run(['list'], 'list')
+    if output is not None:
         ids = []
         lines = [l.strip() for l in output.split('\n') if l != '']
         for identity in lines:
@@ -178,44 +293,28 @@ def ndnsec_getAllIdentities():
     return None
 
 def ndnsec_dumpCert(identity):
-    ndnsecProc = popen([ndnsecCmd, 'cert-dump', '-i', identity], stdout=PIPE)
-    output = ndnsecProc.communicate()[0]
-    if ndnsecProc.returncode == 0:
-        return output
+    return ndnsec_run(['cert-dump', '-i', identity], 'cert-dump:%s'%identity)
+
+def ndnsec_getKeyType(identity):
+    """ Returns key type of the default key of an identity (None if unknown),
+    judging by the algorithm of the public key in its certificate. """
+    output = ndnsec_run(['cert-dump', '-p', '-i', identity], 'cert-dump-p:%s'%identity)
+    if not output or 'Public key bits:' not in output:
+        return None
+    bits = ''
+    for line in output.split('Public key bits:', 1)[1].strip().split('\n'):
+        if not re.match(r'^\s*[A-Za-z0-9+/=]+\s*$', line):
+            break
+        bits += line.strip()
+    try:
+        der = base64.b64decode(bits)
+    except (TypeError, ValueError, binascii.Error):
+        return None
+    for (keyType, oid) in keyAlgorithmOids.items():
+        if oid in der:
+            return keyType
     return None
 
-class Tail(object):
-    running = False
-
-    def __init__(self, fileName, onNewLine):
-        self.fileName = fileName
-        self.onNewLine = onNewLine
-        self.thread = Thread(target = self.run)
-
-    def start(self):
-        self.running = True
-        self.thread.start()
-
-    def stop(self):
-        self.running = False
-        self.thread.join()
-
-    def run(self):
-        try:
-            with io.open(self.fileName, 'r') as f:
-                f.seek(0, 2) # seek to the end of file
-                while self.running:
-                    line = f.readline()
-                    if line == '': # empty line
-                        time.sleep(0.05)
-                    else:
-                        if self.onNewLine:
-                            self.onNewLine(line)
-        except (OSError, IOError) as e:
-            time.sleep(0.2)
-            if self.running:
-                self.run()
-
 @contextmanager
 def tempfile(suffix='', dir=None):
     """ Context for temporary file.
@@ -277,15 +376,5 @@ def open_atomic(filepath, *args, **kwargs):
         os.rename(tmppath, filepath)
 
 def dumpOutput(out, filename):
-    def dump(out, filename):
-        with io.open(filename, 'w') as f:
-            while True:
-                line = out.readline()
-                f.write(unicode(line))
-                f.flush()
-            logger.debug('closing %s'%filename)
-            out.close()
-    t = Thread(target = dump, args = (out, filename))
-    t.daemon = True
-    t.start()
-
+    """ Drains child output pipe into a file using the shared drainer. """
+    defaultDrainer.add(out, filename)
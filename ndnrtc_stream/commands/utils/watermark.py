@@ -0,0 +1,125 @@
+""" Glass-to-glass latency watermarks """
+
+import logging, time
+
+from .statstore import StatStore
+from .capture import defaultPixelFormat, yuvPixelFormats
+
+logger = logging.getLogger(__name__)
+
+# side of a watermark block, pixels; 16 keeps blocks aligned with codec macroblocks
+watermarkBlock = 16
+watermarkSync = 0xa
+# sync (4 bits), frame sequence (16 bits), capture time in ms (low 32 bits), checksum (8 bits)
+watermarkBits = 60
+latencyStats = ['g2gLatency', 'g2gFrames', 'g2gLost', 'g2gUndecoded']
+latencyCaptions = {'g2gLatency': 'Glass-to-glass latency (ms)', 'g2gFrames': 'Watermarked frames received',
+                   'g2gLost': 'Watermarked frames lost', 'g2gUndecoded': 'Frames without watermark'}
+latencyCounters = ['g2gFrames', 'g2gLost', 'g2gUndecoded']
+
+def watermarkChecksum(seq, timestamp):
+    return (seq ^ (seq >> 8) ^ timestamp ^ (timestamp >> 8) ^ (timestamp >> 16) ^ (timestamp >> 24)) & 0xff
+
+class Watermark(object):
+    """ Stamps a frame sequence number and capture time into raw 0rgb frames
+    as a row of black/white blocks in the top left corner, and reads it back
+    after the frames went through the codec. In yuv420p and nv12 frames,
+    blocks are drawn in the luma plane only.
+    """
+
+    def __init__(self, w, h, block=None, pixelFormat=None):
+        pixelFormat = pixelFormat if pixelFormat else defaultPixelFormat
+        if pixelFormat != '0rgb' and pixelFormat not in yuvPixelFormats:
+            logger.error('frames in %s can not be watermarked'%pixelFormat)
+            raise Exception('frames in %s can not be watermarked'%pixelFormat)
+        self.block = block if block else watermarkBlock
+        self.luma = pixelFormat in yuvPixelFormats
+        self.pixelBytes = 1 if self.luma else 4
+        self.rowBytes = w * self.pixelBytes
+        perRow = w // self.block
+        rows = (watermarkBits + perRow - 1) // perRow if perRow else 0
+        if not perRow or rows * self.block > h:
+            logger.error('frame %dx%d is too small for a watermark'%(w, h))
+            raise Exception('frame %dx%d is too small for a watermark'%(w, h))
+        # offset of the top left pixel of every block
+        self.offsets = [(i // perRow) * self.block * self.rowBytes + (i % perRow) * self.block * self.pixelBytes
+                        for i in range(watermarkBits)]
+        if self.luma:
+            self.white = b'\xeb' * self.block
+            self.black = b'\x10' * self.block
+        else:
+            self.white = b'\x00\xff\xff\xff' * self.block
+            self.black = b'\x00\x00\x00\x00' * self.block
+        # pixel sampled when reading a block (its center)
+        self.center = (self.block // 2) * self.rowBytes + (self.block // 2) * self.pixelBytes
+
+    def encode(self, seq, timestamp):
+        seq &= 0xffff
+        timestamp &= 0xffffffff
+        return (watermarkSync << 56) | (seq << 40) | (timestamp << 8) | watermarkChecksum(seq, timestamp)
+
+    def stamp(self, buf, base, seq, timestamp):
+        """ Writes the watermark into a frame starting at `base` of a writable buffer. """
+        value = self.encode(seq, timestamp)
+        blockBytes = len(self.white)
+        for (i, offset) in enumerate(self.offsets):
+            pattern = self.white if (value >> (watermarkBits - 1 - i)) & 1 else self.black
+            start = base + offset
+            for r in range(self.block):
+                buf[start:start+blockBytes] = pattern
+                start += self.rowBytes
+
+    def read(self, frame):
+        """ Returns (seq, timestamp) stamped into `frame` (a bytearray), or None. """
+        value = 0
+        if self.luma:
+            for offset in self.offsets:
+                value = (value << 1) | (1 if frame[offset + self.center] > 128 else 0)
+        else:
+            for offset in self.offsets:
+                p = offset + self.center
+                value = (value << 1) | (1 if frame[p+1] + frame[p+2] + frame[p+3] > 384 else 0)
+        seq = (value >> 40) & 0xffff
+        timestamp = (value >> 8) & 0xffffffff
+        if value >> 56 != watermarkSync or value & 0xff != watermarkChecksum(seq, timestamp):
+            return None
+        return (seq, timestamp)
+
+class LatencyMeter(object):
+    """ Measures glass-to-glass latency of received frames stamped by Watermark
+    (sender and receiver must share the clock). Results are kept in `statStore`
+    (`latencyStats`), one row per received frame.
+    """
+
+    def __init__(self, w, h, pixelFormat=None):
+        self.watermark = Watermark(w, h, pixelFormat=pixelFormat)
+        self.statStore = StatStore(latencyStats, counters=latencyCounters)
+        self.lastSeq = None
+        self.frames = 0
+        self.lost = 0
+        self.undecoded = 0
+
+    def onFrame(self, frame, receiveTime=None, info=None):
+        now = int((receiveTime if receiveTime else time.time()) * 1000)
+        latency = float('nan')
+        mark = self.watermark.read(frame)
+        if mark is None:
+            self.undecoded += 1
+        else:
+            seq, timestamp = mark
+            if self.lastSeq is not None:
+                gap = (seq - self.lastSeq) & 0xffff
+                if gap == 0 or gap >= 0x8000:
+                    # repeated or reordered frame
+                    return
+                self.lost += gap - 1
+            self.lastSeq = seq
+            self.frames += 1
+            delay = (now - timestamp) & 0xffffffff
+            if delay < 0x80000000:
+                latency = float(delay)
+        self.statStore.add(now, [latency, self.frames, self.lost, self.undecoded])
+
+    def summary(self):
+        return {'latency_ms': self.statStore.summary('g2gLatency'), 'frames': self.frames,
+                'lost': self.lost, 'undecoded': self.undecoded}
@@ -0,0 +1,36 @@
+""" Startup timing breakdown (--profile_startup) """
+
+import sys, time
+
+# as close to interpreter start as the package gets
+startTime = time.time()
+
+class StartupProfile(object):
+    """ Time spent between consecutive marks, from the package import up to the
+    point a command has its children running. Printed (to stderr) only when enabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.reported = False
+        self.last = startTime
+        self.marks = []
+
+    def mark(self, label):
+        now = time.time()
+        self.marks.append((label, (now - self.last) * 1000.))
+        self.last = now
+
+    def report(self, out=None):
+        """ Prints the breakdown once, if enabled. """
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        out = out if out else sys.stderr
+        out.write('startup profile (ms):\n')
+        for (label, ms) in self.marks:
+            out.write('  %-24s %8.1f\n'%(label, ms))
+        out.write('  %-24s %8.1f\n'%('total', (self.last - startTime) * 1000.))
+        out.flush()
+
+startupProfile = StartupProfile()
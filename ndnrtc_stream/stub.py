@@ -0,0 +1,303 @@
+"""Stub NDN tools for benchmarking and CI runs without NFD or ndnrtc-client.
+
+Usage:
+  python -m ndnrtc_stream.stub ndnrtc-client -c <config> -s <identity> -p <policy> -t <seconds> -i <instance>
+  python -m ndnrtc_stream.stub nfd-status
+  python -m ndnrtc_stream.stub ndnsec <list|get-default|key-gen|cert-install|cert-dump> ...
+
+The stub ndnrtc-client consumes frames from producer source pipes and "publishes"
+them through a loopback directory (NDNRTC_STUB_DIR): a file with a frame counter
+followed by a small ring of the most recent frames. Stub consumers replay these
+frames into their sink pipes, preceded by frame info if the sink has
+write_frame_info enabled. Both sides write stat files in the same format as
+ndnrtc-client, with plausible synthetic values. Frame size is taken from
+NDNRTC_STUB_VIDEO_SIZE (<width>x<height>) and NDNRTC_STUB_PIXEL_FORMAT
+(0rgb, yuv420p or nv12). If NDNRTC_STUB_MAX_KBPS is set, stub producers drop
+the share of frames over this encoding throughput, to model a publisher that
+can't keep up with its encoder settings.
+"""
+
+import base64, errno, io, os, random, struct, sys, tempfile, threading, time
+from threading import Thread
+
+import libconf
+
+stubDir = os.environ.get('NDNRTC_STUB_DIR', os.path.join(tempfile.gettempdir(), 'ndnrtc-stream-stub'))
+stubIdentity = '/ndnrtc-stream-stub'
+statInterval = 0.1
+segmentsPerFrame = 4
+segmentSize = 8000
+loopbackSlots = 8
+loopbackHeader = struct.Struct('<Q')
+# see frameInfoHeader in ndnrtc_stream.commands.utils.sink
+frameInfoHeader = struct.Struct('<QiI')
+
+# public key algorithm OIDs (DER) printed by stub cert-dump -p, per key-gen -t value
+stubKeyOids = {'r': b'\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x01\x01', 'e': b'\x06\x07\x2a\x86\x48\xce\x3d\x02\x01'}
+# bits per pixel of supported NDNRTC_STUB_PIXEL_FORMAT values
+pixelFormatBits = {'0rgb': 32, 'yuv420p': 12, 'nv12': 12}
+
+def videoSize():
+    w, h = os.environ.get('NDNRTC_STUB_VIDEO_SIZE', '1280x720').split('x')
+    return int(w), int(h)
+
+def maxKbps():
+    value = os.environ.get('NDNRTC_STUB_MAX_KBPS')
+    return float(value) if value else None
+
+def loopbackFile(name):
+    return os.path.join(stubDir, name.strip('/').replace('/', '_') + '.frames')
+
+class StatWriter(object):
+    def __init__(self, fileName, statistics):
+        self.statistics = statistics
+        self.file = io.open(fileName, 'a')
+
+    def write(self, values):
+        line = [str(int(time.time()*1000))]
+        line += ['%.2f'%values.get(s, 0.) for s in self.statistics]
+        self.file.write(u'\t'.join(line) + u'\n')
+        self.file.flush()
+
+class ClientLog(object):
+    """ client.log with ndnrtc-style lines for (some of) synthetic events. """
+
+    def __init__(self, fileName):
+        self.file = io.open(fileName, 'a')
+        self.lock = threading.Lock()
+
+    def write(self, component, message):
+        now = time.time()
+        line = u'%s.%03d [ INFO ][%s] %s\n'%(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)),
+                                            int(now * 1000) % 1000, component, message)
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+class Producer(object):
+    def __init__(self, stream, key, statWriters, frameSize):
+        self.source = stream['source']['name']
+        self.loopback = loopbackFile(key)
+        self.statWriters = statWriters
+        self.frameSize = frameSize
+        self.captured = 0
+        # target bitrate of all encoder threads
+        self.bitrate = sum(t.get('coder', {}).get('max_bitrate', 0) for t in stream.get('threads', []))
+
+    def run(self, deadline):
+        Thread(target=self.report, args=(deadline,)).start()
+        buf = bytearray(self.frameSize)
+        view = memoryview(buf)
+        with io.open(self.loopback, 'wb') as loopback:
+            loopback.write(loopbackHeader.pack(0))
+            loopback.truncate(loopbackHeader.size + loopbackSlots * self.frameSize)
+            with io.open(self.source, 'rb', buffering=0) as source:
+                got = 0
+                while time.time() < deadline:
+                    n = source.readinto(view[got:])
+                    if not n:
+                        break
+                    got += n
+                    if got == self.frameSize:
+                        loopback.seek(loopbackHeader.size + (self.captured % loopbackSlots) * self.frameSize)
+                        loopback.write(buf)
+                        self.captured += 1
+                        loopback.seek(0)
+                        loopback.write(loopbackHeader.pack(self.captured))
+                        loopback.flush()
+                        got = 0
+
+    def report(self, deadline):
+        lastCaptured, lastTime = 0, time.time()
+        limit = maxKbps()
+        overload = max(0., 1. - limit / self.bitrate) if limit and self.bitrate else 0.
+        while time.time() < deadline:
+            time.sleep(statInterval)
+            now = time.time()
+            captured = self.captured
+            dropped = int(captured * (0.01 + overload))
+            rate = (captured - lastCaptured) * (1. - overload) / (now - lastTime)
+            lastCaptured, lastTime = captured, now
+            values = {'framesCaptured': captured, 'framesPub': captured - dropped, 'framesDrop': dropped,
+                      'prodRate': rate, 'segPub': (captured - dropped) * segmentsPerFrame, 'irecvd': captured * segmentsPerFrame}
+            for w in self.statWriters:
+                w.write(values)
+
+class Consumer(object):
+    def __init__(self, stream, statWriters, frameSize, w, h, log=None):
+        self.log = log
+        self.fetching = False
+        self.sink = '%s.%dx%d'%(stream['sink']['name'], w, h)
+        self.loopback = loopbackFile(stream['base_prefix'] + '/' + stream['name'])
+        self.statWriters = statWriters
+        self.frameSize = frameSize
+        self.blank = b'\x80' * frameSize
+        self.loopbackFile = None
+        self.played = 0
+        self.framePrefix = stream['base_prefix'] + '/' + stream['name']
+        self.frameInfo = bool(stream['sink'].get('write_frame_info'))
+
+    def published(self):
+        """ Returns the number of published frames, 0 if the publisher hasn't started yet. """
+        try:
+            if self.loopbackFile is None:
+                self.loopbackFile = io.open(self.loopback, 'rb', buffering=0)
+            self.loopbackFile.seek(0)
+            return loopbackHeader.unpack(self.loopbackFile.read(loopbackHeader.size))[0]
+        except (IOError, OSError, struct.error):
+            return 0
+
+    def frame(self, idx):
+        self.loopbackFile.seek(loopbackHeader.size + (idx % loopbackSlots) * self.frameSize)
+        frame = self.loopbackFile.read(self.frameSize)
+        return frame if len(frame) == self.frameSize else self.blank
+
+    def run(self, deadline):
+        Thread(target=self.report, args=(deadline,)).start()
+        while time.time() < deadline:
+            try:
+                fd = os.open(self.sink, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as e:
+                if e.errno not in (errno.ENXIO, errno.ENOENT):
+                    raise
+                time.sleep(0.1)
+        else:
+            return
+        nextFrame = self.published()
+        with io.open(fd, 'wb', buffering=0) as sink:
+            while time.time() < deadline:
+                published = self.published()
+                # skip frames that were overwritten already
+                nextFrame = max(nextFrame, published - loopbackSlots + 1)
+                while nextFrame < published:
+                    frame = self.frame(nextFrame)
+                    if self.frameInfo:
+                        name = ('%s/%d'%(self.framePrefix, nextFrame)).encode('utf-8')
+                        frame = frameInfoHeader.pack(int(time.time() * 1000), nextFrame, len(name)) + name + frame
+                    view = memoryview(frame)
+                    while len(view):
+                        try:
+                            view = view[sink.write(view) or 0:]
+                        except (OSError, IOError) as e:
+                            if e.errno == errno.EAGAIN:
+                                time.sleep(0.005)
+                                continue
+                            return
+                    nextFrame += 1
+                    self.played += 1
+                time.sleep(0.005)
+
+    def report(self, deadline):
+        timeouts = 0
+        while time.time() < deadline:
+            time.sleep(statInterval)
+            f = self.played
+            if self.log and f and not self.fetching:
+                self.fetching = True
+                self.log.write('consumer-%s'%self.framePrefix, 'state changed: Idle -> Fetching')
+            while self.log and timeouts < f // 500:
+                timeouts += 1
+                self.log.write('pipeliner-%s'%self.framePrefix, 'timeout %s/%d/data/%%00%%00'%(self.framePrefix, f))
+            values = {'isent': f * segmentsPerFrame * 1.05, 'segNumRcvd': f * segmentsPerFrame,
+                      'bytesRcvd': f * segmentsPerFrame * segmentSize, 'rawBytesRcvd': f * segmentsPerFrame * (segmentSize + 400),
+                      'lambdaD': 4, 'drdEst': 20 + random.random() * 5, 'jitterPlay': 150 + random.random() * 30,
+                      'framesReq': f + 5, 'framesPlayed': f, 'verifySuccess': f, 'timeouts': f // 500, 'rtxNum': f // 500}
+            for w in self.statWriters:
+                w.write(values)
+
+def ndnrtcClient(args):
+    args = [a for a in args if a != '-v']
+    opts = dict(zip(args[::2], args[1::2]))
+    config = libconf.load(io.open(opts['-c']))
+    identity = opts.get('-s', stubIdentity).strip()
+    instance = opts.get('-i', 'rtc-stream')
+    deadline = time.time() + float(opts.get('-t', 10000))
+    logPath = config['general'].get('log_path', '.') or '.'
+    w, h = videoSize()
+    frameSize = w * h * pixelFormatBits[os.environ.get('NDNRTC_STUB_PIXEL_FORMAT', '0rgb')] // 8
+    if not os.path.isdir(stubDir):
+        try:
+            os.makedirs(stubDir)
+        except OSError:
+            pass
+    log = ClientLog(os.path.join(logPath, config['general'].get('log_file') or 'client.log'))
+    workers = []
+    if 'produce' in config:
+        for stream in config['produce']['streams']:
+            writers = [StatWriter(os.path.join(logPath, '%s%s-%s-%s.stat'%(sg['name'], identity.replace('/', '-'), instance, stream['name'])), sg['statistics'])
+                       for sg in config['produce'].get('stat_gathering', [])]
+            workers.append(Producer(stream, '%s/%s/%s'%(identity, instance, stream['name']), writers, frameSize))
+    if 'consume' in config:
+        statGathering = config['consume'].get('basic', {}).get('stat_gathering', [])
+        for stream in config['consume']['streams']:
+            writers = [StatWriter(os.path.join(logPath, '%s%s-%s.stat'%(sg['name'], stream['base_prefix'].replace('/', '-'), stream['name'])), sg['statistics'])
+                       for sg in statGathering]
+            workers.append(Consumer(stream, writers, frameSize, w, h, log))
+    threads = [Thread(target=worker.run, args=(deadline,)) for worker in workers]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    sys.stdout.write('stub ndnrtc-client running %d workers\n'%len(workers))
+    sys.stdout.flush()
+    try:
+        while time.time() < deadline and any(t.is_alive() for t in threads):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def ndnsec(args):
+    identitiesFile = os.path.join(stubDir, 'identities')
+    # identity -> key type (key-gen -t value)
+    identities = [(stubIdentity, 'r')]
+    if os.path.exists(identitiesFile):
+        identities += [tuple((l.split() + ['r'])[:2]) for l in io.open(identitiesFile) if l.strip()]
+    cmd = args[0] if args else ''
+    if cmd == 'list':
+        sys.stdout.write('* %s\n'%identities[0][0] + ''.join('  %s\n'%i for (i, t) in identities[1:]))
+    elif cmd == 'get-default':
+        sys.stdout.write('%s\n'%identities[0][0])
+    elif cmd == 'key-gen':
+        identity = args[args.index('-i')+1] if '-i' in args else args[-1]
+        keyType = args[args.index('-t')+1] if '-t' in args else 'e'
+        if not os.path.isdir(stubDir):
+            os.makedirs(stubDir)
+        with io.open(identitiesFile, 'a') as f:
+            f.write(u'%s %s\n'%(identity, keyType))
+        sys.stdout.write('STUB-CERTIFICATE %s\n'%identity)
+    elif cmd == 'cert-install':
+        sys.stdin.read()
+    elif cmd == 'cert-dump':
+        if '-p' in args:
+            identity = args[args.index('-i')+1] if '-i' in args else identities[0][0]
+            keyType = dict(identities).get(identity, 'r')
+            sys.stdout.write('Certificate name:\n  %s/KEY/stub\nPublic key bits:\n  %s\n'%(identity,
+                             base64.b64encode(stubKeyOids[keyType]).decode('ascii')))
+        else:
+            sys.stdout.write('STUB-CERTIFICATE\n')
+    else:
+        return 1
+    return 0
+
+def main(argv):
+    if not argv:
+        sys.stderr.write(__doc__)
+        return 1
+    tool, args = argv[0], argv[1:]
+    if tool == 'ndnrtc-client':
+        return ndnrtcClient(args)
+    if tool == 'nfd-status':
+        sys.stdout.write('stub NFD is running\n')
+        return 0
+    if tool == 'ndnsec':
+        return ndnsec(args)
+    sys.stderr.write('unknown tool %s\n'%tool)
+    return 1
+
+def stubCommand(tool):
+    """ Argument list to run a stub tool, suitable for utils.commandArgs(). """
+    return [sys.executable, '-m', 'ndnrtc_stream.stub', tool]
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
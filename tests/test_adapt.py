@@ -0,0 +1,30 @@
+import pytest
+
+from ndnrtc_stream.commands.utils.adapt import BitrateController, adaptDownTime, adaptHoldTime, parseBitrateLadder
+from ndnrtc_stream.commands.utils.statstore import StatStore
+
+def test_bitrate_ladder_is_sorted():
+    ladder = parseBitrateLadder('640x480@1000, 1280x720@3000/30,320x240@300')
+    assert ladder == [{'width': 1280, 'height': 720, 'bitrate': 3000, 'frameRate': 30},
+                      {'width': 640, 'height': 480, 'bitrate': 1000},
+                      {'width': 320, 'height': 240, 'bitrate': 300}]
+
+@pytest.mark.parametrize('ladder', ['640x480', '640x480@fast', '640@1000', '640x480@1000/'])
+def test_bad_bitrate_ladder(ladder):
+    with pytest.raises(Exception):
+        parseBitrateLadder(ladder)
+
+def test_steps_down_after_sustained_overload():
+    store = StatStore(['framesCaptured', 'framesDrop', 'prodRate'])
+    changes = []
+    controller = BitrateController(parseBitrateLadder('1280x720@3000,640x480@1000'), store, changes.append,
+                                   frameRate=25)
+    for t in range(12):
+        # a fifth of captured frames dropped
+        store.add(t * 1000., [t * 25., t * 5., 25.])
+    assert controller.update(now=100.) is None
+    assert controller.update(now=100. + adaptDownTime - 1) is None
+    rung = controller.update(now=100. + adaptDownTime)
+    assert rung['bitrate'] == 1000 and changes == [rung]
+    # on hold while the restarted encoder settles, and there is no lower rung anyway
+    assert controller.update(now=100. + adaptDownTime + adaptHoldTime + 60) is None
@@ -0,0 +1,81 @@
+import io, os, subprocess, sys
+
+import pytest
+
+from ndnrtc_stream.commands.utils.drain import OutputDrainer, RotatingLog
+
+def test_rotating_log_rotates(tmpdir):
+    fileName = str(tmpdir.join('out.log'))
+    log = RotatingLog(fileName, maxSize=10, backupCount=2)
+    for chunk in [b'0123456789', b'abcdefghij', b'ABCDE']:
+        log.write(chunk)
+        log.flush()
+    log.close()
+    assert open(fileName, 'rb').read() == b'ABCDE'
+    assert open(fileName + '.1', 'rb').read() == b'abcdefghij'
+    assert open(fileName + '.2', 'rb').read() == b'0123456789'
+
+def test_rotating_log_drops_oldest(tmpdir):
+    fileName = str(tmpdir.join('out.log'))
+    log = RotatingLog(fileName, maxSize=4, backupCount=1)
+    log.write(b'aaaabbbbcc')
+    log.close()
+    assert open(fileName, 'rb').read() == b'cc'
+    assert open(fileName + '.1', 'rb').read() == b'bbbb'
+    assert not os.path.exists(fileName + '.2')
+
+def test_rotating_log_buffers_until_flush(tmpdir):
+    fileName = str(tmpdir.join('out.log'))
+    log = RotatingLog(fileName)
+    log.write(b'pending')
+    assert open(fileName, 'rb').read() == b''
+    log.flush()
+    assert open(fileName, 'rb').read() == b'pending'
+    log.close()
+
+def test_drains_children_until_eof(tmpdir):
+    drainer = OutputDrainer(flushInterval=0.05)
+    procs = []
+    for i in range(2):
+        p = subprocess.Popen([sys.executable, '-c',
+                              'import sys\nfor i in range(1000): sys.stdout.write("child %d line %%d\\n"%%i)'%i],
+                             stdout=subprocess.PIPE)
+        drainer.add(p.stdout, str(tmpdir.join('child%d.log'%i)))
+        procs.append(p)
+    for p in procs:
+        p.wait()
+    drainer.stop(timeout=5.)
+    assert not drainer.pipes
+    for i, p in enumerate(procs):
+        assert p.stdout.closed
+        lines = open(str(tmpdir.join('child%d.log'%i))).read().splitlines()
+        assert lines == ['child %d line %d'%(i, n) for n in range(1000)]
+
+def test_echo(tmpdir):
+    drainer = OutputDrainer(flushInterval=0.05)
+    echo = io.BytesIO()
+    r, w = os.pipe()
+    drainer.add(io.open(r, 'rb', buffering=0), str(tmpdir.join('echo.log')), echo=echo)
+    os.write(w, b'hello\n')
+    os.close(w)
+    drainer.stop(timeout=5.)
+    assert echo.getvalue() == b'hello\n'
+    assert open(str(tmpdir.join('echo.log')), 'rb').read() == b'hello\n'
+
+def test_stop_closes_wakeup_pipe_and_restarts(tmpdir):
+    drainer = OutputDrainer(flushInterval=0.05)
+    assert drainer.wakeup is None
+    for n in range(2):
+        r, w = os.pipe()
+        drainer.add(io.open(r, 'rb', buffering=0), str(tmpdir.join('run%d.log'%n)))
+        wakeup = drainer.wakeup
+        assert drainer.running
+        os.write(w, b'run %d\n'%n)
+        os.close(w)
+        drainer.stop(timeout=5.)
+        assert drainer.wakeup is None
+        assert not drainer.thread.is_alive()
+        for fd in wakeup:
+            with pytest.raises(OSError):
+                os.fstat(fd)
+        assert open(str(tmpdir.join('run%d.log'%n)), 'rb').read() == b'run %d\n'%n
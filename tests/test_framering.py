@@ -0,0 +1,117 @@
+import os, time
+
+from ndnrtc_stream.commands.utils.framering import FrameRing, frameRingHeader, frameRingMagic
+
+frameSize = 16
+
+def frame(n):
+    return bytes(bytearray([n % 256])) * frameSize
+
+def waitFor(condition, timeout=5.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+def readExactly(fd, size):
+    data = b''
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+def test_wrap_around(tmpdir):
+    ring = FrameRing(str(tmpdir.join('ring')), frameSize, slots=4)
+    ring.start()
+    try:
+        for n in range(1, 11):
+            ring.push(frame(n))
+        assert ring.writeSeq == 10
+        assert [seq for seq in range(1, 11) if ring.hasFrame(seq)] == [7, 8, 9, 10]
+        assert ring.frameView(6) is None
+        assert ring.frameView(7).tobytes() == frame(7)
+        assert ring.frameView(10).tobytes() == frame(10)
+    finally:
+        ring.stop()
+
+def test_header(tmpdir):
+    fileName = str(tmpdir.join('ring'))
+    ring = FrameRing(fileName, frameSize, slots=4)
+    ring.start()
+    for n in range(1, 6):
+        ring.push(frame(n))
+    ring.stop()
+    with open(fileName, 'rb') as f:
+        magic, version, size, slots, seq = frameRingHeader.unpack(f.read(frameRingHeader.size))
+    assert (magic, version, size, slots, seq) == (frameRingMagic, 1, frameSize, 4, 5)
+
+def test_producer_reads_from_pipe(tmpdir):
+    ring = FrameRing(str(tmpdir.join('ring')), frameSize, slots=4)
+    r, w = os.pipe()
+    pipe = os.fdopen(r, 'rb')
+    ring.startProducer(pipe)
+    try:
+        # frames split across writes are reassembled
+        data = b''.join(frame(n) for n in range(1, 4))
+        os.write(w, data[:5])
+        os.write(w, data[5:])
+        assert waitFor(lambda: ring.writeSeq == 3)
+        assert ring.frameView(2).tobytes() == frame(2)
+        os.close(w)
+        ring.producer.join(5.)
+        assert not ring.producer.is_alive()
+        assert ring.writeSeq == 3
+    finally:
+        ring.stop()
+        pipe.close()
+
+def test_reader_drops_frames_it_fell_behind_on(tmpdir):
+    pipeName = str(tmpdir.join('consumer'))
+    os.mkfifo(pipeName)
+    ring = FrameRing(str(tmpdir.join('ring')), frameSize, slots=4)
+    ring.start()
+    reader = ring.addReader('consumer', pipeName)
+    fd = -1
+    try:
+        # the reader can't connect until there is a consumer
+        for n in range(1, 21):
+            ring.push(frame(n))
+        fd = os.open(pipeName, os.O_RDONLY)
+        assert readExactly(fd, frameSize) == frame(20)
+        for n in range(21, 23):
+            ring.push(frame(n))
+        assert readExactly(fd, frameSize * 2) == frame(21) + frame(22)
+        assert waitFor(lambda: reader.frames == 3)
+        stats = ring.readerStats()['consumer']
+        assert stats['frames'] == 3
+        assert stats['drops'] == 19
+        assert stats['torn'] == 0
+        assert stats['lag'] == 0
+    finally:
+        ring.stop()
+        if fd >= 0:
+            os.close(fd)
+
+def test_reader_reconnects(tmpdir):
+    pipeName = str(tmpdir.join('consumer'))
+    os.mkfifo(pipeName)
+    ring = FrameRing(str(tmpdir.join('ring')), frameSize, slots=4)
+    ring.start()
+    reader = ring.addReader('consumer', pipeName)
+    try:
+        fd = os.open(pipeName, os.O_RDONLY)
+        ring.push(frame(1))
+        assert readExactly(fd, frameSize) == frame(1)
+        os.close(fd)
+        # written into a pipe nobody reads: lost, and the reader reopens the FIFO
+        ring.push(frame(2))
+        assert waitFor(lambda: reader.fd < 0)
+        fd = os.open(pipeName, os.O_RDONLY)
+        ring.push(frame(3))
+        assert readExactly(fd, frameSize) == frame(3)
+        os.close(fd)
+    finally:
+        ring.stop()
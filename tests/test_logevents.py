@@ -0,0 +1,98 @@
+import gzip, math, os, shutil, time
+
+from ndnrtc_stream.commands.utils.logevents import (ClientLogWatch, LogEventIndex, classifyLogLine,
+    logEventTypes, logLineTimestamp, scanLogEvents)
+
+logLines = [b'1500000000000 [ INFO ][consumer] started',
+            b'1500000000100 [ WARN ][pipeliner] interest timeout for /a/b/%FE%01',
+            b'1500000000200 [ WARN ][pipeliner] received NACK for /a/b/%FE%02',
+            b'    continuation line with a nack and no timestamp',
+            b'1500000001000 [ INFO ][buffer] rebuffering: buffer is empty',
+            b'1500000002000 [ INFO ][consumer] state changed: Fetching -> Adjusting',
+            b'1500000003000 [ WARN ][playout] skipping frames until next key frame']
+
+def eventType(line):
+    idx = classifyLogLine(line)
+    return None if idx is None else logEventTypes[idx]
+
+def test_line_timestamps():
+    assert logLineTimestamp(b'1500000000.5 message') == 1500000000500.
+    assert logLineTimestamp(b'1500000000123 message') == 1500000000123.
+    assert logLineTimestamp(b'[1500000000123] message') == 1500000000123.
+    expected = time.mktime((2017, 7, 14, 2, 40, 0, 0, 0, -1)) * 1000. + 250.
+    assert logLineTimestamp(b'2017-07-14 02:40:00.250 [ INFO ] message') == expected
+    assert logLineTimestamp(b'[2017-07-14T02:40:00,250] message') == expected
+    assert math.isnan(logLineTimestamp(b'message 1500000000123'))
+    assert math.isnan(logLineTimestamp(b'12345 message'))
+
+def test_classify():
+    assert [eventType(l) for l in logLines] == [None, 'timeout', 'nack', 'nack', 'rebuffer', 'state', 'keySkip']
+    assert eventType(b'key frame skipped') == 'keySkip'
+    assert eventType(b'new state: Chasing') == 'state'
+    assert eventType(b'TimeOut') == 'timeout'
+    # keywords alone are not events
+    assert eventType(b'state of the buffer: ok') is None
+    assert eventType(b'skipped delta frame') is None
+    assert eventType(b'snacks') is None
+
+def test_scan():
+    data = b'\n'.join(logLines)
+    events = list(scanLogEvents(data, 1000))
+    assert [(t, logEventTypes[e]) for (t, e, o, l) in events] == \
+        [(1500000000100., 'timeout'), (1500000000200., 'nack'), (1500000000200., 'nack'),
+         (1500000001000., 'rebuffer'), (1500000002000., 'state'), (1500000003000., 'keySkip')]
+    for (t, e, offset, line) in events:
+        assert data[offset - 1000:offset - 1000 + len(line)] == line
+        assert line in logLines
+
+def test_scan_without_timestamps():
+    events = list(scanLogEvents(b'nack one\nnothing\nnack two'))
+    assert [o for (t, e, o, l) in events] == [0, 17]
+    assert all(math.isnan(t) for (t, e, o, l) in events)
+
+def writeIndex(tmpdir):
+    runDir = tmpdir.mkdir('run')
+    logFile = str(runDir.join('client.log'))
+    with open(logFile, 'wb') as f:
+        f.write(b'\n'.join(logLines) + b'\n')
+    indexFile = str(runDir.join('client.nrevents'))
+    watch = ClientLogWatch(logFile, indexFile, labels={'stream': 'cam'}, fromStart=True)
+    watch.start()
+    deadline = time.time() + 5.
+    while sum(watch.store.summary().values()) < 6 and time.time() < deadline:
+        time.sleep(0.01)
+    watch.stop()
+    return runDir, logFile, indexFile
+
+def test_index_counts(tmpdir):
+    runDir, logFile, indexFile = writeIndex(tmpdir)
+    index = LogEventIndex(indexFile)
+    assert len(index) == 6
+    assert index.labels['stream'] == 'cam'
+    assert index.logFile == os.path.abspath(logFile)
+    assert index.counts() == {'timeout': 1, 'nack': 2, 'rebuffer': 1, 'state': 1, 'keySkip': 1}
+    assert index.times('nack') == [1500000000200., 1500000000200.]
+    assert index.times('rebuffer') == [1500000001000.]
+
+def test_index_query(tmpdir):
+    runDir, logFile, indexFile = writeIndex(tmpdir)
+    index = LogEventIndex(indexFile)
+    events = index.query(start=1500000000200., end=1500000002000., types=['nack', 'state'])
+    assert [(e['t'], e['event'], e['line']) for e in events] == \
+        [(1500000000.2, 'nack', logLines[2].decode()), (1500000000.2, 'nack', logLines[3].decode()),
+         (1500000002., 'state', logLines[5].decode())]
+
+def test_index_finds_archived_log(tmpdir):
+    runDir, logFile, indexFile = writeIndex(tmpdir)
+    # run directory archived (log gzipped) and moved away
+    with open(logFile, 'rb') as src:
+        with gzip.open(logFile + '.gz', 'wb') as dst:
+            dst.write(src.read())
+    os.remove(logFile)
+    moved = str(tmpdir.join('moved'))
+    shutil.move(str(runDir), moved)
+    events = LogEventIndex(os.path.join(moved, 'client.nrevents')).query(types=['keySkip'])
+    assert [e['line'] for e in events] == [logLines[6].decode()]
+    os.remove(os.path.join(moved, 'client.log.gz'))
+    events = LogEventIndex(os.path.join(moved, 'client.nrevents')).query(types=['keySkip'])
+    assert [e['line'] for e in events] == [None]
@@ -0,0 +1,120 @@
+import socket
+
+import pytest
+
+from ndnrtc_stream.commands.utils.metrics import MetricsExporter, metricName, openMetricsType, prometheusType
+from ndnrtc_stream.commands.utils.statstore import StatStore
+
+@pytest.fixture
+def exporter():
+    exporter = MetricsExporter(port=0, host='127.0.0.1')
+    yield exporter
+    exporter.server.server_close()
+
+def makeStore():
+    store = StatStore(['framesPub', 'drdEst', 'isent'])
+    for i in range(5):
+        store.ingest('%d\t%d\t%d\t%d\n'%(i * 1000, i * 25, 100 + i, i * 10))
+    return store
+
+def get(address, path='/metrics', accept=None):
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    s = socket.socket(family, socket.SOCK_STREAM)
+    s.connect(address)
+    request = 'GET %s HTTP/1.0\r\n'%path
+    if accept:
+        request += 'Accept: %s\r\n'%accept
+    s.sendall((request + '\r\n').encode('ascii'))
+    response = b''
+    while True:
+        data = s.recv(65536)
+        if not data:
+            break
+        response += data
+    s.close()
+    head, body = response.decode('utf-8').split('\r\n\r\n', 1)
+    headers = head.split('\r\n')
+    return int(headers[0].split()[1]), headers, body
+
+def test_metric_name():
+    assert metricName('framesPub') == 'ndnrtc_frames_pub'
+    assert metricName('drdEst') == 'ndnrtc_drd_est'
+    assert metricName('isent') == 'ndnrtc_isent'
+
+def test_prometheus_format(exporter):
+    exporter.addStore(makeStore(), {'stream': 'cam', 'prefix': '/a"b'}, {'drdEst': 'DRD estimate'})
+    lines = exporter.render().splitlines()
+    labels = 'prefix="/a\\"b",stream="cam"'
+    assert lines[:6] == ['# HELP ndnrtc_frames_pub_total framesPub',
+                         '# TYPE ndnrtc_frames_pub_total counter',
+                         'ndnrtc_frames_pub_total{%s} 100.0'%labels,
+                         '# HELP ndnrtc_drd_est DRD estimate',
+                         '# TYPE ndnrtc_drd_est gauge',
+                         'ndnrtc_drd_est{%s} 104.0'%labels]
+    assert '# TYPE ndnrtc_frames_pub_rate gauge' in lines
+    assert 'ndnrtc_frames_pub_rate{%s,window="1s"} 25.0'%labels in lines
+    assert 'ndnrtc_isent_rate{%s,window="ewma"} 10.0'%labels in lines
+    assert '# EOF' not in lines
+
+def test_openmetrics_format(exporter):
+    exporter.addStore(makeStore(), {'stream': 'cam'})
+    lines = exporter.render(openMetrics=True).splitlines()
+    # OpenMetrics counter families have no _total suffix, their samples do
+    assert lines[:3] == ['# HELP ndnrtc_frames_pub framesPub',
+                         '# TYPE ndnrtc_frames_pub counter',
+                         'ndnrtc_frames_pub_total{stream="cam"} 100.0']
+    assert lines[-1] == '# EOF'
+
+def test_families_group_stores(exporter):
+    exporter.addStore(makeStore(), {'stream': 'a'})
+    exporter.addStore(makeStore(), {'stream': 'b'})
+    lines = exporter.render().splitlines()
+    assert lines.count('# TYPE ndnrtc_drd_est gauge') == 1
+    i = lines.index('# TYPE ndnrtc_drd_est gauge')
+    assert lines[i+1:i+3] == ['ndnrtc_drd_est{stream="a"} 104.0', 'ndnrtc_drd_est{stream="b"} 104.0']
+
+def test_nan_values_are_skipped(exporter):
+    store = StatStore(['framesPub', 'drdEst'])
+    store.ingest('1000\tx\t5\n')
+    exporter.addStore(store, {'stream': 'cam'})
+    text = exporter.render()
+    assert 'ndnrtc_drd_est{stream="cam"} 5.0' in text
+    assert not [l for l in text.splitlines() if l.startswith('ndnrtc_frames_pub')]
+
+def test_render_is_cached_until_new_data(exporter):
+    store = makeStore()
+    exporter.addStore(store, {'stream': 'cam'})
+    text = exporter.render()
+    assert exporter.render() is text
+    store.ingest('5000\t125\t200\t50\n')
+    updated = exporter.render()
+    assert 'ndnrtc_drd_est{stream="cam"} 200.0' in updated
+
+def test_serves_http(exporter):
+    exporter.addStore(makeStore(), {'stream': 'cam'})
+    exporter.start()
+    try:
+        address = ('127.0.0.1', exporter.server.server_address[1])
+        status, headers, body = get(address)
+        assert status == 200
+        assert 'Content-Type: %s'%prometheusType in headers
+        assert body == exporter.render()
+        status, headers, body = get(address, accept='application/openmetrics-text; version=1.0.0')
+        assert 'Content-Type: %s'%openMetricsType in headers
+        assert body.endswith('# EOF\n')
+        assert get(address, '/other')[0] == 404
+    finally:
+        exporter.stop()
+
+def test_serves_unix_socket(tmpdir):
+    socketPath = str(tmpdir.join('metrics.sock'))
+    exporter = MetricsExporter(socketPath=socketPath)
+    exporter.addStore(makeStore(), {'stream': 'cam'})
+    exporter.start()
+    try:
+        status, headers, body = get(socketPath, '/')
+        assert status == 200
+        assert 'ndnrtc_drd_est{stream="cam"} 104.0' in body
+    finally:
+        exporter.stop()
+    assert not tmpdir.join('metrics.sock').exists()
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from ndnrtc_stream.commands.utils.ndnseccache import NdnsecCache
+
+@pytest.fixture
+def ndnHome(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.delenv('NDN_CLIENT_PIB', raising=False)
+    monkeypatch.delenv('NDN_CLIENT_TPM', raising=False)
+    home = tmpdir.mkdir('.ndn')
+    home.join('pib.db').write('v1')
+    return home
+
+def makeCache(tmpdir):
+    return NdnsecCache(str(tmpdir.join('cache', 'ndnsec.json')))
+
+def test_entries_persist(tmpdir, ndnHome):
+    makeCache(tmpdir).set('identities', ['/a', '/b'])
+    assert makeCache(tmpdir).get('identities') == ['/a', '/b']
+    assert makeCache(tmpdir).get('default') is None
+
+def test_pib_change_drops_cache(tmpdir, ndnHome):
+    cache = makeCache(tmpdir)
+    cache.set('default', '/a')
+    ndnHome.join('pib.db').write('v2 with a new key')
+    assert cache.get('default') is None
+    assert makeCache(tmpdir).get('default') is None
+
+def test_tpm_change_drops_cache(tmpdir, ndnHome):
+    cache = makeCache(tmpdir)
+    cache.set('default', '/a')
+    ndnHome.mkdir('ndnsec-key-file')
+    assert makeCache(tmpdir).get('default') is None
+
+def test_locator_change_drops_cache(tmpdir, ndnHome, monkeypatch):
+    cache = makeCache(tmpdir)
+    cache.set('default', '/a')
+    monkeypatch.setenv('NDN_CLIENT_PIB', 'pib-sqlite3:%s'%tmpdir.mkdir('otherpib'))
+    assert cache.get('default') is None
+
+def test_invalidate(tmpdir, ndnHome):
+    cache = makeCache(tmpdir)
+    cache.set('default', '/a')
+    cache.invalidate()
+    assert not os.path.exists(cache.fileName)
+    assert cache.get('default') is None
+
+def test_corrupted_file_is_ignored(tmpdir, ndnHome):
+    cache = makeCache(tmpdir)
+    cache.set('default', '/a')
+    with open(cache.fileName, 'w') as f:
+        f.write('{not json')
+    assert makeCache(tmpdir).get('default') is None
+    makeCache(tmpdir).set('default', '/b')
+    assert makeCache(tmpdir).get('default') == '/b'
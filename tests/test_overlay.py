@@ -0,0 +1,73 @@
+import os, time
+
+from ndnrtc_stream.commands.utils import overlay
+from ndnrtc_stream.commands.utils.overlay import OverlayWriter, overlayPath
+
+def waitFor(condition, timeout=5.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+class Renderer(object):
+    def __init__(self):
+        self.text = u'a'
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.text is None:
+            raise Exception('render failed')
+        return self.text
+
+def test_rewrites_only_on_change(tmpdir):
+    fileName = str(tmpdir.join('overlay.txt'))
+    render = Renderer()
+    writer = OverlayWriter(fileName, render, interval=0.01)
+    assert open(fileName).read() == '-'
+    assert writer.writes == 1
+    writer.start()
+    try:
+        time.sleep(0.1)
+        # nothing signalled, nothing rendered
+        assert render.calls == 0
+        writer.update()
+        assert waitFor(lambda: writer.writes == 2)
+        assert open(fileName).read() == 'a'
+        writer.update()
+        assert waitFor(lambda: render.calls == 2)
+        time.sleep(0.05)
+        assert writer.writes == 2
+        render.text = u'b'
+        writer.update()
+        assert waitFor(lambda: writer.writes == 3)
+        assert open(fileName).read() == 'b'
+    finally:
+        writer.stop()
+    assert not os.path.exists(writer.tmpFileName)
+
+def test_render_errors_keep_last_text(tmpdir):
+    fileName = str(tmpdir.join('overlay.txt'))
+    render = Renderer()
+    render.text = None
+    writer = OverlayWriter(fileName, render, interval=0.01)
+    writer.start()
+    try:
+        writer.update()
+        assert waitFor(lambda: render.calls == 1)
+        render.text = u'recovered'
+        writer.update()
+        assert waitFor(lambda: writer.writes == 2)
+    finally:
+        writer.stop(remove=True)
+    assert not os.path.exists(fileName)
+
+def test_overlay_path(tmpdir, monkeypatch):
+    runDir = str(tmpdir.mkdir('ndnrtc-stream.1234'))
+    assert overlayPath(runDir, useShm=False) == os.path.join(runDir, 'overlay.txt')
+    monkeypatch.setattr(overlay, 'overlayShmDir', str(tmpdir.mkdir('shm')))
+    assert overlayPath(runDir, 'stats') == str(tmpdir.join('shm', 'ndnrtc-stream.1234.stats.txt'))
+    monkeypatch.setattr(overlay, 'overlayShmDir', str(tmpdir.join('missing')))
+    assert overlayPath(runDir, 'stats') == os.path.join(runDir, 'stats.txt')
@@ -0,0 +1,63 @@
+import math
+
+from ndnrtc_stream.commands.utils.rates import CounterRate, RateEngine, windowName
+from ndnrtc_stream.commands.utils.statstore import StatStore
+
+def test_rate_over_window():
+    r = CounterRate()
+    for i in range(11):
+        r.add(i * 1000., i * 25.)
+    assert r.rate(1000) == 25.
+    assert r.rate(10000) == 25.
+
+def test_rate_needs_two_samples():
+    r = CounterRate()
+    assert math.isnan(r.rate(1000))
+    r.add(1000., 10.)
+    assert math.isnan(r.rate(1000))
+
+def test_counter_reset_counts_from_zero():
+    r = CounterRate()
+    r.add(0., 100.)
+    r.add(1000., 110.)
+    # client restarted: counter starts over
+    r.add(2000., 10.)
+    r.add(3000., 20.)
+    assert r.rate(1000) == 10.
+    # 100 -> 110, then 0 -> 20: 30 frames in 3 seconds
+    assert r.rate(3000) == 10.
+
+def test_out_of_order_samples_are_ignored():
+    r = CounterRate()
+    r.add(1000., 10.)
+    r.add(2000., 20.)
+    r.add(1500., 1000.)
+    r.add(float('nan'), 1000.)
+    assert r.rate(1000) == 10.
+
+def test_ewma_converges_and_weights_intervals():
+    r = CounterRate(timeConstant=1000.)
+    r.add(0., 0.)
+    r.add(1000., 10.)
+    assert r.ewma == 10.
+    r.add(2000., 30.)
+    assert abs(r.ewma - (10. + (1. - math.exp(-1.)) * 10.)) < 1e-9
+    for i in range(3, 30):
+        r.add(i * 1000., 30. + (i - 2) * 20.)
+    assert abs(r.ewma - 20.) < 1e-6
+
+def test_engine_tracks_counters_only():
+    e = RateEngine(['framesPub', 'prodRate'], set(['framesPub']), windows=[1000, 2000])
+    e.add(0., [0., 30.])
+    e.add(1000., [25., 30.])
+    assert e.rate('framesPub') == 25.
+    snapshot = e.snapshot()
+    assert list(snapshot.keys()) == ['framesPub']
+    assert sorted(snapshot['framesPub'].keys()) == ['1s', '2s', 'ewma']
+    assert windowName(500) == '500ms'
+
+def test_store_rates_agree_across_reset():
+    store = StatStore(['framesPub'])
+    for (t, v) in [(0, 100), (1000, 125), (2000, 150), (3000, 20), (4000, 45)]:
+        store.ingest('%d\t%d\n'%(t, v))
+    assert store.rates.rate('framesPub', 4000) == store.counterRate('framesPub') == 95. / 4.
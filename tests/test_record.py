@@ -0,0 +1,85 @@
+import json, time
+
+import pytest
+
+from ndnrtc_stream.commands.utils.record import FrameRecorder, recordIndexEntry
+
+frameSize = 8
+
+def frame(n):
+    return bytearray([n % 256]) * frameSize
+
+def makeRecorder(tmpdir, **kwargs):
+    return FrameRecorder(str(tmpdir.join('rec')), 4, 2, 'gray', frameSize, **kwargs)
+
+def waitWritten(recorder, frames, timeout=5.):
+    deadline = time.time() + timeout
+    while recorder.written < frames and time.time() < deadline:
+        time.sleep(0.01)
+
+def readIndex(tmpdir):
+    data = tmpdir.join('rec', 'index.bin').read_binary()
+    return [recordIndexEntry.unpack_from(data, i) for i in range(0, len(data), recordIndexEntry.size)]
+
+def readManifest(tmpdir):
+    return json.loads(tmpdir.join('rec', 'segments.json').read())
+
+def test_segments_rotate_by_size(tmpdir):
+    recorder = makeRecorder(tmpdir, segmentSize=3 * frameSize)
+    recorder.start()
+    for n in range(7):
+        recorder.onFrame(frame(n), 100. + n * 0.1)
+        waitWritten(recorder, n + 1)
+    recorder.stop()
+    manifest = readManifest(tmpdir)
+    assert [s['file'] for s in manifest['segments']] == ['segment-00000.raw', 'segment-00001.raw', 'segment-00002.raw']
+    assert [s['first_frame'] for s in manifest['segments']] == [0, 3, 6]
+    assert [s['frames'] for s in manifest['segments']] == [3, 3, 1]
+    assert manifest['frames'] == 7
+    assert manifest['dropped'] == 0
+    assert manifest['offset_unit'] == 'byte'
+    assert manifest['frame_size'] == frameSize
+    assert tmpdir.join('rec', 'segment-00001.raw').read_binary() == bytes(frame(3) + frame(4) + frame(5))
+    index = readIndex(tmpdir)
+    assert [(no, seg, offset) for (no, seg, offset, t) in index] == [(n, n // 3, (n % 3) * frameSize) for n in range(7)]
+    assert index[6][3] == 100.6
+    assert recorder.stats() == {'frames': 7, 'dropped': 0, 'bytes': 7 * frameSize, 'segments': 3, 'max_queued': 1}
+
+def test_segments_rotate_by_time(tmpdir):
+    recorder = makeRecorder(tmpdir, segmentTime=1)
+    recorder.start()
+    for n, t in enumerate([0., 0.5, 1., 1.2, 2.5]):
+        recorder.onFrame(frame(n), t)
+        waitWritten(recorder, n + 1)
+    recorder.stop()
+    segments = readManifest(tmpdir)['segments']
+    assert [(s['first_frame'], s['start'], s['end'], s['frames']) for s in segments] == \
+        [(0, 0., 0.5, 2), (2, 1., 1.2, 2), (4, 2.5, 2.5, 1)]
+
+@pytest.mark.parametrize('dropPolicy,kept', [('oldest', [2, 3]), ('newest', [0, 1])])
+def test_drop_policy(tmpdir, dropPolicy, kept):
+    recorder = makeRecorder(tmpdir, queueFrames=2, dropPolicy=dropPolicy)
+    # frames queue up while the writer thread is not running yet
+    recorder.running = True
+    for n in range(4):
+        recorder.onFrame(frame(n), float(n))
+    recorder.start()
+    recorder.stop()
+    assert [entry[0] for entry in readIndex(tmpdir)] == kept
+    assert tmpdir.join('rec', 'segment-00000.raw').read_binary() == b''.join(bytes(frame(n)) for n in kept)
+    manifest = readManifest(tmpdir)
+    assert manifest['frames'] == 2
+    assert manifest['dropped'] == 2
+    assert recorder.stats()['max_queued'] == 2
+
+def test_frames_after_stop_are_ignored(tmpdir):
+    recorder = makeRecorder(tmpdir)
+    recorder.start()
+    recorder.stop()
+    recorder.onFrame(frame(0), 0.)
+    assert recorder.received == 0
+    assert readManifest(tmpdir)['segments'] == []
+
+def test_unknown_drop_policy(tmpdir):
+    with pytest.raises(Exception):
+        makeRecorder(tmpdir, dropPolicy='random')
@@ -0,0 +1,103 @@
+import gzip, os, subprocess, time
+
+import pytest
+
+from ndnrtc_stream.commands.utils.rundir import RunDirs, readRunInfo, runDirPrefix, writeRunInfo
+
+def makeRun(parent, name, **info):
+    runDir = parent.mkdir(runDirPrefix + name)
+    writeRunInfo(str(runDir), info)
+    return runDir
+
+def makeArchived(parent, name, ageDays=0., size=1000):
+    return makeRun(parent, name, pid=1, finished=time.time() - ageDays * 86400., archived=time.time(),
+                   bytes=size, archived_bytes=size)
+
+def remaining(parent):
+    return sorted(p.basename[len(runDirPrefix):] for p in parent.listdir() if p.basename.startswith(runDirPrefix))
+
+def deadPid():
+    proc = subprocess.Popen(['true'])
+    proc.wait()
+    return proc.pid
+
+def test_keep_runs(tmpdir):
+    for i in range(4):
+        makeArchived(tmpdir, 'run%d'%i, ageDays=i * 0.1)
+    RunDirs(str(tmpdir), keepRuns=2).trim()
+    assert remaining(tmpdir) == ['run0', 'run1']
+
+def test_keep_size(tmpdir):
+    for i in range(4):
+        makeArchived(tmpdir, 'run%d'%i, ageDays=i * 0.1, size=400 * 1024)
+    RunDirs(str(tmpdir), keepSize=1).trim()
+    assert remaining(tmpdir) == ['run0', 'run1']
+
+def test_keep_days(tmpdir):
+    makeArchived(tmpdir, 'new', ageDays=1)
+    makeArchived(tmpdir, 'old', ageDays=8)
+    RunDirs(str(tmpdir), keepDays=7).trim()
+    assert remaining(tmpdir) == ['new']
+
+def test_trim_only_touches_archived_runs(tmpdir):
+    makeArchived(tmpdir, 'old', ageDays=30)
+    makeRun(tmpdir, 'running', pid=os.getpid(), started=time.time() - 30 * 86400.)
+    tmpdir.mkdir(runDirPrefix + 'foreign').join('data').write('x')
+    RunDirs(str(tmpdir), keepRuns=0).trim()
+    assert remaining(tmpdir) == ['foreign', 'running']
+
+def test_collect_archives_finished_runs(tmpdir):
+    root, history = tmpdir.mkdir('root'), tmpdir.mkdir('history')
+    run = makeRun(root, 'done', pid=os.getpid(), finished=time.time())
+    run.join('client.log').write('x' * 10000)
+    run.join('small.log').write('x')
+    run.join('frames.ring').write('ring')
+    os.mkfifo(str(run.join('sink')))
+    makeRun(root, 'live', pid=os.getpid())
+    abandoned = makeRun(root, 'abandoned', pid=deadPid())
+    abandoned.join('consumer.out').write('y' * 5000)
+    root.mkdir(runDirPrefix + 'foreign')
+    RunDirs(str(root), str(history)).collect()
+    assert remaining(root) == ['foreign', 'live']
+    assert remaining(history) == ['abandoned', 'done']
+    archived = history.join(runDirPrefix + 'done')
+    assert sorted(p.basename for p in archived.listdir()) == ['client.log.gz', 'run.json', 'small.log']
+    with gzip.open(str(archived.join('client.log.gz')), 'rb') as f:
+        assert f.read() == b'x' * 10000
+    info = readRunInfo(str(archived))
+    assert info['compressed_files'] == 1
+    assert info['archived_bytes'] < info['bytes']
+    info = readRunInfo(str(history.join(runDirPrefix + 'abandoned')))
+    assert info['archived'] and info['finished']
+    assert [os.path.basename(d) for (d, i) in RunDirs(str(root), str(history)).history()] == \
+        [runDirPrefix + 'abandoned', runDirPrefix + 'done']
+
+def test_collect_is_idempotent(tmpdir):
+    run = makeRun(tmpdir, 'done', pid=1, finished=time.time())
+    run.join('client.log').write('x' * 10000)
+    runDirs = RunDirs(str(tmpdir))
+    runDirs.collect()
+    archived = readRunInfo(str(run))['archived']
+    runDirs.collect()
+    assert readRunInfo(str(run))['archived'] == archived
+    assert sorted(p.basename for p in run.listdir()) == ['client.log.gz', 'run.json']
+
+def test_create_and_finish(tmpdir, monkeypatch):
+    monkeypatch.setattr(RunDirs, 'startJanitor', lambda self: None)
+    runDirs = RunDirs(str(tmpdir))
+    runDir = runDirs.create()
+    nested = runDirs.create()
+    assert os.path.dirname(nested) == runDir
+    assert readRunInfo(runDir)['pid'] == os.getpid()
+    assert readRunInfo(nested) is None
+    open(os.path.join(nested, 'client.log'), 'w').write('log')
+    os.mkfifo(os.path.join(nested, 'sink'))
+    size = os.path.getsize(os.path.join(runDir, 'run.json')) + 3
+    assert runDirs.finish() == (runDir, size, 2)
+    assert not os.path.exists(os.path.join(nested, 'sink'))
+    info = readRunInfo(runDir)
+    assert info['finished'] and info['files'] == 2
+    # a run that left nothing behind is removed
+    empty = runDirs.create()
+    assert runDirs.finish()[0] is None
+    assert not os.path.exists(empty)
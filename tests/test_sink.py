@@ -0,0 +1,74 @@
+import os, time
+
+from ndnrtc_stream.commands.utils.sink import FrameInfo, FrameTiming, SinkReader, frameInfoHeader
+
+def makeInfo(playbackNo):
+    info = FrameInfo()
+    info.playbackNo = playbackNo
+    return info
+
+def test_stalls():
+    timing = FrameTiming(stallThreshold=100.)
+    for t in [0., 0.03, 0.06, 0.5, 0.53, 0.73]:
+        timing.onFrame(None, 10. + t)
+    summary = timing.summary()
+    assert summary['stalls'] == 2
+    assert round(summary['stall_time_ms']) == 640
+    assert round(summary['longest_stall_ms']) == 440
+    assert [round(s['duration_ms']) for s in summary['recent_stalls']] == [440, 200]
+    assert round(summary['recent_stalls'][0]['start'], 3) == 10.06
+    assert summary['interval_histogram']['<=30'] == 3
+    assert summary['interval_histogram']['<=200'] == 1
+    assert summary['interval_histogram']['<=500'] == 1
+    assert summary['gaps'] == 0
+
+def test_current_stall():
+    timing = FrameTiming(stallThreshold=100.)
+    assert timing.currentStall(10.) == 0.
+    timing.onFrame(None, 10.)
+    assert timing.currentStall(10.05) == 0.
+    assert round(timing.currentStall(10.3)) == 300
+
+def test_gaps():
+    timing = FrameTiming()
+    for i, no in enumerate([1, 2, 3, 6, 7, 9, 9, -1, 10]):
+        timing.onFrame(None, i * 0.03, makeInfo(no))
+    summary = timing.summary()
+    assert summary['gaps'] == 2
+    assert summary['frames_missing'] == 3
+    assert timing.statStore.latest('framesMissing') == 3.
+
+def test_gaps_need_frame_info():
+    timing = FrameTiming()
+    timing.onFrame(None, 0.)
+    timing.onFrame(None, 0.03, None)
+    assert timing.summary()['gaps'] == 0
+
+def test_reader_with_frame_info(tmpdir):
+    pipeName = str(tmpdir.join('sink'))
+    os.mkfifo(pipeName)
+    frameSize = 64
+    timing = FrameTiming()
+    frames = []
+    reader = SinkReader(pipeName, frameSize, frameInfo=True,
+                        onFrame=lambda frame, t, info: frames.append((bytes(frame), info.playbackNo)))
+    reader.addListener(timing.onFrame)
+    reader.start()
+    try:
+        fd = os.open(pipeName, os.O_WRONLY)
+        for no in [1, 2, 5, 6]:
+            name = b'/ndnrtc/frame/%d'%no
+            os.write(fd, frameInfoHeader.pack(1000 + no, no, len(name)) + name + bytes(bytearray([no])) * frameSize)
+        os.close(fd)
+        deadline = time.time() + 5.
+        while len(frames) < 4 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        reader.stop()
+    assert [no for (f, no) in frames] == [1, 2, 5, 6]
+    assert frames[2][0] == b'\x05' * frameSize
+    assert timing.summary()['gaps'] == 1
+    assert timing.summary()['frames_missing'] == 2
+    stats = reader.stats()
+    assert stats['frames'] == 4
+    assert stats['bytes'] == 4 * (frameInfoHeader.size + frameSize) + sum(len('/ndnrtc/frame/%d'%n) for n in [1, 2, 5, 6])
@@ -0,0 +1,64 @@
+import io, math
+
+import pytest
+
+from ndnrtc_stream.commands.utils.statrecord import StatRecorder, StatRecording, statRecordName
+from ndnrtc_stream.commands.utils.statstore import StatStore, counterRates, counterTotal
+
+def test_round_trip(tmpdir):
+    fileName = str(tmpdir.join('publish.nrstat'))
+    recorder = StatRecorder(fileName, ['framesPub', 'drdEst'], {'role': 'publish'})
+    recorder.write(1000., [25., float('nan')])
+    recorder.write(2000., [50., 120.])
+    recorder.close()
+
+    recording = StatRecording(fileName)
+    assert recording.statistics == ['framesPub', 'drdEst']
+    assert recording.labels == {'role': 'publish'}
+    assert len(recording) == 2
+    assert list(recording.timestamps()) == [1000., 2000.]
+    assert list(recording.column('framesPub')) == [25., 50.]
+    drd = list(recording.column('drdEst'))
+    assert math.isnan(drd[0]) and drd[1] == 120.
+
+def test_store_records_ingested_rows(tmpdir):
+    fileName = str(tmpdir.join('fetch.nrstat'))
+    store = StatStore(['framesPlayed'])
+    store.recorder = StatRecorder(fileName, store.statistics)
+    store.ingestLines(['1000\t10\n', '2000\t35\n'])
+    store.recorder.close()
+    assert list(StatRecording(fileName).column('framesPlayed')) == [10., 35.]
+
+def test_append_drops_partial_row(tmpdir):
+    fileName = str(tmpdir.join('publish.nrstat'))
+    recorder = StatRecorder(fileName, ['framesPub'])
+    recorder.write(1000., [25.])
+    recorder.close()
+    with io.open(fileName, 'ab') as f:
+        f.write(b'\x00' * 5)
+    recorder = StatRecorder(fileName, ['framesPub'])
+    recorder.write(2000., [50.])
+    recorder.close()
+    assert list(StatRecording(fileName).timestamps()) == [1000., 2000.]
+
+def test_append_needs_same_statistics(tmpdir):
+    fileName = str(tmpdir.join('publish.nrstat'))
+    StatRecorder(fileName, ['framesPub']).close()
+    with pytest.raises(Exception):
+        StatRecorder(fileName, ['framesDrop'])
+
+def test_not_a_recording(tmpdir):
+    fileName = str(tmpdir.join('client.stat'))
+    with io.open(fileName, 'wb') as f:
+        f.write(b'1000\t25\n' * 4)
+    with pytest.raises(Exception):
+        StatRecording(fileName)
+
+def test_record_name():
+    assert statRecordName('fetch', '/ndnrtc/stream', 'camera') == 'fetch-ndnrtc-stream-camera.nrstat'
+
+def test_counter_helpers_skip_resets():
+    timestamps = [0., 1000., 2000., 3000.]
+    values = [100., 110., 5., 15.]
+    assert counterRates(timestamps, values) == [10., 10.]
+    assert counterTotal(values) == 25.
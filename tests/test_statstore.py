@@ -0,0 +1,77 @@
+import math
+
+from ndnrtc_stream.commands.utils.statstore import StatStore, formatStat, percentile, summarize
+
+def makeStore(capacity=None):
+    store = StatStore(['framesPub', 'drdEst'], capacity=capacity)
+    for i in range(10):
+        store.ingest('%d\t%d\t%d\n'%(i * 1000, i * 25, 100 + i))
+    return store
+
+def test_ingest_and_latest():
+    store = makeStore()
+    assert len(store) == 10
+    assert store.latest('framesPub') == 225.
+    assert store.latestTimestamp() == 9000.
+    assert store.latestRow() == {'framesPub': 225., 'drdEst': 109.}
+
+def test_malformed_values_are_nan():
+    store = StatStore(['framesPub', 'drdEst'])
+    assert not store.ingest('garbage\n')
+    assert store.ingest('1000\tx\n')
+    assert math.isnan(store.latest('framesPub'))
+    assert math.isnan(store.latest('drdEst'))
+    assert store.values('drdEst') == []
+
+def test_window_wraps_around():
+    store = makeStore(capacity=4)
+    assert len(store) == 4
+    assert list(store.window('drdEst')) == [106., 107., 108., 109.]
+    assert list(store.window('drdEst', 2)) == [108., 109.]
+    assert list(store.windowTimestamps(3)) == [7000., 8000., 9000.]
+
+def test_stats_and_percentiles():
+    store = makeStore()
+    assert store.mean('drdEst') == 104.5
+    assert store.min('drdEst', 3) == 107.
+    assert store.max('drdEst') == 109.
+    assert store.percentile('drdEst', 50) == 104.5
+    assert store.percentile('drdEst', 100) == 109.
+    assert math.isnan(percentile([], 50))
+
+def test_format_stat():
+    assert formatStat('DRD (ms)', float('nan')) == ''
+    assert formatStat('Frames', 3.) == '\n%20s %-10d'%('Frames', 3)
+    assert formatStat('Rate', 2.5) == '\n%20s %-10.2f'%('Rate', 2.5)
+
+def test_summarize():
+    assert summarize([]) is None
+    summary = summarize([4., 1., 3., 2.])
+    assert (summary['min'], summary['max'], summary['mean'], summary['p50']) == (1., 4., 2.5, 2.5)
+
+def test_counter_rate():
+    store = makeStore()
+    assert store.counterRate('framesPub') == 25.
+    assert store.counterRate('framesPub', 2) == 25.
+    assert math.isnan(StatStore(['framesPub']).counterRate('framesPub'))
+
+def test_counter_rate_across_reset():
+    store = StatStore(['framesPub'])
+    # ndnrtc-client restarted after the third line: the counter starts over
+    for (t, v) in [(0, 100), (1000, 125), (2000, 150), (3000, 20), (4000, 45)]:
+        store.ingest('%d\t%d\n'%(t, v))
+    # 50 frames before the restart, 20 while restarting, 25 after: 95 in 4 seconds
+    assert store.counterRate('framesPub') == 95. / 4.
+    assert store.counterRate('framesPub', 2) == 25.
+
+def test_stress_step_rates_across_restart():
+    # publisher stats of a stress step (25 fps, 1% dropped); ndnrtc-client restarts between 5 and 6 sec
+    store = StatStore(['framesCaptured', 'framesPub', 'framesDrop'])
+    captured = published = dropped = 0.
+    for t in range(11):
+        if t == 6:
+            captured = published = dropped = 0.
+        captured, published, dropped = captured + 25., published + 24.75, dropped + 0.25
+        store.add(t * 1000., [captured, published, dropped])
+    assert abs(store.counterRate('framesPub') - 24.75) < 1e-9
+    assert abs(store.counterRate('framesDrop') / store.counterRate('framesCaptured') - 0.01) < 1e-9
@@ -0,0 +1,146 @@
+import subprocess, sys, time
+
+import pytest
+
+from ndnrtc_stream.commands import base
+from ndnrtc_stream.commands.base import Supervisor
+from ndnrtc_stream.commands.utils.drain import OutputDrainer
+
+class FakeProc(object):
+    pid = 1234
+    stdout = None
+    stderr = None
+
+    def __init__(self):
+        self.returncode = None
+        self.terminated = False
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.terminated = True
+        self.returncode = -15
+
+    def kill(self):
+        self.returncode = -9
+
+    def wait(self):
+        return self.returncode
+
+class Children(object):
+    """ start() for Supervisor.add, keeps every FakeProc it started. """
+    def __init__(self):
+        self.procs = []
+
+    def __call__(self):
+        self.procs.append(FakeProc())
+        return self.procs[-1]
+
+    @property
+    def last(self):
+        return self.procs[-1]
+
+@pytest.fixture
+def timing(monkeypatch):
+    monkeypatch.setattr(base, 'restartBackoff', 1.)
+    monkeypatch.setattr(base, 'restartBackoffMax', 4.)
+    monkeypatch.setattr(base, 'restartStableTime', 60.)
+    monkeypatch.setattr(base, 'healthTimeout', 15.)
+
+def makeSupervisor(tmpdir, **kwargs):
+    children = Children()
+    supervisor = Supervisor(None, str(tmpdir))
+    supervisor.add('client', children, **kwargs)
+    supervisor.start()
+    return supervisor, supervisor.children[0], children
+
+def test_clean_exit_ends_supervision(tmpdir, timing):
+    supervisor, child, children = makeSupervisor(tmpdir)
+    children.last.returncode = 0
+    supervisor.check(child, time.time())
+    assert not supervisor.running
+    assert child['nextRestart'] is None
+    assert supervisor.report() == {'client': {'restarts': 0, 'reconfigs': 0, 'exit_codes': [0]}}
+
+def test_no_restart_child_ends_supervision(tmpdir, timing):
+    supervisor, child, children = makeSupervisor(tmpdir, restart=False)
+    children.last.returncode = 1
+    supervisor.check(child, time.time())
+    assert not supervisor.running
+    assert len(children.procs) == 1
+
+def test_backoff_doubles_up_to_max(tmpdir, timing):
+    supervisor, child, children = makeSupervisor(tmpdir)
+    now = time.time()
+    delays = []
+    for i in range(4):
+        children.last.returncode = 1
+        supervisor.check(child, now)
+        delays.append(child['nextRestart'] - now)
+        # not yet
+        supervisor.check(child, child['nextRestart'] - 0.01)
+        assert len(children.procs) == i + 1
+        now = child['nextRestart']
+        supervisor.check(child, now)
+        assert len(children.procs) == i + 2
+    assert delays == [1., 2., 4., 4.]
+    assert supervisor.running
+    assert supervisor.report()['client']['restarts'] == 4
+
+def test_backoff_resets_once_stable(tmpdir, timing):
+    supervisor, child, children = makeSupervisor(tmpdir)
+    children.last.returncode = 1
+    supervisor.check(child, time.time())
+    supervisor.check(child, child['nextRestart'])
+    assert child['backoff'] == 2.
+    supervisor.check(child, child['startTime'] + 30.)
+    assert child['backoff'] == 2.
+    supervisor.check(child, child['startTime'] + 61.)
+    assert child['backoff'] == 1.
+
+def test_unresponsive_child_is_restarted(tmpdir, timing):
+    activity = [None]
+    supervisor, child, children = makeSupervisor(tmpdir, activity=lambda: activity[0])
+    start = child['startTime']
+    # no activity yet: counted from the start
+    supervisor.check(child, start + 14.)
+    assert not children.last.terminated
+    activity[0] = start + 10.
+    supervisor.check(child, start + 24.)
+    assert not children.last.terminated
+    supervisor.check(child, start + 26.)
+    assert children.procs[0].terminated
+    assert child['exitCodes'] == ['unresponsive']
+    assert child['nextRestart'] == start + 27.
+    assert supervisor.running
+
+def test_restart_on_request_is_not_a_failure(tmpdir, timing):
+    supervisor, child, children = makeSupervisor(tmpdir)
+    supervisor.restart('client')
+    # one pass of run(): handle the pending restart, then stop
+    supervisor.check = lambda child, now: supervisor.stop()
+    supervisor.run()
+    assert children.procs[0].terminated
+    assert len(children.procs) == 2
+    assert supervisor.report()['client'] == {'restarts': 0, 'reconfigs': 1, 'exit_codes': []}
+
+def test_restarts_real_child_and_drains_every_instance(tmpdir, monkeypatch):
+    monkeypatch.setattr(base, 'restartBackoff', 0.1)
+    drainer = OutputDrainer(flushInterval=0.05)
+    instances = []
+    def start():
+        instances.append(len(instances))
+        code = 3 if len(instances) == 1 else 0
+        return subprocess.Popen([sys.executable, '-c',
+                                 'import sys; sys.stdout.write("instance %d\\n"); sys.exit(%d)'%(instances[-1], code)],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    supervisor = Supervisor(drainer, str(tmpdir), checkInterval=0.05)
+    supervisor.add('client', start)
+    supervisor.start()
+    supervisor.run()
+    drainer.stop(timeout=5.)
+    assert supervisor.report()['client'] == {'restarts': 1, 'reconfigs': 0, 'exit_codes': [3, 0]}
+    assert tmpdir.join('client.out').read() == 'instance 0\n'
+    assert tmpdir.join('client-restart1.out').read() == 'instance 1\n'
+    assert tmpdir.join('client-restart1.err').check()
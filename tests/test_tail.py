@@ -0,0 +1,126 @@
+import os, time
+
+from ndnrtc_stream.commands.utils import tail
+from ndnrtc_stream.commands.utils.tail import Tail
+
+def waitFor(condition, timeout=5.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+def append(fileName, data):
+    with open(fileName, 'ab') as f:
+        f.write(data)
+
+def startTail(fileName, **kwargs):
+    lines = []
+    t = Tail(fileName, onNewLine=lines.append, **kwargs)
+    t.start()
+    # let the tail thread open the file before anything is written
+    time.sleep(0.2)
+    return t, lines
+
+def test_skips_existing_lines(tmpdir):
+    fileName = str(tmpdir.join('log.txt'))
+    append(fileName, b'old\n')
+    t, lines = startTail(fileName)
+    try:
+        append(fileName, b'new\npart')
+        assert waitFor(lambda: lines == [u'new\n'])
+        append(fileName, b'ial\n')
+        assert waitFor(lambda: lines == [u'new\n', u'partial\n'])
+    finally:
+        t.stop()
+
+def test_from_start(tmpdir):
+    fileName = str(tmpdir.join('log.txt'))
+    append(fileName, b'a\nb\n')
+    t, lines = startTail(fileName, fromStart=True)
+    try:
+        assert waitFor(lambda: lines == [u'a\n', u'b\n'])
+    finally:
+        t.stop()
+
+def test_file_created_later(tmpdir):
+    fileName = str(tmpdir.join('log.txt'))
+    t, lines = startTail(fileName)
+    try:
+        append(fileName, b'first\n')
+        assert waitFor(lambda: lines == [u'first\n'])
+    finally:
+        t.stop()
+
+def test_truncation(tmpdir):
+    fileName = str(tmpdir.join('log.txt'))
+    append(fileName, b'')
+    t, lines = startTail(fileName)
+    try:
+        append(fileName, b'one\ntwo\n')
+        assert waitFor(lambda: len(lines) == 2)
+        with open(fileName, 'wb') as f:
+            f.write(b'x\n')
+        assert waitFor(lambda: lines[2:] == [u'x\n'])
+    finally:
+        t.stop()
+
+def test_rotation(tmpdir):
+    fileName = str(tmpdir.join('log.txt'))
+    append(fileName, b'')
+    t, lines = startTail(fileName)
+    try:
+        append(fileName, b'before\n')
+        assert waitFor(lambda: lines == [u'before\n'])
+        os.rename(fileName, fileName + '.1')
+        append(fileName, b'after\n')
+        assert waitFor(lambda: lines == [u'before\n', u'after\n'])
+    finally:
+        t.stop()
+
+def test_polling_fallback(tmpdir, monkeypatch):
+    def noInotify(*args):
+        raise OSError('no inotify')
+    monkeypatch.setattr(tail, 'Inotify', noInotify)
+    fileName = str(tmpdir.join('log.txt'))
+    append(fileName, b'')
+    t, lines = startTail(fileName, pollInterval=0.01)
+    try:
+        append(fileName, b'polled\n')
+        assert waitFor(lambda: lines == [u'polled\n'])
+    finally:
+        t.stop()
+
+def test_batches_are_bounded(tmpdir, monkeypatch):
+    monkeypatch.setattr(tail, 'tailReadSize', 16)
+    monkeypatch.setattr(tail, 'tailMaxBatch', 32)
+    fileName = str(tmpdir.join('log.txt'))
+    data = b''.join([b'line %02d\n'%i for i in range(20)])
+    append(fileName, data)
+    batches = []
+    t = Tail(fileName, onNewData=lambda d, offset: batches.append((d, offset)), fromStart=True)
+    t.start()
+    try:
+        assert waitFor(lambda: sum(len(d) + 1 for d, o in batches) == len(data))
+    finally:
+        t.stop()
+    assert len(batches) > 1
+    for d, offset in batches:
+        assert len(d) <= 32 + 16
+        assert data[offset:offset+len(d)] == d
+    assert b'\n'.join(d for d, o in batches) + b'\n' == data
+
+def test_runaway_line_is_split(tmpdir, monkeypatch):
+    monkeypatch.setattr(tail, 'tailReadSize', 16)
+    monkeypatch.setattr(tail, 'tailMaxBatch', 32)
+    fileName = str(tmpdir.join('log.txt'))
+    append(fileName, b'x'*100 + b'\n')
+    batches = []
+    t = Tail(fileName, onNewLines=batches.append, fromStart=True)
+    t.start()
+    try:
+        assert waitFor(lambda: u''.join(l.rstrip(u'\n') for b in batches for l in b) == u'x'*100)
+    finally:
+        t.stop()
+    assert len(batches) > 1
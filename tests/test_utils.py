@@ -0,0 +1,13 @@
+import pytest
+
+from ndnrtc_stream.commands.utils.utils import parseThreadLadder
+
+def test_thread_ladder():
+    threads = parseThreadLadder('hi:1280x720@3000, lo:320x240@300')
+    assert threads == [{'name': 'hi', 'width': 1280, 'height': 720, 'bitrate': 3000},
+                       {'name': 'lo', 'width': 320, 'height': 240, 'bitrate': 300}]
+
+@pytest.mark.parametrize('ladder', ['1280x720@3000', 'hi:1280x720', 'hi:1280x720@3000,hi:320x240@300'])
+def test_bad_thread_ladder(ladder):
+    with pytest.raises(Exception):
+        parseThreadLadder(ladder)
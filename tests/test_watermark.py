@@ -0,0 +1,45 @@
+import pytest
+
+from ndnrtc_stream.commands.utils.capture import rawFrameSize
+from ndnrtc_stream.commands.utils.watermark import Watermark, watermarkBits
+
+@pytest.mark.parametrize('pixelFormat', ['0rgb', 'yuv420p', 'nv12'])
+def test_stamp_and_read(pixelFormat):
+    w, h = 320, 240
+    watermark = Watermark(w, h, pixelFormat=pixelFormat)
+    frame = bytearray(rawFrameSize(w, h, pixelFormat))
+    watermark.stamp(frame, 0, 1234, 1700000000123)
+    assert watermark.read(frame) == (1234, 1700000000123 & 0xffffffff)
+
+def test_stamp_at_offset():
+    w, h = 320, 240
+    watermark = Watermark(w, h)
+    size = rawFrameSize(w, h)
+    ring = bytearray(2 * size)
+    watermark.stamp(ring, size, 70000, 42)
+    # sequence numbers wrap at 16 bits
+    assert watermark.read(ring[size:]) == (70000 & 0xffff, 42)
+    assert watermark.read(ring[:size]) is None
+
+def test_encode_layout():
+    value = Watermark(320, 240).encode(1, 2)
+    assert value >> (watermarkBits - 4) == 0xa
+    assert (value >> 40) & 0xffff == 1
+    assert (value >> 8) & 0xffffffff == 2
+
+def test_corrupted_watermark_is_rejected():
+    w, h = 320, 240
+    watermark = Watermark(w, h)
+    frame = bytearray(rawFrameSize(w, h))
+    watermark.stamp(frame, 0, 5, 6)
+    # flip the last bit of the checksum
+    offset = watermark.offsets[-1]
+    pattern = watermark.black if frame[offset + watermark.center + 1] == 0xff else watermark.white
+    for r in range(watermark.block):
+        start = offset + r * watermark.rowBytes
+        frame[start:start+len(pattern)] = pattern
+    assert watermark.read(frame) is None
+
+def test_frame_too_small():
+    with pytest.raises(Exception):
+        Watermark(64, 16)